@@ -1,28 +1,176 @@
+import argparse
+from dataclasses import replace
+from itertools import chain
+import typing as T
+
 from config import Config, setup
 from red_hat import (
     ExtractorService,
-    GithubClient,
+    GitMirrorClient,
+    Journal,
     RepositoryListClient,
     RepositoryListParser,
+    client_factory,
+    collect_results,
     extractor_factory,
+    sink_factory,
 )
+from red_hat.metrics import count_results, serve_from_config, write_from_config
+from red_hat.sharding import merge_shards, select_shard, shard_settings
+from red_hat.database import ResultDatabase
+from red_hat.server import ScanServer
+from red_hat.sinks import previous_results, read_results
+from red_hat.store import ResultStore
+from red_hat.tracing import profiling
 
 
 def run(settings: Config):
-    gh_client = GithubClient(config=settings)
+    settings = shard_settings(settings)
+
+    with profiling(config=settings):
+        return extract(settings)
+
+
+def extract(settings: Config):
+    metrics_server = serve_from_config(config=settings)
+
+    try:
+        return extract_images(settings)
+    finally:
+        if metrics_server is not None:
+            metrics_server.shutdown()
+            metrics_server.server_close()
+
+
+def extract_images(settings: Config):
+    gh_client = client_factory(config=settings)
     rl_client = RepositoryListClient(config=settings)
     extractor_service: ExtractorService = extractor_factory(config=settings)
 
-    repos = rl_client.list_of_repositories(RepositoryListParser())
+    if settings.stream_repository_list:
+        repos = rl_client.iter_repositories(RepositoryListParser())
+    else:
+        repos = rl_client.list_of_repositories(RepositoryListParser())
+
+    if settings.shard_count > 1:
+        repos = select_shard(repos, settings.shard_index, settings.shard_count)
+
+    previous = None
+    if settings.previous_output_path:
+        previous = previous_results(settings.previous_output_path)
+
+    journal = Journal.from_config(config=settings)
+    if journal is None:
+        results = extractor_service.iter_images_from(repos, settings, gh_client, previous)
+    else:
+        results = extractor_service.resume_images_from(repos, settings, gh_client, journal, previous)
+
+    results = count_results(results)
+    sink = sink_factory(config=settings)
+
+    try:
+        if sink is None:
+            return collect_results(results)
+
+        with sink:
+            for result in results:
+                sink.write(result)
+    finally:
+        if journal is not None:
+            journal.close()
+
+        if isinstance(gh_client, GitMirrorClient):
+            gh_client.close()
+
+        write_from_config(config=settings)
 
-    data = extractor_service.extract_images_from(repos, settings, gh_client)
 
-    # TODO: send somewhere?
-    return data
+def serve(settings: Config):
+    metrics_server = serve_from_config(config=settings)
+
+    try:
+        with ScanServer(settings) as server:
+            print(f"Taking scans at {server.url}/scan", flush=True)
+            server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        write_from_config(config=settings)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Extracts the base images of the Dockerfiles of a list of repositories"
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="PATH",
+        help="Write a Chrome trace of the run's spans to PATH (overrides profile_path)"
+    )
+    commands = parser.add_subparsers(dest="command")
+
+    merge = commands.add_parser("merge", help="Merge the jsonl outputs of a sharded run into a single dict")
+    merge.add_argument("paths", nargs="+", help="jsonl output of each shard")
+
+    usage = commands.add_parser("usage", help="List the Dockerfiles using some images in jsonl or sqlite outputs")
+    usage.add_argument("paths", nargs="+", help="jsonl or sqlite outputs, such as those of every shard")
+    usage.add_argument(
+        "--image",
+        dest="images",
+        action="append",
+        help="Image to look for, such as python:3.9-slim. Repeatable. "
+             "Counts the Dockerfiles using each image if unset"
+    )
+
+    trend = commands.add_parser("trend", help="Count the repositories using an image in every scan of a sqlite output")
+    trend.add_argument("path", help="sqlite output")
+    trend.add_argument(
+        "--image",
+        required=True,
+        help="Image to look for, such as python (any tag) or python:3.9-slim"
+    )
+
+    commands.add_parser(
+        "serve",
+        help="Keep the clients, caches and workers warm between scans, taken over HTTP at server_host:server_port"
+    )
+
+    return parser.parse_args()
+
+
+def image_trend(path: str, image: str) -> T.List[T.Dict]:
+    database = ResultDatabase(path)
+    try:
+        return database.trend(image)
+    finally:
+        database.close()
+
+
+def image_usage(paths: T.List[str], images: T.Optional[T.List[str]]) -> T.Dict:
+    store = ResultStore.from_results(chain.from_iterable(read_results(path) for path in paths))
+
+    if not images:
+        return store.images()
+
+    return {image: [usage._asdict() for usage in store.repositories_using(image)] for image in images}
 
 
 if __name__ == '__main__':
-    settings = setup()
-    d = run(settings)
+    args = parse_args()
+
+    if args.command == "merge":
+        d = merge_shards(args.paths)
+    elif args.command == "usage":
+        d = image_usage(args.paths, args.images)
+    elif args.command == "trend":
+        d = image_trend(args.path, args.image)
+    elif args.command == "serve":
+        d = serve(setup())
+    else:
+        settings = setup()
+        if args.profile:
+            settings = replace(settings, profile_path=args.profile)
+        d = run(settings)
 
-    print(d)
+    if d is not None:
+        print(d)
@@ -0,0 +1,207 @@
+"""End-to-end benchmark of the extractor services against a local github stand-in
+
+Run with `python -m benchmarks.extractor_benchmark [--sizes 10,100,...] [--services ...]`.
+
+Every extractor service is run on every list size, each run in its own process so that
+its peak RSS is its own. Each run is printed as a line of JSON with its throughput, the
+p50/p99 time each repository took (from being read off the list to its result being
+yielded), the requests the stand-in served and the peak RSS. Given the output of an
+earlier run with `--baseline`, runs whose throughput dropped by more than `--tolerance`
+are flagged as regressions and make the benchmark exit with an error.
+"""
+import argparse
+import json
+import logging
+import resource
+import subprocess
+import sys
+import time
+import typing as T
+
+from benchmarks.github_stand_in import GithubStandIn, Profile
+from config import Config
+from red_hat import ExtractorService, GithubClient, RepositoryListClient, RepositoryListParser, extractor_factory
+
+
+DEFAULT_SIZES = "10,100,1000,10000,100000"
+
+
+def extractor_classes() -> T.List[str]:
+    """Names of every service `extractor_factory` can build"""
+    names = []
+    for service in ExtractorService.__subclasses__():
+        try:
+            extractor_factory(Config(repository_list_url=None, extractor_class=service.__name__))
+        except AssertionError:
+            continue
+        names.append(service.__name__)
+
+    return names
+
+
+def percentile(values: T.List[float], q: float) -> T.Optional[float]:
+    if not values:
+        return None
+
+    values = sorted(values)
+    return values[min(int(len(values) * q / 100), len(values) - 1)]
+
+
+def peak_rss() -> int:
+    """Peak resident set size of this process, in bytes"""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def run_once(config: Config) -> T.Dict:
+    """Extracts the images of the list in `config`, timing each repository"""
+    client = GithubClient(config=config)
+    service = extractor_factory(config=config)
+    started = {}
+    latencies = []
+    errors = 0
+
+    start = time.perf_counter()
+    repos = RepositoryListClient(config=config).list_of_repositories(RepositoryListParser())
+
+    def timed(repos):
+        for repo, sha in repos:
+            started[f"{repo}:{sha}"] = time.perf_counter()
+            yield repo, sha
+
+    for result in service.iter_images_from(timed(repos), config, client):
+        latencies.append(time.perf_counter() - started.pop(result.key))
+        errors += bool(result.errors)
+
+    seconds = time.perf_counter() - start
+
+    return {
+        "repos": len(latencies),
+        "failed_repos": errors,
+        "seconds": seconds,
+        "repos_per_second": len(latencies) / seconds if seconds else None,
+        "p50": percentile(latencies, 50),
+        "p99": percentile(latencies, 99),
+        "peak_rss": peak_rss(),
+    }
+
+
+def run_in_process(service: str, size: int, stand_in: GithubStandIn, args: argparse.Namespace) -> T.Dict:
+    command = [
+        sys.executable, "-m", "benchmarks.extractor_benchmark", "run",
+        "--service", service,
+        "--size", str(size),
+        "--api-url", stand_in.api_url,
+        "--raw-url", stand_in.raw_url,
+        "--thread-pool-size", str(args.thread_pool_size),
+        "--async-concurrency", str(args.async_concurrency),
+    ]
+
+    stand_in.reset()
+    try:
+        process = subprocess.run(command, capture_output=True, text=True, timeout=args.timeout)
+    except subprocess.TimeoutExpired:
+        return {"error": f"timed out after {args.timeout}s", "requests": dict(stand_in.requests)}
+
+    if process.returncode != 0:
+        return {"error": process.stderr.strip().splitlines()[-1] if process.stderr.strip() else "failed"}
+
+    return {**json.loads(process.stdout), "requests": dict(stand_in.requests)}
+
+
+def compare(result: T.Dict, baseline: T.Dict[T.Tuple, T.Dict], tolerance: float) -> T.Dict:
+    previous = baseline.get((result["service"], result["size"]))
+    if not previous or not previous.get("repos_per_second") or not result.get("repos_per_second"):
+        return result
+
+    ratio = result["repos_per_second"] / previous["repos_per_second"]
+    return {**result, "baseline_ratio": ratio, "regression": ratio < 1 - tolerance}
+
+
+def load_baseline(path: str) -> T.Dict[T.Tuple, T.Dict]:
+    with open(path) as f:
+        results = [json.loads(line) for line in f if line.strip()]
+
+    return {(result["service"], result["size"]): result for result in results}
+
+
+def benchmark(args: argparse.Namespace) -> int:
+    profile = Profile(
+        latency=args.latency,
+        error_rate=args.error_rate,
+        tree_size=args.tree_size,
+        dockerfiles=args.dockerfiles,
+        rate_limit=args.rate_limit,
+        rate_limit_window=args.rate_limit_window,
+        seed=args.seed,
+    )
+    services = args.services.split(",") if args.services else extractor_classes()
+    sizes = [int(size) for size in args.sizes.split(",")]
+    baseline = load_baseline(args.baseline) if args.baseline else {}
+    regressions = 0
+
+    with GithubStandIn(profile) as stand_in:
+        for size in sizes:
+            for service in services:
+                result = {"service": service, "size": size, "profile": vars(profile)}
+                result = compare({**result, **run_in_process(service, size, stand_in, args)}, baseline, args.tolerance)
+                regressions += bool(result.get("regression"))
+
+                print(json.dumps(result), flush=True)
+
+    return 1 if regressions else 0
+
+
+def run(args: argparse.Namespace):
+    logging.disable(logging.CRITICAL)
+
+    config = Config(
+        repository_list_url=f"{args.api_url}/list?size={args.size}",
+        extractor_class=args.service,
+        github_api_url=args.api_url,
+        github_raw_url=args.raw_url,
+        thread_pool_size=args.thread_pool_size,
+        async_concurrency=args.async_concurrency,
+    )
+
+    print(json.dumps(run_once(config)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command")
+
+    parser.add_argument("--services", help="Comma separated extractor services. Defaults to every one")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="Comma separated list sizes")
+    parser.add_argument("--latency", default="uniform:0.001,0.005", help="Latency distribution of every response")
+    parser.add_argument("--error-rate", type=float, default=0.01)
+    parser.add_argument("--tree-size", type=int, default=50, help="Files in each repository")
+    parser.add_argument("--dockerfiles", type=int, default=3, help="Dockerfiles in each repository")
+    parser.add_argument("--rate-limit", type=int, default=0, help="API requests allowed per window, 0 for unlimited")
+    parser.add_argument("--rate-limit-window", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--thread-pool-size", type=int, default=16)
+    parser.add_argument("--async-concurrency", type=int, default=100)
+    parser.add_argument("--timeout", type=float, default=3600, help="Seconds after which a run is abandoned")
+    parser.add_argument("--baseline", help="Output of an earlier benchmark to compare the throughput with")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Throughput drop flagged as a regression")
+
+    once = commands.add_parser("run", help="Run a single service on a single list size and print its results")
+    once.add_argument("--service", required=True)
+    once.add_argument("--size", type=int, required=True)
+    once.add_argument("--api-url", required=True)
+    once.add_argument("--raw-url", required=True)
+    once.add_argument("--thread-pool-size", type=int, default=16)
+    once.add_argument("--async-concurrency", type=int, default=100)
+
+    args = parser.parse_args()
+
+    if args.command == "run":
+        run(args)
+    else:
+        sys.exit(benchmark(args))
+
+
+if __name__ == "__main__":
+    main()
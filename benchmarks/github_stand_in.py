@@ -0,0 +1,237 @@
+"""Local HTTP server standing in for github, serving synthetic repositories
+
+Every repository is generated from its name: its Git Tree lists `tree_size` files, of
+which `dockerfiles` are Dockerfiles, and its raw content endpoint serves a small
+multi-stage Dockerfile for each of them. Responses are delayed according to a latency
+distribution, fail with a `500` at `error_rate`, and the API endpoints can enforce a
+fixed window rate limit announced through github's `X-RateLimit-*` headers.
+
+The API and raw content are served on separate ports, as github serves them from
+different hosts (which the rate limit scheduler paces independently).
+"""
+from collections import Counter
+from dataclasses import dataclass
+import hashlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import random
+import threading
+import time
+import typing as T
+from urllib.parse import parse_qs, urlsplit
+
+
+REPOSITORY_URL_TEMPLATE = "https://github.com/bench/repo-{index}"
+
+
+def latency_distribution(spec: str) -> T.Callable[[random.Random], float]:
+    """Parses a latency distribution, in seconds, such as `constant:0.01`, `uniform:0.001,0.02`
+    or `lognormal:-5,0.8` (the mean and standard deviation of the underlying normal)
+    """
+    name, _, params = spec.partition(":")
+    values = [float(value) for value in params.split(",") if value]
+
+    distributions = {
+        "constant": lambda rng: values[0] if values else 0.0,
+        "uniform": lambda rng: rng.uniform(values[0], values[1]),
+        "lognormal": lambda rng: rng.lognormvariate(values[0], values[1]),
+    }
+
+    assert name in distributions, f"Latency distribution {name} not found in module {__file__}"
+
+    return distributions[name]
+
+
+@dataclass
+class Profile:
+    """Behaviour of the stand-in"""
+    latency: str = "constant:0"
+    error_rate: float = 0.0
+    tree_size: int = 50
+    dockerfiles: int = 3
+    rate_limit: int = 0
+    rate_limit_window: float = 60.0
+    seed: int = 0
+
+
+def repository_list(size: int) -> str:
+    return "".join(
+        f"{REPOSITORY_URL_TEMPLATE.format(index=index)} {hashlib.sha1(str(index).encode()).hexdigest()}\n"
+        for index in range(size)
+    )
+
+
+def synthetic_tree(repo: str, tree_size: int, dockerfiles: int) -> T.Dict:
+    def blob(path):
+        return {"path": path, "type": "blob", "sha": hashlib.sha1(f"{repo}/{path}".encode()).hexdigest()}
+
+    paths = [f"service-{index}/Dockerfile" for index in range(min(dockerfiles, tree_size))]
+    paths += [f"src/module_{index}.py" for index in range(tree_size - len(paths))]
+
+    return {"sha": repo, "tree": [blob(path) for path in paths], "truncated": False}
+
+
+def synthetic_dockerfile(path: str) -> str:
+    return (
+        "ARG VERSION=3.9\n"
+        f"FROM python:${{VERSION}}-slim AS build\n"
+        f"COPY {path.rsplit('/', 1)[0]} /app\n"
+        "RUN pip install --prefix /install -r /app/requirements.txt && \\\n"
+        "    rm -rf /root/.cache\n"
+        "FROM gcr.io/distroless/python3\n"
+        "COPY --from=build /install /usr/local\n"
+    )
+
+
+class GithubStandIn:
+    """Serves the repository list, the Git Tree API and raw content for synthetic repositories
+
+    The repository list is served at `{api_url}/list?size=N`. Requests are counted by
+    kind in `requests` (`list`, `tree`, `raw`, along with the `error` and
+    `rate_limited` answers), which `reset` clears between runs.
+    """
+    def __init__(self, profile: Profile = None):
+        self.profile = profile or Profile()
+        self.requests = Counter()
+
+        self._latency = latency_distribution(self.profile.latency)
+        self._random = random.Random(self.profile.seed)
+        self._lock = threading.Lock()
+        self._window_start = time.time()
+        self._window_requests = 0
+
+        self._api = self._server(self._handle_api)
+        self._raw = self._server(self._handle_raw)
+        self._threads = [
+            threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+            for server in (self._api, self._raw)
+        ]
+
+    @staticmethod
+    def _server(handle: T.Callable) -> ThreadingHTTPServer:
+        class RequestHandler(BaseHTTPRequestHandler):
+            # Keep connections alive, as github does, without holding back the body
+            # behind the headers until they're acknowledged
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                status, headers, body = handle(self.path)
+
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), RequestHandler)
+        server.daemon_threads = True
+        server.request_queue_size = 1024
+        return server
+
+    @staticmethod
+    def _url(server: ThreadingHTTPServer) -> str:
+        host, port = server.server_address
+        return f"http://{host}:{port}"
+
+    @property
+    def api_url(self) -> str:
+        return self._url(self._api)
+
+    @property
+    def raw_url(self) -> str:
+        return self._url(self._raw)
+
+    def reset(self):
+        with self._lock:
+            self.requests.clear()
+            self._window_start = time.time()
+            self._window_requests = 0
+
+    def _delay(self) -> bool:
+        """Sleeps for a sampled latency and tells whether the request should fail"""
+        with self._lock:
+            latency = self._latency(self._random)
+            failed = self._random.random() < self.profile.error_rate
+
+        if latency > 0:
+            time.sleep(latency)
+
+        return failed
+
+    def _rate_limit(self) -> T.Tuple[bool, T.Dict[str, str]]:
+        profile = self.profile
+        if not profile.rate_limit:
+            return False, {}
+
+        with self._lock:
+            now = time.time()
+            if now - self._window_start >= profile.rate_limit_window:
+                self._window_start = now
+                self._window_requests = 0
+
+            self._window_requests += 1
+            remaining = max(profile.rate_limit - self._window_requests, 0)
+            exhausted = self._window_requests > profile.rate_limit
+            reset = self._window_start + profile.rate_limit_window
+
+        return exhausted, {
+            "X-RateLimit-Limit": str(profile.rate_limit),
+            "X-RateLimit-Remaining": str(remaining),
+            "X-RateLimit-Reset": str(int(reset) + 1),
+        }
+
+    def _count(self, kind: str):
+        with self._lock:
+            self.requests[kind] += 1
+
+    def _handle_api(self, path: str) -> T.Tuple[int, T.Dict[str, str], bytes]:
+        url = urlsplit(path)
+
+        if url.path == "/list":
+            self._count("list")
+            size = int(parse_qs(url.query).get("size", ["10"])[0])
+            return 200, {}, repository_list(size).encode()
+
+        parts = url.path.strip("/").split("/")
+        if len(parts) != 6 or parts[0] != "repos" or parts[3:5] != ["git", "trees"]:
+            return 404, {}, b"Not Found"
+
+        self._count("tree")
+        exhausted, headers = self._rate_limit()
+        if exhausted:
+            self._count("rate_limited")
+            return 403, headers, b'{"message": "API rate limit exceeded"}'
+
+        if self._delay():
+            self._count("error")
+            return 500, headers, b'{"message": "Server Error"}'
+
+        tree = synthetic_tree(f"{parts[1]}/{parts[2]}", self.profile.tree_size, self.profile.dockerfiles)
+        return 200, {**headers, "Content-Type": "application/json"}, json.dumps(tree).encode()
+
+    def _handle_raw(self, path: str) -> T.Tuple[int, T.Dict[str, str], bytes]:
+        parts = urlsplit(path).path.strip("/").split("/", 3)
+        if len(parts) != 4:
+            return 404, {}, b"Not Found"
+
+        self._count("raw")
+        if self._delay():
+            self._count("error")
+            return 500, {}, b"Server Error"
+
+        return 200, {"Content-Type": "text/plain"}, synthetic_dockerfile(parts[3]).encode()
+
+    def __enter__(self):
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        for server in (self._api, self._raw):
+            server.shutdown()
+            server.server_close()
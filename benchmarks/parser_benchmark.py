@@ -0,0 +1,88 @@
+"""Micro-benchmark of DockerfileParser against the original line-filtering parser
+
+Run with `python -m benchmarks.parser_benchmark [--lines N] [--repeat N] [--json]`.
+"""
+import argparse
+import json
+import timeit
+import typing as T
+
+from red_hat.parsers import DockerfileParser
+
+
+class LegacyDockerfileParser:
+    """The original parser, which took every line starting with FROM"""
+    def parse(self, content: str) -> T.List[T.Tuple]:
+        return list(
+            map(
+                lambda x: tuple(x.split()[1:]),
+                filter(
+                    lambda x: x.upper().startswith("FROM"),
+                    content.splitlines()
+                )
+            )
+        )
+
+
+def synthetic_dockerfile(lines: int) -> str:
+    """Multi-stage Dockerfile of about `lines` lines, mostly long RUN instructions with continuations"""
+    out = ["# syntax=docker/dockerfile:1", "ARG REGISTRY=quay.io", "ARG VERSION=3.9"]
+    stage = 0
+
+    while len(out) < lines:
+        if stage == 0:
+            out.append(f"FROM --platform=$BUILDPLATFORM ${{REGISTRY}}/python:${{VERSION}} AS stage{stage}")
+        else:
+            out.append(f"FROM stage{stage - 1} AS stage{stage}")
+        out.append("# install the build dependencies")
+        out.append("RUN apt-get update && \\")
+        out.extend(f"    apt-get install -y package-{stage}-{i} && \\" for i in range(40))
+        out.append("    rm -rf /var/lib/apt/lists/*")
+        out.append(f"COPY src/{stage} /app/{stage}")
+        stage += 1
+
+    out.append("FROM gcr.io/distroless/python3")
+    out.append("COPY --from=stage0 /app /app")
+    return "\n".join(out)
+
+
+def run(lines: int, repeat: int) -> T.List[T.Dict]:
+    content = synthetic_dockerfile(lines)
+    results = []
+
+    for name, parser in (("legacy", LegacyDockerfileParser()), ("single_pass", DockerfileParser())):
+        seconds = min(timeit.repeat(lambda: parser.parse(content), number=1, repeat=repeat))
+        results.append({
+            "parser": name,
+            "lines": len(content.splitlines()),
+            "bytes": len(content),
+            "seconds": seconds,
+            "lines_per_second": len(content.splitlines()) / seconds,
+            "images": len(parser.parse(content)),
+        })
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lines", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    args = parser.parse_args()
+
+    results = run(args.lines, args.repeat)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    for result in results:
+        print(
+            f"{result['parser']:>12}: {result['seconds'] * 1000:8.2f} ms "
+            f"({result['lines_per_second']:,.0f} lines/s, {result['images']} images)"
+        )
+
+
+if __name__ == "__main__":
+    main()
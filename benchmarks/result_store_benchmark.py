@@ -0,0 +1,116 @@
+"""Memory benchmark of ResultStore against the `{"data", "errors"}` dict of collect_results
+
+Run with `python -m benchmarks.result_store_benchmark [--repos N] [--images N] [--json]`.
+
+Synthetic results are decoded from JSON one at a time, as they're read back from a
+`jsonl` output, so that their strings aren't shared up front. Each layout is measured
+with tracemalloc while holding every result, along with the time it takes to find the
+Dockerfiles using the most and least common images.
+"""
+import argparse
+import gc
+import itertools
+import json
+import random
+import time
+import tracemalloc
+import typing as T
+
+from red_hat.results import ExtractionResult, collect_results
+from red_hat.store import ResultStore
+
+
+PATHS = ("Dockerfile", "build/Dockerfile", "Dockerfile.test", "deploy/docker/Dockerfile", "tools/Dockerfile.dev")
+
+
+def image_name(rank: int) -> str:
+    return f"quay.io/org-{rank % 50}/image-{rank}:{rank % 7}.{rank % 3}"
+
+
+def synthetic_lines(repos: int, images: int, seed: int = 0) -> T.List[str]:
+    """`jsonl` results of `repos` repositories with 1 to 5 Dockerfiles, whose images follow a long tail"""
+    rng = random.Random(seed)
+    names = [image_name(rank) for rank in range(images)]
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(images)))
+
+    lines = []
+    for index in range(repos):
+        data = {
+            path: rng.choices(names, cum_weights=cum_weights, k=rng.randint(1, 3))
+            for path in rng.sample(PATHS, rng.randint(1, len(PATHS)))
+        }
+        result = ExtractionResult(f"https://github.com/org-{index % 500}/repo-{index}", f"{index:040x}", data, {})
+        lines.append(json.dumps(result.to_dict()))
+
+    return lines
+
+
+def decode(lines: T.List[str]) -> T.Iterator[ExtractionResult]:
+    return (ExtractionResult.from_dict(json.loads(line)) for line in lines)
+
+
+def scan_dict(document: T.Dict, image: str) -> T.List[T.Tuple[str, str]]:
+    return [(key, path) for key, files in document["data"].items() for path, images in files.items() if image in images]
+
+
+def timed(query: T.Callable[[], T.List]) -> T.Tuple[float, int]:
+    start = time.perf_counter()
+    found = query()
+    return time.perf_counter() - start, len(found)
+
+
+def measure(name: str, build: T.Callable[[], T.Any], query: T.Callable[[T.Any, str], T.List], images: int) -> T.Dict:
+    """Memory held by what `build` returns, and the time `query` takes on the most and least used images"""
+    gc.collect()
+    tracemalloc.start()
+    built = build()
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    common_seconds, common_found = timed(lambda: query(built, image_name(0)))
+    rare_seconds, rare_found = timed(lambda: query(built, image_name(images - 1)))
+
+    return {
+        "layout": name,
+        "bytes": size,
+        "common_image_seconds": common_seconds,
+        "common_image_dockerfiles": common_found,
+        "rare_image_seconds": rare_seconds,
+        "rare_image_dockerfiles": rare_found,
+    }
+
+
+def run(repos: int, images: int) -> T.List[T.Dict]:
+    lines = synthetic_lines(repos, images)
+
+    return [
+        measure("dict", lambda: collect_results(decode(lines)), scan_dict, images),
+        measure("store", lambda: ResultStore.from_results(decode(lines)), ResultStore.repositories_using, images),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repos", type=int, default=100_000)
+    parser.add_argument("--images", type=int, default=2_000, help="Distinct images across the results")
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    args = parser.parse_args()
+
+    results = run(args.repos, args.images)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    for result in results:
+        print(
+            f"{result['layout']:>6}: {result['bytes'] / 2 ** 20:8.1f} MiB, finds the "
+            f"{result['common_image_dockerfiles']} Dockerfiles using the most common image in "
+            f"{result['common_image_seconds'] * 1000:.2f} ms and the {result['rare_image_dockerfiles']} using "
+            f"the least common one in {result['rare_image_seconds'] * 1000:.3f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""Benchmark of streaming a recursive tree response against decoding it whole
+
+Run with `python -m benchmarks.tree_stream_benchmark [--entries N] [--dockerfiles N] [--bandwidth MB/s] [--json]`.
+
+A synthetic Git Tree API response, shaped like github's, is read in chunks as
+`GithubClient` reads it, either joined and decoded with `json.loads` before filtering its
+Dockerfiles (as `r.json()` did), or decoded incrementally by `ObjectStream`. Each is
+timed until the first Dockerfile is found and until the whole tree is read, then run
+again under tracemalloc for its peak memory. With `--bandwidth`, chunks arrive no faster
+than over a link of that many megabytes per second.
+"""
+import argparse
+import gc
+import json
+import time
+import tracemalloc
+import typing as T
+
+from red_hat.client import BLOB_TYPE, TREE_CHUNK_SIZE, TreeEntry
+from red_hat.json_stream import ObjectStream
+from red_hat.services import is_dockerfile
+
+
+def synthetic_tree(entries: int, dockerfiles: int) -> bytes:
+    """Recursive tree of `entries` nodes, with `dockerfiles` Dockerfiles spread evenly among them"""
+    api = "https://api.github.com/repos/org/monorepo/git"
+    every = max(entries // max(dockerfiles, 1), 1)
+    nodes = []
+
+    for index in range(entries):
+        directory = f"services/service-{index // 100}/src/module-{index // 10 % 10}"
+        sha = f"{index:040x}"
+
+        dockerfile = dockerfiles and index % every == every // 2
+        if index % 10 == 0 and not dockerfile:
+            nodes.append({"path": directory, "mode": "040000", "type": "tree", "sha": sha, "url": f"{api}/trees/{sha}"})
+            continue
+
+        name = "Dockerfile" if dockerfile else f"file_{index}.py"
+        nodes.append({
+            "path": f"{directory}/{name}",
+            "mode": "100644",
+            "type": "blob",
+            "sha": sha,
+            "size": index % 5000,
+            "url": f"{api}/blobs/{sha}",
+        })
+
+    sha = "f" * 40
+    return json.dumps({"sha": sha, "url": f"{api}/trees/{sha}", "tree": nodes, "truncated": False}).encode()
+
+
+def chunked(body: bytes, bandwidth: float = None) -> T.Iterator[bytes]:
+    for start in range(0, len(body), TREE_CHUNK_SIZE):
+        if bandwidth:
+            time.sleep(TREE_CHUNK_SIZE / (bandwidth * 1e6))
+        yield body[start:start + TREE_CHUNK_SIZE]
+
+
+def decode_whole(chunks: T.Iterable[bytes]) -> T.Iterator[TreeEntry]:
+    data = json.loads(b"".join(chunks))
+    return (
+        TreeEntry(node["path"], node.get("sha"))
+        for node in data["tree"]
+        if node["type"] == BLOB_TYPE and is_dockerfile(node["path"])
+    )
+
+
+def decode_streamed(chunks: T.Iterable[bytes]) -> T.Iterator[TreeEntry]:
+    return (
+        TreeEntry(node["path"], node.get("sha"))
+        for node in ObjectStream(chunks, "tree").items()
+        if node["type"] == BLOB_TYPE and is_dockerfile(node["path"])
+    )
+
+
+def timed(decode: T.Callable[[T.Iterable[bytes]], T.Iterator], body: bytes, bandwidth: float) -> T.Tuple:
+    """Seconds until the first Dockerfile is found and until the whole tree is read, and the Dockerfiles found"""
+    start = time.perf_counter()
+    first = None
+    found = []
+
+    for entry in decode(chunked(body, bandwidth)):
+        if first is None:
+            first = time.perf_counter() - start
+        found.append(entry)
+
+    return first, time.perf_counter() - start, found
+
+
+def measure(name: str, decode: T.Callable[[T.Iterable[bytes]], T.Iterator], body: bytes, bandwidth: float) -> T.Dict:
+    # tracemalloc slows allocations down, so the peak is taken on a second, untimed run
+    first, seconds, found = timed(decode, body, bandwidth)
+
+    gc.collect()
+    tracemalloc.start()
+    timed(decode, body, None)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "decoder": name,
+        "peak_bytes": peak,
+        "first_dockerfile_seconds": first,
+        "seconds": seconds,
+        "dockerfiles": len(found),
+    }
+
+
+def run(entries: int, dockerfiles: int, bandwidth: float = None) -> T.List[T.Dict]:
+    body = synthetic_tree(entries, dockerfiles)
+
+    return [
+        dict(measure("json", decode_whole, body, bandwidth), body_bytes=len(body)),
+        dict(measure("stream", decode_streamed, body, bandwidth), body_bytes=len(body)),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=100_000)
+    parser.add_argument("--dockerfiles", type=int, default=50)
+    parser.add_argument("--bandwidth", type=float, help="Megabytes per second the response is read at")
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    args = parser.parse_args()
+
+    results = run(args.entries, args.dockerfiles, args.bandwidth)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    for result in results:
+        print(
+            f"{result['decoder']:>6}: {result['peak_bytes'] / 2 ** 20:6.1f} MiB peak for a "
+            f"{result['body_bytes'] / 2 ** 20:.1f} MiB tree, first of {result['dockerfiles']} Dockerfiles after "
+            f"{result['first_dockerfile_seconds'] * 1000:.1f} ms, whole tree in {result['seconds'] * 1000:.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
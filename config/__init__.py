@@ -1,4 +1,4 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field, fields
 import typing as T
 import os
 
@@ -12,6 +12,8 @@ __all__ = [
 
 
 CONFIG_PATH_ENVVAR = 'DOCKERFILE_EXTRACTOR_CONFIG_PATH'
+TRUE_VALUES = ('1', 'true', 'yes', 'on')
+FALSE_VALUES = ('0', 'false', 'no', 'off')
 
 
 @dataclass
@@ -21,14 +23,89 @@ class Config:
     github_access_id: str = None
     github_access_secret: str = None
     thread_pool_size: int = 1
+    adaptive_concurrency: bool = False
+    adaptive_concurrency_max: int = 64
+    stream_repository_list: bool = False
+    github_client_class: str = "GithubClient"
+    git_mirror_path: str = None
+    git_mirror_fallback: bool = True
+    git_mirror_processes: int = 16
+    github_api_url: str = "https://api.github.com"
+    github_raw_url: str = "https://raw.githubusercontent.com"
+    rate_limit_burst: int = 50
+    rate_limit_retries: int = 5
+    graphql_batch_size: int = 50
+    tree_walk: str = "truncated"
+    tree_walk_exclude: T.List[str] = field(default_factory=list)
+    tree_walk_concurrency: int = 8
+    single_flight: bool = True
+    single_flight_memo_ttl: float = 5.0
+    hedge_raw_requests: bool = False
+    hedge_percentile: float = 95
+    hedge_max_ratio: float = 0.05
+    async_concurrency: int = 100
+    output_format: str = "dict"
+    output_path: str = "-"
+    output_gzip: bool = False
+    output_flush_interval: float = 1.0
+    output_batch_size: int = 500
+    journal_path: str = None
+    journal_fsync_interval: float = 5.0
+    previous_output_path: str = None
+    metrics_path: str = None
+    metrics_port: int = None
+    server_host: str = "127.0.0.1"
+    server_port: int = 8080
+    server_list_urls: T.List[str] = field(default_factory=list)
+    profile_path: str = None
+    profile_sampling_interval: float = 0.0
+    shard_index: int = None
+    shard_count: int = 1
+    shard_credentials: T.List[str] = field(default_factory=list)
+    tree_cache_path: str = None
+    tree_cache_max_entries: int = 10000
+    blob_cache_path: str = None
+    blob_cache_max_entries: int = 10000
+    http_cache_path: str = None
+    http_cache_max_entries: int = 10000
+    http_cache_max_bytes: int = 512 * 1024 * 1024
+
+
+def _from_env(value: str, type_: T.Any, default: T.Any) -> T.Any:
+    """Parses an environment variable as the type of the setting it overrides
+
+    An empty value unsets settings that aren't strings and default to None.
+    """
+    if value == '' and default is None and type_ is not str:
+        return None
+
+    if type_ is bool:
+        if value.lower() in TRUE_VALUES:
+            return True
+        if value.lower() in FALSE_VALUES:
+            return False
+        raise ValueError(f"Expecting a boolean, got {value!r}")
+
+    if type_ in (int, float):
+        return type_(value)
+
+    if T.get_origin(type_) is list:
+        return [item.strip() for item in value.split(',') if item.strip()]
+
+    return value
 
 
 def setup(config_path: str = None) -> Config:
-    config_path = os.environ.get(CONFIG_PATH_ENVVAR, 'config/config.yml')
+    config_path = os.environ.get(CONFIG_PATH_ENVVAR, config_path or 'config/config.yml')
 
     with open(config_path) as f:
         yaml_config = load(f, Loader=Loader)
 
-    env_config = {env.lower(): os.environ[env] for env in os.environ if env.lower() in Config.__annotations__}
+    settings = {setting.name: setting for setting in fields(Config)}
+    env_config = {
+        env.lower(): _from_env(value, settings[env.lower()].type, settings[env.lower()].default)
+        for env, value in os.environ.items()
+        if env.lower() in settings
+    }
 
     return Config(**{**yaml_config, **env_config})
@@ -1,15 +1,30 @@
-from red_hat.client import GithubClient, RepositoryListClient
+from red_hat.client import AsyncGithubClient, AsyncRepositoryListClient, GithubClient, RepositoryListClient
+from red_hat.journal import Journal
+from red_hat.mirror import GitMirrorClient, client_factory
 from red_hat.parsers import DockerfileParser, RepositoryListParser
+from red_hat.results import ExtractionResult, collect_results
 from red_hat.services import ExtractorService, extractor_factory
+from red_hat.sinks import Sink, sink_factory
+from red_hat.store import ResultStore
 
 
 __all__ = [
+    'AsyncGithubClient',
+    'AsyncRepositoryListClient',
     'DockerfileParser',
+    'ExtractionResult',
     'ExtractorService',
+    'GitMirrorClient',
     'GithubClient',
+    'Journal',
     'RepositoryListClient',
     'RepositoryListParser',
+    'ResultStore',
+    'Sink',
+    'client_factory',
+    'collect_results',
     'extractor_factory',
+    'sink_factory',
     '__version__',
 ]
 
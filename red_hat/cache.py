@@ -0,0 +1,346 @@
+from collections import OrderedDict
+import json
+import os
+import sqlite3
+import threading
+import time
+import typing as T
+
+from config import Config
+from red_hat.metrics import CACHE_LOOKUPS
+
+
+# Status codes for which github's answer about a commit tree won't ever change
+CACHEABLE_ERROR_STATUSES = (404, 422)
+
+
+class CachedError(Exception):
+    """Raised when replaying a failed lookup recorded in the cache"""
+    def __init__(self, message: str, status: int):
+        super().__init__(message)
+        self.status = status
+
+
+def listing_of(config: Config) -> str:
+    """The settings a tree's listing depends on, as a key for `TreeCache`"""
+    exclude = config.tree_walk_exclude or []
+    if isinstance(exclude, str):
+        exclude = exclude.split(",")
+
+    return json.dumps([config.tree_walk, sorted({pattern.strip().rstrip("/") for pattern in exclude} - {""})])
+
+
+class LRUDatabase:
+    """SQLite table that keeps at most `max_entries` rows, evicting the least recently used
+
+    Subclasses set `TABLE`, `SCHEMA` and the `KEY` columns of its primary key, and store
+    rows with `_put`. Rows must have a `last_used` column.
+    """
+    TABLE: str = None
+    SCHEMA: str = None
+    KEY: T.Tuple[str, ...] = None
+
+    def __init__(self, path: str, max_entries: int = 10000):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._last_used = 0.0
+        self._max_entries = int(max_entries)
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(f"CREATE TABLE IF NOT EXISTS {self.TABLE} ({self.SCHEMA})")
+        self._connection.execute(
+            f"CREATE INDEX IF NOT EXISTS {self.TABLE}_last_used ON {self.TABLE} (last_used)"
+        )
+        (self._count,) = self._connection.execute(f"SELECT COUNT(*) FROM {self.TABLE}").fetchone()
+
+    def _tick(self) -> float:
+        # Strictly increasing, so that entries used within the same clock tick keep their order
+        self._last_used = max(time.time(), self._last_used + 1e-6)
+        return self._last_used
+
+    def _put(self, **row: T.Any):
+        """Inserts or replaces `row`, then evicts past `max_entries`. Must be called holding the lock"""
+        key = " AND ".join(f"{column} = ?" for column in self.KEY)
+        exists = self._connection.execute(
+            f"SELECT 1 FROM {self.TABLE} WHERE {key}", [row[column] for column in self.KEY]
+        ).fetchone()
+
+        self._connection.execute(
+            f"INSERT OR REPLACE INTO {self.TABLE} ({', '.join(row)}) VALUES ({', '.join('?' * len(row))})",
+            list(row.values())
+        )
+        if exists is None:
+            self._count += 1
+
+        self._evict()
+
+    def _evict(self):
+        if self._count <= self._max_entries:
+            return
+
+        deleted = self._connection.execute(
+            f"DELETE FROM {self.TABLE} WHERE rowid IN"
+            f" (SELECT rowid FROM {self.TABLE} ORDER BY last_used LIMIT ?)",
+            (self._count - self._max_entries,)
+        ).rowcount
+        self._count -= deleted
+
+    def __len__(self):
+        with self._lock:
+            return self._count
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+class TreeCache(LRUDatabase):
+    """Persistent cache of the Dockerfiles found in a commit's tree
+
+    Since a commit SHA is immutable, the list of Dockerfiles (and their blob SHAs) found
+    for `(owner, repo, sha)` never changes, so it is stored in a SQLite database for the
+    next runs. Commits without Dockerfiles are stored as an empty list, and lookups that
+    failed with a status in `CACHEABLE_ERROR_STATUSES` are stored as errors.
+
+    What a listing holds also depends on `tree_walk` and `tree_walk_exclude`, so entries
+    are keyed by the `listing` they were made with too, as returned by `listing_of`.
+
+    The cache keeps at most `max_entries` rows, evicting the least recently used ones.
+    """
+    TABLE = "tree_listings"
+    SCHEMA = (
+        "owner TEXT NOT NULL,"
+        " repo TEXT NOT NULL,"
+        " sha TEXT NOT NULL,"
+        " listing TEXT NOT NULL,"
+        " entries TEXT,"
+        " error TEXT,"
+        " status INTEGER,"
+        " last_used REAL NOT NULL,"
+        " PRIMARY KEY (owner, repo, sha, listing)"
+    )
+    KEY = ("owner", "repo", "sha", "listing")
+
+    def __init__(self, path: str, max_entries: int = 10000, listing: str = ""):
+        super().__init__(path, max_entries)
+        self.listing = listing
+
+        # Entries of earlier versions weren't keyed by their listing, so they can't be trusted
+        self._connection.execute("DROP TABLE IF EXISTS trees")
+
+    @classmethod
+    def from_config(cls, config: Config) -> T.Optional["TreeCache"]:
+        if not config.tree_cache_path:
+            return None
+
+        return cls(config.tree_cache_path, config.tree_cache_max_entries, listing_of(config))
+
+    def get(self, owner: str, repo: str, sha: str) -> T.Optional[T.List[T.Tuple[str, str]]]:
+        """Returns the cached `(path, blob sha)` list, or None if there's no entry
+
+        Raises `CachedError` if the entry records a failed lookup.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT entries, error, status FROM tree_listings"
+                " WHERE owner = ? AND repo = ? AND sha = ? AND listing = ?",
+                (owner, repo, sha, self.listing)
+            ).fetchone()
+
+            if row is None:
+                CACHE_LOOKUPS.inc(cache="tree", result="miss")
+                return None
+
+            self._connection.execute(
+                "UPDATE tree_listings SET last_used = ? WHERE owner = ? AND repo = ? AND sha = ? AND listing = ?",
+                (self._tick(), owner, repo, sha, self.listing)
+            )
+
+        CACHE_LOOKUPS.inc(cache="tree", result="hit")
+
+        entries, error, status = row
+        if error is not None:
+            raise CachedError(error, status)
+
+        return [tuple(entry) for entry in json.loads(entries)]
+
+    def put(self, owner: str, repo: str, sha: str, entries: T.Iterable[T.Tuple[str, str]]):
+        self._store(owner, repo, sha, json.dumps([list(entry) for entry in entries]), None, None)
+
+    def put_error(self, owner: str, repo: str, sha: str, error: str, status: int):
+        self._store(owner, repo, sha, None, error, status)
+
+    def _store(self, owner, repo, sha, entries, error, status):
+        with self._lock:
+            self._put(
+                owner=owner,
+                repo=repo,
+                sha=sha,
+                listing=self.listing,
+                entries=entries,
+                error=error,
+                status=status,
+                last_used=self._tick(),
+            )
+
+
+class BlobDatabase(LRUDatabase):
+    TABLE = "blobs"
+    SCHEMA = "key TEXT PRIMARY KEY, statements TEXT NOT NULL, last_used REAL NOT NULL"
+    KEY = ("key",)
+
+    def get(self, key: str) -> T.Optional[T.List[T.Tuple]]:
+        with self._lock:
+            row = self._connection.execute("SELECT statements FROM blobs WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+
+            self._connection.execute("UPDATE blobs SET last_used = ? WHERE key = ?", (self._tick(), key))
+
+        return [tuple(statement) for statement in json.loads(row[0])]
+
+    def put(self, key: str, statements: T.List[T.Tuple]):
+        with self._lock:
+            self._put(
+                key=key,
+                statements=json.dumps([list(statement) for statement in statements]),
+                last_used=self._tick(),
+            )
+
+
+class BlobCache:
+    """Cache of parsed Dockerfiles keyed by their blob SHA
+
+    Byte-identical Dockerfiles (templates, forks, vendored copies or the same file on
+    successive commits) share their blob SHA, so each one only needs to be fetched and
+    parsed once. Entries live in a bounded in-memory LRU and, if a `path` is given, in a
+    SQLite database that outlives the run.
+    """
+    def __init__(self, max_entries: int = 10000, path: str = None):
+        self._lock = threading.Lock()
+        self._max_entries = int(max_entries)
+        self._entries = OrderedDict()
+        self._database = BlobDatabase(path, max_entries) if path else None
+
+    @classmethod
+    def from_config(cls, config: Config) -> "BlobCache":
+        return cls(config.blob_cache_max_entries, config.blob_cache_path)
+
+    def get(self, key: str) -> T.Optional[T.List[T.Tuple]]:
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                CACHE_LOOKUPS.inc(cache="blob", result="hit")
+                return self._entries[key]
+
+        statements = self._database.get(key) if self._database is not None else None
+        if statements is not None:
+            self._remember(key, statements)
+
+        CACHE_LOOKUPS.inc(cache="blob", result="miss" if statements is None else "hit")
+        return statements
+
+    def put(self, key: str, statements: T.List[T.Tuple]):
+        self._remember(key, statements)
+
+        if self._database is not None:
+            self._database.put(key, statements)
+
+    def _remember(self, key: str, statements: T.List[T.Tuple]):
+        with self._lock:
+            self._entries[key] = statements
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def close(self):
+        if self._database is not None:
+            self._database.close()
+
+
+class CachedResponse(T.NamedTuple):
+    headers: T.Dict[str, str]
+    body: bytes
+
+    def validators(self) -> T.Dict[str, str]:
+        """Headers making the next request for the same url conditional"""
+        validators = {}
+        if "ETag" in self.headers:
+            validators["If-None-Match"] = self.headers["ETag"]
+        if "Last-Modified" in self.headers:
+            validators["If-Modified-Since"] = self.headers["Last-Modified"]
+        return validators
+
+
+class HttpCache(LRUDatabase):
+    """Persistent cache of the responses carrying an `ETag` or `Last-Modified` validator
+
+    The next request for a cached url is made conditional, and a `304 Not Modified`
+    answered with the cached body: github doesn't count those against the rate limit,
+    and they don't carry the body again. The cache keeps at most `max_entries` responses
+    and `max_bytes` of bodies, evicting the least recently used ones.
+    """
+    TABLE = "responses"
+    SCHEMA = (
+        "url TEXT PRIMARY KEY,"
+        " headers TEXT NOT NULL,"
+        " body BLOB NOT NULL,"
+        " size INTEGER NOT NULL,"
+        " last_used REAL NOT NULL"
+    )
+    KEY = ("url",)
+    # Describe how the body was sent, not the body stored
+    UNCACHED_HEADERS = ("content-encoding", "content-length", "transfer-encoding", "connection", "keep-alive")
+
+    def __init__(self, path: str, max_entries: int = 10000, max_bytes: int = 512 * 1024 * 1024):
+        super().__init__(path, max_entries)
+        self._max_bytes = int(max_bytes)
+
+    @classmethod
+    def from_config(cls, config: Config) -> T.Optional["HttpCache"]:
+        if not config.http_cache_path:
+            return None
+
+        return cls(config.http_cache_path, config.http_cache_max_entries, config.http_cache_max_bytes)
+
+    def get(self, url: str) -> T.Optional[CachedResponse]:
+        with self._lock:
+            row = self._connection.execute("SELECT headers, body FROM responses WHERE url = ?", (url,)).fetchone()
+            if row is None:
+                return None
+
+            self._connection.execute("UPDATE responses SET last_used = ? WHERE url = ?", (self._tick(), url))
+
+        return CachedResponse(json.loads(row[0]), bytes(row[1]))
+
+    def put(self, url: str, headers: T.Mapping[str, str], body: bytes):
+        if len(body) > self._max_bytes:
+            return
+
+        headers = {name: value for name, value in headers.items() if name.lower() not in self.UNCACHED_HEADERS}
+        with self._lock:
+            self._put(url=url, headers=json.dumps(headers), body=body, size=len(body), last_used=self._tick())
+
+    def _evict(self):
+        super()._evict()
+
+        (size,) = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()
+        if size <= self._max_bytes:
+            return
+
+        entries = self._connection.execute("SELECT url, size FROM responses ORDER BY last_used").fetchall()
+        for url, entry_size in entries:
+            if size <= self._max_bytes:
+                break
+
+            self._connection.execute("DELETE FROM responses WHERE url = ?", (url,))
+            self._count -= 1
+            size -= entry_size
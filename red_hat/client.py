@@ -1,40 +1,329 @@
+import asyncio
+from concurrent import futures
+from fnmatch import fnmatch
+import json
+import logging
+import time
 import typing as T
+from urllib.parse import urlsplit
 
-from requests import Session
+from requests import HTTPError, Response, Session
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from tenacity import AsyncRetrying, Retrying, retry_if_result, stop_after_attempt
+
+try:
+    import aiohttp
+except ImportError:  # pragma: no cover
+    aiohttp = None
 
 from config import Config
-from red_hat.parsers import Parser
+from red_hat.cache import BlobCache, CachedResponse, HttpCache, TreeCache
+from red_hat.concurrency import AdaptiveConcurrency, is_throttled
+from red_hat.graphql import GRAPHQL_URL_TEMPLATE, BlobRef, build_blob_query, split_blob_response
+from red_hat.hedging import Hedger
+from red_hat.json_stream import ObjectStream
+from red_hat.metrics import (
+    CACHE_LOOKUPS,
+    HTTP_REQUEST_DURATION,
+    HTTP_REQUESTS,
+    HTTP_REQUESTS_IN_FLIGHT,
+    RATE_LIMIT_REMAINING,
+    STAGE_DURATION,
+)
+from red_hat.parsers import Parser, RepositoryListParser
+from red_hat.scheduler import RateLimitScheduler, request_resource
+from red_hat.singleflight import Replay, SingleFlight
+from red_hat.tracing import span
+
+logger = logging.getLogger(__name__)
 
 
-REPOSITORY_URL_TEMPLATE = "https://api.github.com/repos/{owner}/{name}/git/trees/{sha}?recursive={recursive}"
-RAWCONTENT_URL_TEMPLATE = "https://raw.githubusercontent.com/{owner}/{name}/{sha}/{path}"
+REPOSITORY_URL_TEMPLATE = "{api_url}/repos/{owner}/{name}/git/trees/{sha}?recursive={recursive}"
+RAWCONTENT_URL_TEMPLATE = "{raw_url}/{owner}/{name}/{sha}/{path}"
+# Changed files are only listed on the first page, and paging keeps the commits out of it
+COMPARE_URL_TEMPLATE = "{api_url}/repos/{owner}/{name}/compare/{base}...{head}?per_page=1"
 BLOB_TYPE = "blob"
+TREE_TYPE = "tree"
+# Bytes of a tree response decoded at once
+TREE_CHUNK_SIZE = 64 * 1024
+
+R = T.TypeVar("R")
+
+TREE_WALK_NEVER = "never"
+TREE_WALK_TRUNCATED = "truncated"
+TREE_WALK_ALWAYS = "always"
+
+
+def _exclusions(config: Config) -> T.List[str]:
+    exclude = config.tree_walk_exclude or []
+    if isinstance(exclude, str):
+        exclude = exclude.split(",")
+
+    return [pattern.strip().rstrip("/") for pattern in exclude if pattern.strip()]
+
+
+def is_excluded(path: str, exclude: T.List[str]) -> bool:
+    """Whether `path`, or any of the directories it's in, matches one of the `exclude` globs
+
+    Globs are matched against both the name and the full path of each directory, so
+    `node_modules` skips every `node_modules` directory while `docs/*` only skips the
+    contents of the top level `docs` directory.
+    """
+    if not exclude:
+        return False
+
+    parts = path.split("/")
+    for depth in range(1, len(parts) + 1):
+        name, prefix = parts[depth - 1], "/".join(parts[:depth])
+        if any(fnmatch(name, pattern) or fnmatch(prefix, pattern) for pattern in exclude):
+            return True
+
+    return False
+
+
+def _split_tree(data: T.Dict, prefix: str, exclude: T.List[str]) -> T.Tuple[T.List, T.List]:
+    """Splits a non-recursive tree into its blobs and the `(path, sha)` of its subtrees"""
+    blobs = []
+    subtrees = []
+
+    for node in data["tree"]:
+        path = prefix + node["path"]
+        if is_excluded(path, exclude):
+            continue
+
+        if node["type"] == BLOB_TYPE:
+            blobs.append(TreeEntry(path, node.get("sha")))
+        elif node["type"] == TREE_TYPE:
+            subtrees.append((path, node["sha"]))
+
+    return blobs, subtrees
+
+
+def _parse_blobs(blobs: T.List[T.Union[str, Exception]], parser: Parser) -> T.List:
+    return [blob if isinstance(blob, Exception) else parser.parse(blob) for blob in blobs]
+
+
+class TreeEntry(str):
+    """Path of a blob in a repository's tree that also carries the blob's SHA"""
+    def __new__(cls, path: str, sha: str = None):
+        entry = super().__new__(cls, path)
+        entry.sha = sha
+        return entry
+
+    def __reduce__(self):
+        return (TreeEntry, (str(self), self.sha))
+
+
+def _retry_policy(config: Config) -> T.Dict:
+    """Keeps retrying rate limited requests, which return `(response, delay)` tuples
+
+    There's no wait between attempts here because the scheduler already holds the next
+    attempt back until the rate limit allows it. Once out of attempts, the last response
+    is returned so that the caller raises for its status.
+    """
+    return dict(
+        retry=retry_if_result(lambda result: result[-1] is not None),
+        stop=stop_after_attempt(config.rate_limit_retries),
+        before_sleep=lambda state: logger.warning(
+            "Rate limited, retrying in %.1fs (attempt %d)", state.outcome.result()[-1], state.attempt_number
+        ),
+        retry_error_callback=lambda state: state.outcome.result(),
+    )
+
+
+def _endpoint(url: str, config: Config) -> str:
+    """Kind of github endpoint `url` belongs to, to label its metrics"""
+    if url.startswith(config.github_raw_url):
+        return "raw"
+    if url == config.repository_list_url:
+        return "list"
+
+    path = urlsplit(url).path
+    if "/git/trees/" in path:
+        return "tree"
+    if "/compare/" in path:
+        return "compare"
+    if path.endswith("/graphql"):
+        return "graphql"
+
+    return "other"
+
+
+def _observe_request(url: str, endpoint: str, status: T.Any, started: float, headers: T.Mapping = None):
+    HTTP_REQUESTS.inc(endpoint=endpoint, status=status)
+    HTTP_REQUEST_DURATION.observe(time.perf_counter() - started, endpoint=endpoint, status=status)
+
+    remaining = headers.get("X-RateLimit-Remaining") if headers is not None else None
+    if remaining is not None:
+        resource = headers.get("X-RateLimit-Resource") or request_resource(url)
+        RATE_LIMIT_REMAINING.set(int(remaining), host=urlsplit(url).netloc, resource=resource)
+
+
+def _cached_response(url: str, cached: CachedResponse) -> Response:
+    """Rebuilds the response served from the cache, as if github had sent it again"""
+    r = Response()
+    r.status_code = 200
+    r.url = url
+    r.headers = CaseInsensitiveDict(cached.headers)
+    r.encoding = get_encoding_from_headers(r.headers)
+    r._content = cached.body
+    r._content_consumed = True
+    return r
 
 
 class HttpClient:
-    def __init__(self, config: Config, client: Session = None):
+    def __init__(
+        self,
+        config: Config,
+        client: Session = None,
+        scheduler: RateLimitScheduler = None,
+        concurrency: AdaptiveConcurrency = None
+    ):
         if client is None:
             client = Session()
 
         if config.github_access_id and config.github_access_secret:
             client.auth = (config.github_access_id, config.github_access_secret)
 
+        if scheduler is None:
+            scheduler = RateLimitScheduler(burst=config.rate_limit_burst)
+
+        if concurrency is None:
+            concurrency = AdaptiveConcurrency.from_config(config)
+
         self._client = client
         self._config = config
+        self.scheduler = scheduler
+        self.concurrency = concurrency
+        self.http_cache = HttpCache.from_config(config)
+
+    def _request(self, method: str, url: str, **kwargs) -> Response:
+        """Sends a request through the rate limit scheduler, queueing it while rate limited
+
+        With adaptive concurrency, the request also waits for a slot among those its host
+        is currently allowed.
+        """
+        endpoint = _endpoint(url, self._config)
+        gate = self.concurrency.gate(url) if self.concurrency is not None else None
+
+        def attempt():
+            with span("rate_limit_wait", "http", endpoint=endpoint):
+                self.scheduler.acquire(url)
+
+            if gate is not None:
+                with span("concurrency_wait", "http", endpoint=endpoint):
+                    gate.acquire()
+
+            started = time.perf_counter()
+            status = headers = None
+            try:
+                with HTTP_REQUESTS_IN_FLIGHT.track_inprogress(endpoint=endpoint), \
+                        span("request", "http", endpoint=endpoint, url=url) as args:
+                    try:
+                        r = self._client.request(method, url, **kwargs)
+                    except Exception:
+                        _observe_request(url, endpoint, "error", started)
+                        raise
+
+                    status, headers = r.status_code, r.headers
+                    args.update(status=status, bytes=headers.get("Content-Length"))
+            finally:
+                if gate is not None:
+                    gate.release(time.perf_counter() - started, is_throttled(status, headers))
+
+            _observe_request(url, endpoint, r.status_code, started, r.headers)
+            return r, self.scheduler.update(url, r.status_code, r.headers)
+
+        r, _ = Retrying(**_retry_policy(self._config))(attempt)
+
+        return r
+
+    def _get(self, url: str, conditional: bool = False, **kwargs) -> Response:
+        """Sends a GET request, made conditional if `conditional` and the url's response is cached
+
+        Only urls whose content may change are worth it: trees, raw files and comparisons
+        are addressed by SHA, and cached as such by the tree and blob caches. Responses
+        carrying an `ETag` or `Last-Modified` are read in full to be cached, even when
+        streamed.
+        """
+        if self.http_cache is None or not conditional:
+            return self._request("GET", url, **kwargs)
+
+        cached = self.http_cache.get(url)
+        if cached is not None:
+            kwargs["headers"] = {**kwargs.get("headers", {}), **cached.validators()}
+
+        r = self._request("GET", url, **kwargs)
+
+        if r.status_code == 304 and cached is not None:
+            # Releases the connection of a streamed response
+            r.close()
+            CACHE_LOOKUPS.inc(cache="http", result="hit")
+            return _cached_response(url, cached)
+
+        CACHE_LOOKUPS.inc(cache="http", result="miss")
+        if r.status_code == 200 and ("ETag" in r.headers or "Last-Modified" in r.headers):
+            self.http_cache.put(url, r.headers, r.content)
+
+        return r
 
 
 class RepositoryListClient(HttpClient):
-    def list_of_repositories(self, parser: Parser):
-        if not self._config.repository_list_url:
+    def list_of_repositories(self, parser: Parser, url: str = None):
+        url = url or self._config.repository_list_url
+        if not url:
             raise ValueError("No repository list url specified")
 
-        r = self._client.get(self._config.repository_list_url)
+        r = self._get(url, conditional=True)
         r.raise_for_status()
 
         return parser.parse(r.text)
 
+    def iter_repositories(self, parser: RepositoryListParser, url: str = None) -> T.Iterator[T.Tuple]:
+        """Streams the list, yielding each valid and unique `(repo, sha)` as soon as it's downloaded
+
+        The list is read from `url`, or from `repository_list_url` by default.
+        """
+        url = url or self._config.repository_list_url
+        if not url:
+            raise ValueError("No repository list url specified")
+
+        r = self._get(url, conditional=True, stream=True)
+        r.raise_for_status()
+
+        if r.encoding is None:
+            r.encoding = "utf-8"
+
+        def lines():
+            with r:
+                yield from r.iter_lines(decode_unicode=True)
+
+        return parser.parse_lines(lines())
+
 
 class GithubClient(HttpClient):
+    def __init__(
+        self,
+        config: Config,
+        client: Session = None,
+        scheduler: RateLimitScheduler = None,
+        concurrency: AdaptiveConcurrency = None
+    ):
+        super().__init__(config, client, scheduler, concurrency)
+
+        self.tree_cache = TreeCache.from_config(config)
+        self.blob_cache = BlobCache.from_config(config)
+        self.hedger = Hedger.from_config(config)
+        self.single_flight = SingleFlight.from_config(config)
+
+    def _coalesced(self, key: T.Tuple, fn: T.Callable[[], T.Any]) -> T.Any:
+        """Shares the outcome of `fn` with concurrent calls for the same `key`"""
+        if self.single_flight is None:
+            return fn()
+
+        return self.single_flight.do(key, fn)
+
     def list_repository_files(
         self,
         owner: str,
@@ -43,43 +332,169 @@ class GithubClient(HttpClient):
         recursive: bool = True
     ) -> T.Iterable:
         """Uses github's Git Tree API to return a list of files
-        
-        There are some limitations to the simplistic approach of this function:
-        The response can return an attribute `truncated: true` meaning that the
-        size of the response reached the maximum and one should recursively inspect
-        the trees received by the endpoint to obtain the remainder nodes.
-        
-        For the record, querying for Django's tree returns a full response (no truncation),
-        so I am working on the assumption that the repositories analyzed by this tool have a
-        smaller tree than Django.
-        
-        As an extra consideration:
-        
+
+        The recursive tree is limited to 100,000 entries or 7 MB, past which github
+        answers with `truncated: true` and a partial list:
+
             "We actually have a limit of 100,000 entries. If the recursive parameter is supplied,
             we will read and return a maximum of 7 MB worth of entries from git ls-tree."
-        
-        and:
-            "This all said, keep in mind that 100,000 is the current limit, but it could change
-            anytime in the future."
-        
+
         from https://github.community/t/github-get-tree-api-limits-and-recursivity/1300
-        
-        So, in lieu of loading this tool with the task of recursively inspecting the subtree nodes,
-        I take on this simplistic approach.
+
+        Depending on `tree_walk`, truncated trees (`truncated`, the default) or every tree
+        (`always`) are walked instead: each directory is fetched non-recursively, with up to
+        `tree_walk_concurrency` requests at once, skipping those matching `tree_walk_exclude`.
+        With `never`, truncated trees are returned as they are.
+
+        Paths matching `tree_walk_exclude` are left out in every mode.
+
+        Concurrent calls for the same tree share a single request.
         """
-        r = self._client.get(
-            REPOSITORY_URL_TEMPLATE.format(
+        return self._coalesced(
+            ("tree", owner, repository_name, sha, recursive),
+            lambda: list(self._list_repository_files(owner, repository_name, sha, recursive))
+        )
+
+    def iter_repository_files(
+        self,
+        owner: str,
+        repository_name: str,
+        sha: str,
+        keep: T.Callable[[str], bool] = None
+    ) -> T.Iterator[TreeEntry]:
+        """Yields the blobs of the recursive tree whose path passes `keep` as the response is read
+
+        The response is decoded incrementally, so only the blobs kept are held on to rather
+        than every node of a tree of up to 7 MB. Trees are walked as in `list_repository_files`:
+        a truncated tree first yields the blobs it lists, then those only found by walking it.
+
+        With `single_flight`, concurrent calls for the same tree share a single request, and
+        each gets its blobs as they're read.
+        """
+        if self.single_flight is None:
+            yield from self._iter_repository_files(owner, repository_name, sha, keep)
+            return
+
+        yield from self._coalesced(
+            ("tree", owner, repository_name, sha, True, keep),
+            lambda: Replay(self._iter_repository_files(owner, repository_name, sha, keep))
+        )
+
+    def _list_repository_files(self, owner: str, repository_name: str, sha: str, recursive: bool) -> T.Iterable:
+        if recursive:
+            return self._iter_repository_files(owner, repository_name, sha)
+
+        exclude = _exclusions(self._config)
+        data = self._get_tree(owner, repository_name, sha, recursive)
+
+        return (
+            TreeEntry(node['path'], node.get('sha'))
+            for node in data["tree"]
+            if node["type"] == BLOB_TYPE and not is_excluded(node['path'], exclude)
+        )
+
+    def _iter_repository_files(
+        self,
+        owner: str,
+        repository_name: str,
+        sha: str,
+        keep: T.Callable[[str], bool] = None
+    ) -> T.Iterator[TreeEntry]:
+        exclude = _exclusions(self._config)
+        keep = keep or (lambda path: True)
+
+        if self._config.tree_walk == TREE_WALK_ALWAYS:
+            yield from filter(keep, self._walk_tree(owner, repository_name, sha, exclude))
+            return
+
+        found = set()
+        tree = self._stream_tree(owner, repository_name, sha)
+
+        with span("decode", "tree") as args:
+            for node in tree.items():
+                if node["type"] == BLOB_TYPE and keep(node["path"]) and not is_excluded(node["path"], exclude):
+                    found.add(node["path"])
+                    yield TreeEntry(node["path"], node.get("sha"))
+
+            args["bytes"] = tree.size
+
+        if tree.fields.get("truncated") and self._config.tree_walk == TREE_WALK_TRUNCATED:
+            logger.info("Tree of %s/%s@%s is truncated, walking it instead", owner, repository_name, sha)
+            yield from (
+                entry for entry in self._walk_tree(owner, repository_name, sha, exclude)
+                if entry not in found and keep(entry)
+            )
+
+    def _tree_url(self, owner: str, repository_name: str, sha: str, recursive: bool) -> str:
+        return REPOSITORY_URL_TEMPLATE.format(
+            api_url=self._config.github_api_url,
+            owner=owner,
+            name=repository_name,
+            sha=sha,
+            recursive=1 if recursive else 0
+        )
+
+    def _stream_tree(self, owner: str, repository_name: str, sha: str) -> ObjectStream:
+        """Requests the recursive tree, to be decoded as its body is read"""
+        r = self._get(self._tree_url(owner, repository_name, sha, True), stream=True)
+
+        try:
+            r.raise_for_status()
+        except HTTPError:
+            r.close()
+            raise
+
+        def chunks():
+            with r:
+                yield from r.iter_content(TREE_CHUNK_SIZE)
+
+        return ObjectStream(chunks(), "tree")
+
+    def _get_tree(self, owner: str, repository_name: str, sha: str, recursive: bool) -> T.Dict:
+        r = self._get(self._tree_url(owner, repository_name, sha, recursive))
+
+        r.raise_for_status()
+        with span("decode", "tree", bytes=len(r.content)):
+            return r.json()
+
+    def compare_commits(self, owner: str, repository_name: str, base: str, head: str) -> T.Dict:
+        """Uses github's compare API to return the files changed from `base` to `head`
+
+        Github lists at most 300 files, and compares `head` with the merge base of both
+        commits, so the answer's `status` must be `ahead` (or `identical`) for its `files`
+        to be the changes from `base` itself.
+        """
+        r = self._get(
+            COMPARE_URL_TEMPLATE.format(
+                api_url=self._config.github_api_url,
                 owner=owner,
                 name=repository_name,
-                sha=sha,
-                recursive=1 if recursive else 0
+                base=base,
+                head=head
             )
         )
 
         r.raise_for_status()
-        data = r.json()
+        return r.json()
+
+    def _walk_tree(self, owner: str, repository_name: str, sha: str, exclude: T.List[str]) -> T.List[TreeEntry]:
+        entries = []
 
-        return (node['path'] for node in data["tree"] if node["type"] == BLOB_TYPE)
+        with futures.ThreadPoolExecutor(self._config.tree_walk_concurrency) as executor:
+            pending = {executor.submit(self._get_tree, owner, repository_name, sha, False): ""}
+
+            while pending:
+                done, _ = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+
+                for future in done:
+                    prefix = pending.pop(future)
+                    blobs, subtrees = _split_tree(future.result(), prefix, exclude)
+                    entries.extend(blobs)
+
+                    for path, tree_sha in subtrees:
+                        pending[executor.submit(self._get_tree, owner, repository_name, tree_sha, False)] = path + "/"
+
+        return sorted(entries)
 
     def get_dockerfile(
         self,
@@ -89,15 +504,371 @@ class GithubClient(HttpClient):
         path: str,
         parser: Parser
     ) -> T.List[T.Tuple]:
-        r = self._client.get(
-            RAWCONTENT_URL_TEMPLATE.format(
+        """Fetches a file's raw content and parses it
+
+        Raw content doesn't count against the API's rate limit, so when hedging is
+        enabled, slow fetches are raced against a duplicate request. Concurrent calls
+        for the same file share a single request.
+        """
+        url = RAWCONTENT_URL_TEMPLATE.format(
+            raw_url=self._config.github_raw_url,
+            owner=owner,
+            name=repository_name,
+            sha=sha,
+            path=path.strip('/')
+        )
+
+        def fetch():
+            r = self._get(url)
+            r.raise_for_status()
+            return r
+
+        def fetch_and_parse():
+            with STAGE_DURATION.time(stage="fetch"), span("fetch", "dockerfile", path=path):
+                r = self.hedger.call(fetch) if self.hedger is not None else fetch()
+
+            with STAGE_DURATION.time(stage="parse"), span("parse", "dockerfile", path=path, bytes=len(r.content)):
+                return parser.parse(r.text)
+
+        return self._coalesced(("raw", url, type(parser).__name__), fetch_and_parse)
+
+    @property
+    def supports_batch(self) -> bool:
+        """Github's GraphQL API, used by `get_dockerfiles`, only takes authenticated requests"""
+        return bool(
+            self._config.github_access_id and self._config.github_access_secret and self._config.graphql_batch_size
+        )
+
+    def get_dockerfiles(self, refs: T.Sequence[BlobRef], parser: Parser) -> T.List[T.Union[T.List[T.Tuple], Exception]]:
+        """Fetches and parses many `(owner, repo, sha, path)` files with one GraphQL request per chunk
+
+        The result is aligned with `refs`, holding the exception for files that couldn't be read.
+        """
+        refs = list(refs)
+        results = []
+        size = self._config.graphql_batch_size
+
+        for start in range(0, len(refs), size):
+            chunk = refs[start:start + size]
+            with STAGE_DURATION.time(stage="fetch"), span("fetch", "dockerfile", files=len(chunk)):
+                r = self._request(
+                    "POST",
+                    GRAPHQL_URL_TEMPLATE.format(api_url=self._config.github_api_url),
+                    json={"query": build_blob_query(chunk)}
+                )
+                r.raise_for_status()
+                payload = r.json()
+
+            with STAGE_DURATION.time(stage="parse"), span("parse", "dockerfile", files=len(chunk)):
+                results.extend(_parse_blobs(split_blob_response(chunk, payload), parser))
+
+        return results
+
+
+class AsyncHttpClient:
+    """asyncio counterpart of `HttpClient` backed by a pooled `aiohttp` session
+
+    The session and the semaphore bounding the requests in flight are bound to the
+    running event loop, so they are created when entering the client's context.
+    """
+    def __init__(
+        self,
+        config: Config,
+        client: "aiohttp.ClientSession" = None,
+        scheduler: RateLimitScheduler = None,
+        concurrency: AdaptiveConcurrency = None
+    ):
+        if aiohttp is None:
+            raise RuntimeError("aiohttp is required to use the asyncio clients")
+
+        if scheduler is None:
+            scheduler = RateLimitScheduler(burst=config.rate_limit_burst)
+
+        if concurrency is None:
+            concurrency = AdaptiveConcurrency.from_config(config)
+
+        self._client = client
+        self._owns_client = client is None
+        self._config = config
+        self.scheduler = scheduler
+        self.concurrency = concurrency
+        self._semaphore = None
+
+    async def __aenter__(self):
+        if self._client is None:
+            auth = None
+            if self._config.github_access_id and self._config.github_access_secret:
+                auth = aiohttp.BasicAuth(self._config.github_access_id, self._config.github_access_secret)
+
+            connector = aiohttp.TCPConnector(limit=self._config.async_concurrency)
+            self._client = aiohttp.ClientSession(auth=auth, connector=connector)
+
+        self._semaphore = asyncio.Semaphore(self._config.async_concurrency)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        if self._owns_client and self._client is not None:
+            await self._client.close()
+            self._client = None
+
+        self._semaphore = None
+
+    @property
+    def is_open(self) -> bool:
+        """Whether the client has been entered, and not exited yet"""
+        return self._semaphore is not None
+
+    async def _request_text(self, method: str, url: str, **kwargs) -> str:
+        """Sends a request through the rate limit scheduler, queueing it while rate limited"""
+        return await self._request(method, url, None, **kwargs)
+
+    async def _request(
+        self,
+        method: str,
+        url: str,
+        read: T.Callable[["aiohttp.ClientResponse"], T.Awaitable[R]] = None,
+        **kwargs
+    ) -> T.Union[str, R]:
+        """Same as `_request_text`, returning what `read` makes of a successful response's body instead"""
+        endpoint = _endpoint(url, self._config)
+        gate = self.concurrency.gate(url) if self.concurrency is not None else None
+
+        async def attempt():
+            with span("rate_limit_wait", "http", endpoint=endpoint):
+                await asyncio.sleep(self.scheduler.reserve(url))
+
+            async with self._semaphore:
+                if gate is not None:
+                    with span("concurrency_wait", "http", endpoint=endpoint):
+                        await gate.acquire_async()
+
+                started = time.perf_counter()
+                status = headers = None
+                try:
+                    with HTTP_REQUESTS_IN_FLIGHT.track_inprogress(endpoint=endpoint), \
+                            span("request", "http", endpoint=endpoint, url=url) as args:
+                        try:
+                            async with self._client.request(method, url, **kwargs) as r:
+                                if read is None or not r.ok:
+                                    body = await r.text()
+                                    size = len(body)
+                                else:
+                                    body = await read(r)
+                                    size = r.content_length
+                        except Exception:
+                            _observe_request(url, endpoint, "error", started)
+                            raise
+
+                        status, headers = r.status, r.headers
+                        args.update(status=status, bytes=size)
+                finally:
+                    if gate is not None:
+                        gate.release(time.perf_counter() - started, is_throttled(status, headers))
+
+            _observe_request(url, endpoint, r.status, started, r.headers)
+            return r, body, self.scheduler.update(url, r.status, r.headers)
+
+        r, body, _ = await AsyncRetrying(**_retry_policy(self._config))(attempt)
+        r.raise_for_status()
+
+        return body
+
+    async def _get_text(self, url: str) -> str:
+        return await self._request_text("GET", url)
+
+    async def _get_json(self, url: str) -> T.Any:
+        return json.loads(await self._get_text(url))
+
+
+class AsyncRepositoryListClient(AsyncHttpClient):
+    async def list_of_repositories(self, parser: Parser):
+        if not self._config.repository_list_url:
+            raise ValueError("No repository list url specified")
+
+        return parser.parse(await self._get_text(self._config.repository_list_url))
+
+
+class AsyncGithubClient(AsyncHttpClient):
+    def __init__(
+        self,
+        config: Config,
+        client: "aiohttp.ClientSession" = None,
+        scheduler: RateLimitScheduler = None,
+        concurrency: AdaptiveConcurrency = None
+    ):
+        super().__init__(config, client, scheduler, concurrency)
+
+        self.tree_cache = TreeCache.from_config(config)
+        self.blob_cache = BlobCache.from_config(config)
+
+    async def list_repository_files(
+        self,
+        owner: str,
+        repository_name: str,
+        sha: str,
+        recursive: bool = True
+    ) -> T.Iterable:
+        """Same as `GithubClient.list_repository_files`
+
+        Recursive trees are decoded as they're downloaded, like `GithubClient` does, so
+        only their blobs are held on to.
+        """
+        exclude = _exclusions(self._config)
+
+        if recursive and self._config.tree_walk == TREE_WALK_ALWAYS:
+            return await self._walk_tree(owner, repository_name, sha, exclude)
+
+        if not recursive:
+            data = await self._get_tree(owner, repository_name, sha, recursive)
+            return (
+                TreeEntry(node['path'], node.get('sha'))
+                for node in data["tree"]
+                if node["type"] == BLOB_TYPE and not is_excluded(node['path'], exclude)
+            )
+
+        entries, truncated = await self._stream_tree(owner, repository_name, sha, exclude)
+
+        if truncated and self._config.tree_walk == TREE_WALK_TRUNCATED:
+            logger.info("Tree of %s/%s@%s is truncated, walking it instead", owner, repository_name, sha)
+            return await self._walk_tree(owner, repository_name, sha, exclude)
+
+        return entries
+
+    async def _stream_tree(
+        self,
+        owner: str,
+        repository_name: str,
+        sha: str,
+        exclude: T.List[str]
+    ) -> T.Tuple[T.List[TreeEntry], bool]:
+        """Returns the blobs of the recursive tree, decoded as it's read, and whether it's truncated
+
+        `ObjectStream` pulls its chunks, so it runs in a worker thread that reads each one
+        from the event loop in turn.
+        """
+        loop = asyncio.get_running_loop()
+
+        def decode(r: "aiohttp.ClientResponse") -> T.Tuple[T.List[TreeEntry], bool]:
+            def chunks():
+                while True:
+                    chunk = asyncio.run_coroutine_threadsafe(r.content.read(TREE_CHUNK_SIZE), loop).result()
+                    if not chunk:
+                        return
+                    yield chunk
+
+            tree = ObjectStream(chunks(), "tree")
+            with span("decode", "tree") as args:
+                entries = [
+                    TreeEntry(node["path"], node.get("sha"))
+                    for node in tree.items()
+                    if node["type"] == BLOB_TYPE and not is_excluded(node["path"], exclude)
+                ]
+                args["bytes"] = tree.size
+
+            return entries, bool(tree.fields.get("truncated"))
+
+        return await self._request(
+            "GET",
+            REPOSITORY_URL_TEMPLATE.format(
+                api_url=self._config.github_api_url,
+                owner=owner,
+                name=repository_name,
+                sha=sha,
+                recursive=1
+            ),
+            lambda r: asyncio.to_thread(decode, r)
+        )
+
+    async def _get_tree(self, owner: str, repository_name: str, sha: str, recursive: bool) -> T.Dict:
+        text = await self._get_text(
+            REPOSITORY_URL_TEMPLATE.format(
+                api_url=self._config.github_api_url,
                 owner=owner,
                 name=repository_name,
                 sha=sha,
-                path=path.strip('/')
+                recursive=1 if recursive else 0
             )
         )
 
-        r.raise_for_status()
+        with span("decode", "tree", bytes=len(text)):
+            return json.loads(text)
 
-        return parser.parse(r.text)
+    async def compare_commits(self, owner: str, repository_name: str, base: str, head: str) -> T.Dict:
+        """Same as `GithubClient.compare_commits`"""
+        return await self._get_json(
+            COMPARE_URL_TEMPLATE.format(
+                api_url=self._config.github_api_url,
+                owner=owner,
+                name=repository_name,
+                base=base,
+                head=head
+            )
+        )
+
+    async def _walk_tree(self, owner: str, repository_name: str, sha: str, exclude: T.List[str]) -> T.List[TreeEntry]:
+        semaphore = asyncio.Semaphore(self._config.tree_walk_concurrency)
+
+        async def walk(tree_sha: str, prefix: str) -> T.List[TreeEntry]:
+            async with semaphore:
+                data = await self._get_tree(owner, repository_name, tree_sha, False)
+
+            blobs, subtrees = _split_tree(data, prefix, exclude)
+            for entries in await asyncio.gather(*(walk(subtree_sha, path + "/") for path, subtree_sha in subtrees)):
+                blobs.extend(entries)
+
+            return blobs
+
+        return sorted(await walk(sha, ""))
+
+    async def get_dockerfile(
+        self,
+        owner: str,
+        repository_name: str,
+        sha: str,
+        path: str,
+        parser: Parser
+    ) -> T.List[T.Tuple]:
+        with STAGE_DURATION.time(stage="fetch"), span("fetch", "dockerfile", path=path):
+            content = await self._get_text(
+                RAWCONTENT_URL_TEMPLATE.format(
+                    raw_url=self._config.github_raw_url,
+                    owner=owner,
+                    name=repository_name,
+                    sha=sha,
+                    path=path.strip('/')
+                )
+            )
+
+        with STAGE_DURATION.time(stage="parse"), span("parse", "dockerfile", path=path, bytes=len(content)):
+            return parser.parse(content)
+
+    @property
+    def supports_batch(self) -> bool:
+        return bool(
+            self._config.github_access_id and self._config.github_access_secret and self._config.graphql_batch_size
+        )
+
+    async def get_dockerfiles(self, refs: T.Sequence[BlobRef], parser: Parser) -> T.List:
+        """Same as `GithubClient.get_dockerfiles`, sending the chunks concurrently"""
+        refs = list(refs)
+        size = self._config.graphql_batch_size
+        chunks = [refs[start:start + size] for start in range(0, len(refs), size)]
+
+        async def fetch(chunk):
+            with STAGE_DURATION.time(stage="fetch"), span("fetch", "dockerfile", files=len(chunk)):
+                payload = json.loads(
+                    await self._request_text(
+                        "POST",
+                        GRAPHQL_URL_TEMPLATE.format(api_url=self._config.github_api_url),
+                        json={"query": build_blob_query(chunk)}
+                    )
+                )
+
+            with STAGE_DURATION.time(stage="parse"), span("parse", "dockerfile", files=len(chunk)):
+                return _parse_blobs(split_blob_response(chunk, payload), parser)
+
+        results = []
+        for chunk_results in await asyncio.gather(*(fetch(chunk) for chunk in chunks)):
+            results.extend(chunk_results)
+
+        return results
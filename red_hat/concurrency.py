@@ -0,0 +1,174 @@
+import asyncio
+from collections import deque
+import threading
+import typing as T
+from urllib.parse import urlsplit
+
+from config import Config
+from red_hat.metrics import CONCURRENCY_LIMIT
+
+
+# Gateway errors github answers with when it's overloaded
+OVERLOADED_STATUSES = (502, 503, 504)
+
+
+def is_throttled(status: T.Optional[int], headers: T.Mapping = None) -> bool:
+    """Whether a response (or a failed request, with no status) asks to slow down
+
+    That's `429`s, `403`s from the secondary rate limits or abuse detection (which carry
+    a `Retry-After` or an exhausted budget), gateway errors and connection failures.
+    """
+    if status is None or status == 429 or status in OVERLOADED_STATUSES:
+        return True
+
+    if status == 403 and headers is not None:
+        return "Retry-After" in headers or headers.get("X-RateLimit-Remaining") == "0"
+
+    return False
+
+
+class AIMDLimit:
+    """Concurrency limit following additive increase, multiplicative decrease
+
+    Each healthy response, while the limit is in use, raises it by `1 / limit` (so by
+    about one per round trip), up to `max_limit`. A throttled response or a latency spike
+    (recent latency over `latency_tolerance` times the long term one) multiplies it by
+    `backoff`, down to `min_limit`. After a cut, the responses to the requests already in
+    flight don't count, since they were sent under the previous limit, and a latency
+    spike becomes the reference for the next ones.
+    """
+    SHORT_ALPHA = 0.2
+    LONG_ALPHA = 0.02
+    WARMUP = 20
+
+    def __init__(
+        self,
+        initial: float,
+        min_limit: float = 1,
+        max_limit: float = 64,
+        backoff: float = 0.5,
+        latency_tolerance: float = 2.0
+    ):
+        self.min_limit = float(min_limit)
+        self.max_limit = float(max_limit)
+        self.value = min(max(float(initial), self.min_limit), self.max_limit)
+        self._backoff = float(backoff)
+        self._latency_tolerance = float(latency_tolerance)
+        self._short = None
+        self._long = None
+        self._samples = 0
+        self._ignored = 0
+
+    def _latency_spiked(self, latency: float) -> bool:
+        if self._short is None:
+            self._short = self._long = latency
+        else:
+            self._short += self.SHORT_ALPHA * (latency - self._short)
+            self._long += self.LONG_ALPHA * (latency - self._long)
+
+        self._samples += 1
+        return self._samples > self.WARMUP and self._short > self._latency_tolerance * self._long
+
+    def update(self, latency: T.Optional[float], throttled: bool, in_flight: int) -> float:
+        """Adjusts the limit to a response and returns it"""
+        spiked = latency is not None and self._latency_spiked(latency)
+
+        if self._ignored > 0:
+            self._ignored -= 1
+        elif throttled or spiked:
+            self.value = max(self.value * self._backoff, self.min_limit)
+            self._ignored = in_flight
+            if spiked:
+                # Judge the next spikes against the latency that triggered this cut
+                self._long = self._short
+        elif in_flight + 1 >= int(self.value):
+            self.value = min(self.value + 1 / self.value, self.max_limit)
+
+        return self.value
+
+
+class HostGate:
+    """Lets at most `limit` requests to a host through, waking threads and tasks as slots free up"""
+    def __init__(self, host: str, limit: AIMDLimit):
+        self.host = host
+        self.limit = limit
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        self._async_waiters = deque()
+
+    def _try_acquire(self) -> bool:
+        if self.in_flight < int(self.limit.value):
+            self.in_flight += 1
+            return True
+        return False
+
+    def acquire(self):
+        with self._available:
+            self._available.wait_for(self._try_acquire)
+
+    async def acquire_async(self):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            with self._lock:
+                if self._try_acquire():
+                    return
+
+                waiter = loop.create_future()
+                self._async_waiters.append((loop, waiter))
+
+            await waiter
+
+    def release(self, latency: T.Optional[float], throttled: bool):
+        with self._lock:
+            self.in_flight -= 1
+            value = self.limit.update(latency, throttled, self.in_flight)
+            free = int(value) - self.in_flight
+
+            self._available.notify(max(free, 0))
+            while free > 0 and self._async_waiters:
+                loop, waiter = self._async_waiters.popleft()
+                loop.call_soon_threadsafe(_wake, waiter)
+                free -= 1
+
+        CONCURRENCY_LIMIT.set(value, host=self.host)
+
+
+def _wake(waiter: asyncio.Future):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class AdaptiveConcurrency:
+    """Adapts the number of requests in flight to each host to how it copes with them
+
+    Every host gets its own `AIMDLimit`, starting at `initial`: github's API may be
+    throttling while raw contents still flow. The current limits are exported as the
+    `extractor_concurrency_limit` gauge.
+    """
+    def __init__(self, initial: int, max_limit: int, min_limit: int = 1):
+        self._initial = initial
+        self._min_limit = min_limit
+        self._max_limit = max_limit
+        self._lock = threading.Lock()
+        self._gates = {}
+
+    @classmethod
+    def from_config(cls, config: Config) -> T.Optional["AdaptiveConcurrency"]:
+        if not config.adaptive_concurrency:
+            return None
+
+        return cls(config.thread_pool_size, config.adaptive_concurrency_max)
+
+    def gate(self, url: str) -> HostGate:
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._gates:
+                limit = AIMDLimit(self._initial, self._min_limit, self._max_limit)
+                self._gates[host] = HostGate(host, limit)
+                CONCURRENCY_LIMIT.set(limit.value, host=host)
+            return self._gates[host]
+
+    def limit(self, url: str) -> float:
+        return self.gate(url).limit.value
@@ -0,0 +1,255 @@
+import os
+import sqlite3
+import threading
+import time
+import typing as T
+
+from red_hat.results import ExtractionResult
+from red_hat.utils import split_image_reference
+
+
+SQLITE_HEADER = b"SQLite format 3\x00"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scans (
+    id INTEGER PRIMARY KEY,
+    started_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE TABLE IF NOT EXISTS repositories (
+    id INTEGER PRIMARY KEY,
+    scan_id INTEGER NOT NULL REFERENCES scans (id),
+    repo TEXT NOT NULL,
+    sha TEXT NOT NULL,
+    failed INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS dockerfiles (
+    id INTEGER PRIMARY KEY,
+    repository_id INTEGER NOT NULL REFERENCES repositories (id),
+    path TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS images (
+    dockerfile_id INTEGER NOT NULL REFERENCES dockerfiles (id),
+    position INTEGER NOT NULL,
+    reference TEXT NOT NULL,
+    name TEXT NOT NULL,
+    tag TEXT,
+    digest TEXT
+);
+CREATE TABLE IF NOT EXISTS errors (
+    repository_id INTEGER NOT NULL REFERENCES repositories (id),
+    path TEXT,
+    message TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS repositories_scan ON repositories (scan_id, repo);
+CREATE INDEX IF NOT EXISTS dockerfiles_repository ON dockerfiles (repository_id);
+CREATE INDEX IF NOT EXISTS images_name_tag ON images (name, tag);
+CREATE INDEX IF NOT EXISTS images_dockerfile ON images (dockerfile_id);
+CREATE INDEX IF NOT EXISTS errors_repository ON errors (repository_id);
+"""
+
+
+def is_database(path: str) -> bool:
+    with open(path, "rb") as f:
+        return f.read(len(SQLITE_HEADER)) == SQLITE_HEADER
+
+
+def _image_filter(image: str) -> T.Tuple[str, T.List]:
+    """Matches an image by name, and by tag and digest if `image` has them"""
+    name, tag, digest = split_image_reference(image)
+    conditions, params = ["i.name = ?"], [name]
+
+    if tag is not None:
+        conditions.append("i.tag = ?")
+        params.append(tag)
+    if digest is not None:
+        conditions.append("i.digest = ?")
+        params.append(digest)
+
+    return " AND ".join(conditions), params
+
+
+class ResultDatabase:
+    """SQLite database of the results of successive scans
+
+    Each scan's repositories, Dockerfiles, images and errors go to their own tables,
+    tagged with the scan's id, so a new scan is appended alongside the earlier ones.
+    Images are split into their name, tag and digest, which are indexed to find the
+    Dockerfiles using an image (or any of its tags) without reading the rest.
+    """
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.executescript(SCHEMA)
+
+    def start_scan(self) -> int:
+        with self._lock:
+            return self._connection.execute("INSERT INTO scans (started_at) VALUES (?)", (time.time(),)).lastrowid
+
+    def finish_scan(self, scan_id: int):
+        with self._lock:
+            self._connection.execute("UPDATE scans SET finished_at = ? WHERE id = ?", (time.time(), scan_id))
+
+    def insert(self, scan_id: int, results: T.Iterable[ExtractionResult]):
+        """Inserts results within a single transaction"""
+        with self._lock:
+            cursor = self._connection.cursor()
+            cursor.execute("BEGIN")
+            try:
+                for result in results:
+                    self._insert(cursor, scan_id, result)
+            except BaseException:
+                cursor.execute("ROLLBACK")
+                raise
+            cursor.execute("COMMIT")
+
+    @staticmethod
+    def _insert(cursor: sqlite3.Cursor, scan_id: int, result: ExtractionResult):
+        repository_id = cursor.execute(
+            "INSERT INTO repositories (scan_id, repo, sha, failed) VALUES (?, ?, ?, ?)",
+            (scan_id, result.repo, result.sha, result.data is None)
+        ).lastrowid
+
+        for path, images in (result.data or {}).items():
+            dockerfile_id = cursor.execute(
+                "INSERT INTO dockerfiles (repository_id, path) VALUES (?, ?)", (repository_id, path)
+            ).lastrowid
+            cursor.executemany(
+                "INSERT INTO images (dockerfile_id, position, reference, name, tag, digest) VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (dockerfile_id, position, image, *split_image_reference(image))
+                    for position, image in enumerate(images)
+                ]
+            )
+
+        if isinstance(result.errors, dict):
+            errors = list(result.errors.items())
+        else:
+            errors = [(None, result.errors)] if result.errors else []
+
+        cursor.executemany(
+            "INSERT INTO errors (repository_id, path, message) VALUES (?, ?, ?)",
+            [(repository_id, path, message) for path, message in errors]
+        )
+
+    def scans(self) -> T.List[T.Dict]:
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT s.id, s.started_at, s.finished_at, COUNT(r.id) FROM scans s"
+                " LEFT JOIN repositories r ON r.scan_id = s.id GROUP BY s.id ORDER BY s.id"
+            ).fetchall()
+
+        return [
+            {"id": id_, "started_at": started_at, "finished_at": finished_at, "repositories": repositories}
+            for id_, started_at, finished_at, repositories in rows
+        ]
+
+    def _last_scan(self) -> T.Optional[int]:
+        (scan_id,) = self._connection.execute("SELECT MAX(id) FROM scans").fetchone()
+        return scan_id
+
+    def usage(self, image: str, scan_id: int = None) -> T.List[T.Dict]:
+        """Dockerfiles using `image` in a scan (the last one by default)
+
+        `image` is matched by name, tag and digest, or only by the parts it has: `python`
+        matches every tag of python.
+        """
+        condition, params = _image_filter(image)
+
+        with self._lock:
+            if scan_id is None:
+                scan_id = self._last_scan()
+
+            rows = self._connection.execute(
+                "SELECT DISTINCT r.repo, r.sha, d.path, i.reference FROM images i"
+                " JOIN dockerfiles d ON d.id = i.dockerfile_id"
+                " JOIN repositories r ON r.id = d.repository_id"
+                f" WHERE {condition} AND r.scan_id = ?"
+                " ORDER BY r.repo, d.path",
+                params + [scan_id]
+            ).fetchall()
+
+        return [{"repo": repo, "sha": sha, "path": path, "image": reference} for repo, sha, path, reference in rows]
+
+    def trend(self, image: str) -> T.List[T.Dict]:
+        """Number of repositories using `image` (matched as in `usage`) in each scan"""
+        condition, params = _image_filter(image)
+
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT s.id, s.started_at, COUNT(DISTINCT m.repo) FROM scans s LEFT JOIN ("
+                "  SELECT r.scan_id, r.repo FROM images i"
+                "  JOIN dockerfiles d ON d.id = i.dockerfile_id"
+                "  JOIN repositories r ON r.id = d.repository_id"
+                f"  WHERE {condition}"
+                " ) m ON m.scan_id = s.id"
+                " GROUP BY s.id ORDER BY s.id",
+                params
+            ).fetchall()
+
+        return [{"scan": id_, "started_at": started_at, "repositories": count} for id_, started_at, count in rows]
+
+    def images(self, scan_id: int = None) -> T.Dict[str, int]:
+        """Number of Dockerfiles using each image in a scan (the last one by default)"""
+        with self._lock:
+            if scan_id is None:
+                scan_id = self._last_scan()
+
+            rows = self._connection.execute(
+                "SELECT i.reference, COUNT(DISTINCT d.id) FROM images i"
+                " JOIN dockerfiles d ON d.id = i.dockerfile_id"
+                " JOIN repositories r ON r.id = d.repository_id"
+                " WHERE r.scan_id = ? GROUP BY i.reference",
+                (scan_id,)
+            ).fetchall()
+
+        return dict(rows)
+
+    def results(self, scan_id: int = None) -> T.Iterator[ExtractionResult]:
+        """Results of a scan (the last one by default), as they were inserted"""
+        with self._lock:
+            if scan_id is None:
+                scan_id = self._last_scan()
+
+            repositories = self._connection.execute(
+                "SELECT id, repo, sha, failed FROM repositories WHERE scan_id = ? ORDER BY id", (scan_id,)
+            ).fetchall()
+            images = self._connection.execute(
+                "SELECT d.repository_id, d.path, i.reference FROM dockerfiles d"
+                " JOIN repositories r ON r.id = d.repository_id"
+                " LEFT JOIN images i ON i.dockerfile_id = d.id"
+                " WHERE r.scan_id = ? ORDER BY d.id, i.position",
+                (scan_id,)
+            ).fetchall()
+            errors = self._connection.execute(
+                "SELECT e.repository_id, e.path, e.message FROM errors e"
+                " JOIN repositories r ON r.id = e.repository_id WHERE r.scan_id = ?",
+                (scan_id,)
+            ).fetchall()
+
+        data = {}
+        for repository_id, path, reference in images:
+            files = data.setdefault(repository_id, {}).setdefault(path, [])
+            if reference is not None:
+                files.append(reference)
+
+        messages = {}
+        for repository_id, path, message in errors:
+            if path is None:
+                messages[repository_id] = message
+            else:
+                messages.setdefault(repository_id, {})[path] = message
+
+        for repository_id, repo, sha, failed in repositories:
+            yield ExtractionResult(
+                repo, sha, None if failed else data.get(repository_id, {}), messages.get(repository_id, {})
+            )
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
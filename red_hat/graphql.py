@@ -0,0 +1,75 @@
+import json
+import typing as T
+
+
+GRAPHQL_URL_TEMPLATE = "{api_url}/graphql"
+
+# (owner, repository name, commit sha, path)
+BlobRef = T.Tuple[str, str, str, str]
+
+
+class BlobNotFound(Exception):
+    pass
+
+
+def build_blob_query(refs: T.Sequence[BlobRef]) -> str:
+    """Builds a GraphQL query that fetches the text of every blob in `refs` at once
+
+    Blobs are grouped by repository, each repository being aliased `r<n>` and each blob
+    `b<i>`, where `i` is the blob's index in `refs`:
+
+        query {
+          r0: repository(owner: "owner", name: "name") {
+            b0: object(expression: "sha:path") { ... on Blob { text } }
+          }
+        }
+    """
+    repositories = {}
+    for index, (owner, name, sha, path) in enumerate(refs):
+        repositories.setdefault((owner, name), []).append((index, f"{sha}:{path.strip('/')}"))
+
+    fields = []
+    for number, ((owner, name), blobs) in enumerate(repositories.items()):
+        objects = " ".join(
+            f"b{index}: object(expression: {json.dumps(expression)}) {{ ... on Blob {{ text }} }}"
+            for index, expression in blobs
+        )
+        fields.append(f"r{number}: repository(owner: {json.dumps(owner)}, name: {json.dumps(name)}) {{ {objects} }}")
+
+    return "query { " + " ".join(fields) + " }"
+
+
+def split_blob_response(refs: T.Sequence[BlobRef], payload: T.Dict) -> T.List[T.Union[str, Exception]]:
+    """Splits the response to `build_blob_query(refs)` into each blob's text
+
+    The result is aligned with `refs`. Blobs that couldn't be read (missing repositories,
+    paths or binary blobs) get an exception instead of their text.
+    """
+    errors = {}
+    for error in payload.get("errors") or []:
+        alias = (error.get("path") or [None])[0]
+        errors[alias] = error.get("message", "Unknown error")
+
+    repositories = {}
+    for owner, name, _, _ in refs:
+        if (owner, name) not in repositories:
+            repositories[(owner, name)] = f"r{len(repositories)}"
+
+    data = payload.get("data") or {}
+    results = []
+    for index, (owner, name, sha, path) in enumerate(refs):
+        alias = repositories[(owner, name)]
+        repository = data.get(alias)
+
+        if repository is None:
+            results.append(BlobNotFound(errors.get(alias, f"Repository {owner}/{name} not found")))
+            continue
+
+        blob = repository.get(f"b{index}")
+        if blob is None or blob.get("text") is None:
+            results.append(BlobNotFound(f"Blob {sha}:{path} not found in {owner}/{name}"))
+            continue
+
+        results.append(blob["text"])
+
+    return results
@@ -0,0 +1,125 @@
+from collections import deque
+from concurrent import futures
+import threading
+import time
+import typing as T
+
+from config import Config
+
+
+R = T.TypeVar("R")
+
+
+class LatencyTracker:
+    """Keeps the latency of the last `window` requests to compute percentiles from"""
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self._lock = threading.Lock()
+        self._samples = deque(maxlen=window)
+        self._min_samples = min_samples
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, percentile: float) -> T.Optional[float]:
+        """Returns the latency under which `percentile`% of the samples are, if there are enough"""
+        with self._lock:
+            if len(self._samples) < self._min_samples:
+                return None
+            samples = sorted(self._samples)
+
+        index = min(len(samples) - 1, int(len(samples) * percentile / 100))
+        return samples[index]
+
+
+class Hedger:
+    """Sends a duplicate of a request that takes longer than most recent ones
+
+    When a call hasn't finished within the `percentile` latency of the recent calls, the
+    same call is issued once more and whichever succeeds first is returned. Hedges are
+    capped to a `max_ratio` fraction of the calls, so that a slow host doesn't get twice
+    the load. Calls must be idempotent, since the losing one is left to finish unobserved.
+    """
+    def __init__(
+        self,
+        percentile: float = 95,
+        max_ratio: float = 0.05,
+        max_workers: int = 8,
+        tracker: LatencyTracker = None
+    ):
+        self.percentile = float(percentile)
+        self.max_ratio = float(max_ratio)
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+        self._lock = threading.Lock()
+        self._tracker = tracker or LatencyTracker()
+        self._executor = futures.ThreadPoolExecutor(max_workers, thread_name_prefix="hedge")
+
+    @classmethod
+    def from_config(cls, config: Config) -> T.Optional["Hedger"]:
+        if not config.hedge_raw_requests:
+            return None
+
+        workers = config.thread_pool_size
+        if config.adaptive_concurrency:
+            workers = max(workers, config.adaptive_concurrency_max)
+
+        return cls(
+            percentile=config.hedge_percentile,
+            max_ratio=config.hedge_max_ratio,
+            # Room for a primary and a hedge per worker thread
+            max_workers=2 * workers,
+        )
+
+    def call(self, fn: T.Callable[[], R]) -> R:
+        with self._lock:
+            self.requests += 1
+
+        started = threading.Event()
+        primary = self._executor.submit(self._timed, fn, started)
+        delay = self._tracker.percentile(self.percentile)
+        if delay is None:
+            return primary.result()
+
+        # Time spent queued for a pool thread isn't latency of the call, so the delay runs from its start
+        started.wait()
+        done, _ = futures.wait([primary], timeout=delay)
+        if done or not self._allow_hedge():
+            return primary.result()
+
+        hedge = self._executor.submit(self._timed, fn)
+        pending = {primary, hedge}
+        while pending:
+            done, pending = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        with self._lock:
+                            self.hedge_wins += 1
+                    return future.result()
+
+        # Both failed, so report the original error
+        return primary.result()
+
+    def _allow_hedge(self) -> bool:
+        with self._lock:
+            if self.hedges + 1 > self.max_ratio * self.requests:
+                return False
+
+            self.hedges += 1
+            return True
+
+    def _timed(self, fn: T.Callable[[], R], started: threading.Event = None) -> R:
+        if started is not None:
+            started.set()
+
+        start = time.monotonic()
+        result = fn()
+        self._tracker.record(time.monotonic() - start)
+
+        return result
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
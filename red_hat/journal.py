@@ -0,0 +1,114 @@
+import json
+import logging
+import os
+import threading
+import time
+import typing as T
+
+from config import Config
+from red_hat.results import ExtractionResult
+
+logger = logging.getLogger(__name__)
+
+
+class Journal:
+    """Append-only log of the repositories already extracted, to resume interrupted runs
+
+    Each completed result is appended as a line of JSON. Lines are buffered and written
+    (and fsync'd) at most every `fsync_interval` seconds, so at worst the last few
+    seconds of work are lost when the process is killed. A line cut short by the kill is
+    ignored when loading the journal back, and dropped before the next run appends to it.
+    """
+    def __init__(self, path: str, fsync_interval: float = 5.0):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.path = path
+        self._lock = threading.Lock()
+        self._buffer = []
+        self._fsync_interval = float(fsync_interval)
+        self._synced = time.monotonic()
+        self._file = None
+
+    @classmethod
+    def from_config(cls, config: Config) -> T.Optional["Journal"]:
+        if not config.journal_path:
+            return None
+
+        return cls(config.journal_path, config.journal_fsync_interval)
+
+    def load(self) -> T.Dict[str, ExtractionResult]:
+        """Returns the results recorded by previous runs, by `repo:sha` key"""
+        results = {}
+        if not os.path.exists(self.path):
+            return results
+
+        with open(self.path, "rb") as f:
+            for line in f:
+                try:
+                    result = ExtractionResult.from_dict(json.loads(line))
+                except (ValueError, KeyError):
+                    logger.warning("Ignoring corrupt journal line in %s", self.path)
+                    continue
+
+                results[result.key] = result
+
+        return results
+
+    def record(self, result: ExtractionResult):
+        with self._lock:
+            self._buffer.append(json.dumps(result.to_dict()).encode() + b"\n")
+
+            if time.monotonic() - self._synced >= self._fsync_interval:
+                self._sync()
+
+    def flush(self):
+        with self._lock:
+            self._sync()
+
+    def _sync(self):
+        if self._buffer:
+            if self._file is None:
+                self._file = self._open()
+
+            self._file.write(b"".join(self._buffer))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._buffer = []
+
+        self._synced = time.monotonic()
+
+    def _open(self) -> T.BinaryIO:
+        """Opens the journal to append to it, truncated back to the end of its last full line"""
+        f = open(self.path, "a+b")
+        end = position = f.seek(0, os.SEEK_END)
+
+        while position > 0:
+            start = max(position - 4096, 0)
+            f.seek(start)
+            newline = f.read(position - start).rfind(b"\n")
+            if newline != -1:
+                position = start + newline + 1
+                break
+            position = start
+
+        if position < end:
+            logger.warning("Dropping the line cut short at the end of %s", self.path)
+            f.truncate(position)
+
+        return f
+
+    def close(self):
+        with self._lock:
+            self._sync()
+
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
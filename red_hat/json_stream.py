@@ -0,0 +1,117 @@
+import codecs
+import json
+import typing as T
+
+
+WHITESPACE = " \t\n\r"
+
+
+class ObjectStream:
+    """Incrementally decodes a JSON object read in chunks, such as a streamed response
+
+    `items()` yields the elements of the array under `key` one by one as soon as they're
+    read, so that only the current chunk and the element being decoded are held in memory
+    rather than the whole document. The object's other members are decoded whole into
+    `fields`, which is complete once `items()` is exhausted.
+    """
+    def __init__(self, chunks: T.Iterable[bytes], key: str):
+        self.key = key
+        self.fields: T.Dict[str, T.Any] = {}
+        self.size = 0
+        self._chunks = iter(chunks)
+        self._text = codecs.getincrementaldecoder("utf-8")()
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self) -> bool:
+        """Appends the next chunk to the buffer, returning False at the end of the stream"""
+        if self._eof:
+            return False
+
+        self._buffer = self._buffer[self._pos:]
+        self._pos = 0
+
+        for chunk in self._chunks:
+            if chunk:
+                self.size += len(chunk)
+                self._buffer += self._text.decode(chunk)
+                return True
+
+        self._buffer += self._text.decode(b"", final=True)
+        self._eof = True
+        return False
+
+    def _peek(self) -> str:
+        """Skips whitespace, returning the next character, or "" at the end of the stream"""
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos] in WHITESPACE:
+                self._pos += 1
+
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+
+            if not self._fill():
+                return ""
+
+    def _expect(self, characters: str) -> str:
+        character = self._peek()
+        if not character or character not in characters:
+            raise ValueError(f"Expecting one of {characters!r} at offset {self._pos} of the buffer, got {character!r}")
+
+        self._pos += 1
+        return character
+
+    def _value(self) -> T.Any:
+        """Decodes the next value, reading more chunks until it's complete"""
+        self._peek()
+
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue
+                raise
+
+            # A number at the end of the buffer may go on in the next chunk
+            if end == len(self._buffer) and self._fill():
+                continue
+
+            self._pos = end
+            return value
+
+    def _elements(self) -> T.Iterator[T.Any]:
+        if self._peek() == "]":
+            self._pos += 1
+            return
+
+        while True:
+            yield self._value()
+            if self._expect(",]") == "]":
+                return
+
+    def items(self) -> T.Iterator[T.Any]:
+        self._expect("{")
+
+        if self._peek() == "}":
+            self._pos += 1
+        else:
+            while True:
+                name = self._value()
+                if not isinstance(name, str):
+                    raise ValueError(f"Expecting a member name, got {name!r}")
+
+                self._expect(":")
+                if name == self.key and self._peek() == "[":
+                    self._pos += 1
+                    yield from self._elements()
+                else:
+                    self.fields[name] = self._value()
+
+                if self._expect(",}") == "}":
+                    break
+
+        if self._peek():
+            raise ValueError("Extra data after the object")
@@ -0,0 +1,273 @@
+import bisect
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import math
+import os
+import tempfile
+import threading
+import time
+import typing as T
+
+from config import Config
+from red_hat.results import ExtractionResult
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def _format_labels(labels: T.Sequence[T.Tuple[str, str]]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+class Registry:
+    """Holds the metrics rendered in Prometheus' text exposition format"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = []
+
+    def register(self, metric: "Metric"):
+        with self._lock:
+            self._metrics.append(metric)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics)
+
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.TYPE}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str):
+        """Writes the metrics to `path` atomically, as node_exporter's textfile collector expects"""
+        directory = os.path.dirname(path) or "."
+        os.makedirs(directory, exist_ok=True)
+
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".metrics")
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(self.render())
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+
+REGISTRY = Registry()
+
+
+class Metric:
+    TYPE = None
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: T.Sequence[str] = (),
+        registry: Registry = REGISTRY
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+        if registry is not None:
+            registry.register(self)
+
+    def _key(self, labels: T.Dict[str, T.Any]) -> T.Tuple[str, ...]:
+        assert set(labels) == set(self.labelnames), f"{self.name} takes the labels {self.labelnames}"
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key: T.Tuple[str, ...]) -> T.List[T.Tuple[str, str]]:
+        return list(zip(self.labelnames, key))
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> T.Iterator[T.Tuple[str, T.List, float]]:
+        with self._lock:
+            values = sorted(self._values.items())
+
+        for key, value in values:
+            yield self.name, self._labels(key), value
+
+
+class Counter(Metric):
+    TYPE = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    TYPE = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track_inprogress(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(Metric):
+    """Cumulative histogram, keeping a count per bucket along with the sum and count of observations"""
+    TYPE = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: T.Sequence[str] = (),
+        buckets: T.Sequence[float] = DEFAULT_BUCKETS,
+        registry: Registry = REGISTRY
+    ):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * (len(self.buckets) + 1), 0.0)
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def value(self, **labels) -> int:
+        """Number of observations"""
+        with self._lock:
+            counts, _ = self._values.get(self._key(labels)) or ([0], 0.0)
+            return sum(counts)
+
+    def samples(self) -> T.Iterator[T.Tuple[str, T.List, float]]:
+        with self._lock:
+            values = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+
+        for key, (counts, total) in values:
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                yield f"{self.name}_bucket", labels + [("le", _format_value(bound))], cumulative
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, cumulative
+
+
+HTTP_REQUESTS = Counter(
+    "extractor_http_requests_total", "HTTP requests sent, by endpoint and status", ("endpoint", "status")
+)
+HTTP_REQUEST_DURATION = Histogram(
+    "extractor_http_request_duration_seconds", "Latency of the HTTP requests, by endpoint and status",
+    ("endpoint", "status")
+)
+HTTP_REQUESTS_IN_FLIGHT = Gauge(
+    "extractor_http_requests_in_flight", "HTTP requests waiting for their response, by endpoint", ("endpoint",)
+)
+RATE_LIMIT_REMAINING = Gauge(
+    "extractor_rate_limit_remaining",
+    "Requests left in the rate limit budget of each resource, as last reported by each host",
+    ("host", "resource")
+)
+CONCURRENCY_LIMIT = Gauge(
+    "extractor_concurrency_limit", "Requests allowed in flight to each host by the adaptive concurrency", ("host",)
+)
+CACHE_LOOKUPS = Counter(
+    "extractor_cache_lookups_total", "Cache lookups, by cache and whether they hit", ("cache", "result")
+)
+STAGE_DURATION = Histogram(
+    "extractor_stage_duration_seconds", "Time spent on each stage of an extraction: tree, fetch and parse", ("stage",)
+)
+REPOSITORIES = Counter(
+    "extractor_repositories_total", "Repositories extracted, by outcome: ok, partial or failed", ("outcome",)
+)
+
+
+def outcome(result: ExtractionResult) -> str:
+    if result.data is None:
+        return "failed"
+    return "partial" if result.errors else "ok"
+
+
+def count_results(results: T.Iterable[ExtractionResult]) -> T.Iterator[ExtractionResult]:
+    for result in results:
+        REPOSITORIES.inc(outcome=outcome(result))
+        yield result
+
+
+def serve(port: int, address: str = "0.0.0.0", registry: Registry = REGISTRY) -> ThreadingHTTPServer:
+    """Serves the metrics at `/metrics` from a background thread"""
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((address, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+
+    return server
+
+
+def serve_from_config(config: Config) -> T.Optional[ThreadingHTTPServer]:
+    if config.metrics_port is None:
+        return None
+
+    return serve(config.metrics_port)
+
+
+def write_from_config(config: Config):
+    if config.metrics_path:
+        REGISTRY.write(config.metrics_path)
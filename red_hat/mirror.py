@@ -0,0 +1,300 @@
+import asyncio
+from collections import OrderedDict
+import contextlib
+import logging
+import os
+import subprocess
+import threading
+import typing as T
+
+from config import Config
+from red_hat.client import GithubClient, TreeEntry, _exclusions, is_excluded
+from red_hat.metrics import STAGE_DURATION
+from red_hat.parsers import Parser
+from red_hat.tracing import span
+
+logger = logging.getLogger(__name__)
+
+
+BLOB_TYPE = "blob"
+# `git diff-tree --raw` status letters, as github's compare API names them
+DIFF_STATUSES = {"A": "added", "C": "added", "D": "removed", "M": "modified", "R": "renamed", "T": "modified"}
+
+
+class MirrorMissError(LookupError):
+    """The repository, commit or file isn't in the local mirror"""
+
+
+def _git(git_dir: str, *args: str, check: bool = True) -> subprocess.CompletedProcess:
+    try:
+        process = subprocess.run(["git", "--git-dir", git_dir, *args], capture_output=True)
+    except OSError as e:
+        raise MirrorMissError(f"Could not run git {args[0]} in {git_dir}: {e}") from e
+
+    if check and process.returncode != 0:
+        raise MirrorMissError(f"git {args[0]} failed in {git_dir}: {process.stderr.decode(errors='replace').strip()}")
+
+    return process
+
+
+class CatFile:
+    """A long-lived `git cat-file --batch` process, reading a repository's objects one at a time
+
+    `users` and `evicted` are kept by `GitMirrorClient`, so that a process dropped from its
+    cache is only closed once no thread reads from it anymore.
+    """
+    def __init__(self, git_dir: str):
+        self.git_dir = git_dir
+        self.users = 0
+        self.evicted = False
+        self._lock = threading.Lock()
+        try:
+            self._process = subprocess.Popen(
+                ["git", "--git-dir", git_dir, "cat-file", "--batch"],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL
+            )
+        except OSError as e:
+            raise MirrorMissError(f"Could not run git cat-file in {git_dir}: {e}") from e
+
+    def read(self, name: str) -> T.Optional[T.Tuple[str, bytes]]:
+        """Returns the type and content of the object named `name` (such as `sha:path`), or None if it's missing"""
+        if "\n" in name:
+            return None
+
+        with self._lock:
+            self._process.stdin.write(name.encode() + b"\n")
+            self._process.stdin.flush()
+
+            header = self._process.stdout.readline()
+            if not header:
+                raise MirrorMissError(f"git cat-file exited in {self.git_dir}")
+
+            # `<oid> <type> <size>`, or `<name> missing` (or `ambiguous`) otherwise
+            parts = header.split()
+            if len(parts) != 3 or not parts[2].isdigit():
+                return None
+
+            content = self._process.stdout.read(int(parts[2]))
+            self._process.stdout.read(1)
+
+        return parts[1].decode(), content
+
+    def close(self):
+        with self._lock:
+            self._process.stdin.close()
+            self._process.wait()
+
+
+class GitMirrorClient:
+    """Reads trees and Dockerfiles from local bare mirrors, with the same interface as `GithubClient`
+
+    `git_mirror_path` is formatted with the `owner` and `name` of a repository to find its
+    mirror. Trees are listed with `git ls-tree` and blobs read through a `git cat-file
+    --batch` process kept alive for each of the `git_mirror_processes` mirrors used last,
+    so no request is sent and no rate limit applies. When a repository isn't mirrored or
+    its mirror lacks the commit, it's read from github through `fallback` if given.
+    """
+    def __init__(self, config: Config, fallback: GithubClient = None):
+        assert config.git_mirror_path, "git_mirror_path must be set to read from local mirrors"
+
+        self._config = config
+        self.fallback = fallback
+        self._lock = threading.Lock()
+        self._cat_files = OrderedDict()
+
+    def git_dir(self, owner: str, repository_name: str) -> str:
+        git_dir = self._config.git_mirror_path.format(owner=owner, name=repository_name)
+        if not os.path.isdir(git_dir):
+            raise MirrorMissError(f"{owner}/{repository_name} has no mirror at {git_dir}")
+
+        return git_dir
+
+    @contextlib.contextmanager
+    def _cat_file(self, git_dir: str) -> T.Iterator[CatFile]:
+        """Checks out the `git cat-file` process of `git_dir`, evicting the least recently used ones"""
+        idle = []
+
+        with self._lock:
+            cat_file = self._cat_files.pop(git_dir, None) or CatFile(git_dir)
+            self._cat_files[git_dir] = cat_file
+            cat_file.users += 1
+
+            while len(self._cat_files) > self._config.git_mirror_processes:
+                _, evicted = self._cat_files.popitem(last=False)
+                idle.extend(self._evict(evicted))
+
+        for evicted in idle:
+            evicted.close()
+
+        try:
+            yield cat_file
+        finally:
+            with self._lock:
+                cat_file.users -= 1
+                idle = [cat_file] if cat_file.evicted and not cat_file.users else []
+
+            for evicted in idle:
+                evicted.close()
+
+    @staticmethod
+    def _evict(cat_file: CatFile) -> T.List[CatFile]:
+        """Marks `cat_file` as evicted, returning it if it can be closed right away"""
+        cat_file.evicted = True
+        return [] if cat_file.users else [cat_file]
+
+    def _or_fallback(self, fn: T.Callable[[], T.Any], fallback: T.Callable[[GithubClient], T.Any]) -> T.Any:
+        try:
+            return fn()
+        except MirrorMissError as e:
+            if self.fallback is None:
+                raise
+
+            logger.debug("%s, reading from github instead", e)
+            return fallback(self.fallback)
+
+    def list_repository_files(
+        self,
+        owner: str,
+        repository_name: str,
+        sha: str,
+        recursive: bool = True
+    ) -> T.Iterable:
+        """Lists the files of a commit with `git ls-tree`, leaving out those matching `tree_walk_exclude`"""
+        return self._or_fallback(
+            lambda: self._list_repository_files(owner, repository_name, sha, recursive),
+            lambda client: client.list_repository_files(owner, repository_name, sha, recursive)
+        )
+
+    def _list_repository_files(self, owner: str, repository_name: str, sha: str, recursive: bool) -> T.List[TreeEntry]:
+        exclude = _exclusions(self._config)
+        args = ["ls-tree", "-z", "--full-tree"] + (["-r"] if recursive else []) + [sha]
+
+        entries = []
+        for line in _git(self.git_dir(owner, repository_name), *args).stdout.split(b"\0"):
+            if not line:
+                continue
+
+            # `<mode> <type> <object>\t<path>`
+            info, _, path = line.decode(errors="surrogateescape").partition("\t")
+            _, kind, blob_sha = info.split()
+            if kind == BLOB_TYPE and not is_excluded(path, exclude):
+                entries.append(TreeEntry(path, blob_sha))
+
+        return entries
+
+    def compare_commits(self, owner: str, repository_name: str, base: str, head: str) -> T.Dict:
+        """Lists the files changed from `base` to `head` like github's compare API does
+
+        The `changes` of a renamed file are 0 when its content is identical, and 1 otherwise.
+        """
+        return self._or_fallback(
+            lambda: self._compare_commits(owner, repository_name, base, head),
+            lambda client: client.compare_commits(owner, repository_name, base, head)
+        )
+
+    def _compare_commits(self, owner: str, repository_name: str, base: str, head: str) -> T.Dict:
+        git_dir = self.git_dir(owner, repository_name)
+
+        ancestry = _git(git_dir, "merge-base", "--is-ancestor", base, head, check=False)
+        if ancestry.returncode not in (0, 1):
+            raise MirrorMissError(f"Could not compare {base} with {head} in {git_dir}")
+
+        if ancestry.returncode == 1:
+            return {"status": "diverged", "files": []}
+
+        # `:<mode> <mode> <sha> <sha> <status>\0<path>\0`, with a second path for renames and copies
+        fields = iter(_git(git_dir, "diff-tree", "-r", "-z", "-M", "--raw", base, head).stdout.split(b"\0"))
+        files = []
+        for info in fields:
+            if not info:
+                continue
+
+            _, _, _, blob_sha, status = info.decode().split()
+            path = next(fields).decode(errors="surrogateescape")
+            file = {"filename": path, "status": DIFF_STATUSES.get(status[0], "modified"), "sha": blob_sha}
+
+            if status[0] in "RC":
+                file["previous_filename"], file["filename"] = path, next(fields).decode(errors="surrogateescape")
+                file["changes"] = 0 if status[1:] == "100" else 1
+
+            files.append(file)
+
+        return {"status": "ahead" if files else "identical", "files": files}
+
+    def get_dockerfile(
+        self,
+        owner: str,
+        repository_name: str,
+        sha: str,
+        path: str,
+        parser: Parser
+    ) -> T.List[T.Tuple]:
+        """Reads a file from the mirror's `git cat-file` process and parses it"""
+        return self._or_fallback(
+            lambda: self._get_dockerfile(owner, repository_name, sha, path, parser),
+            lambda client: client.get_dockerfile(owner, repository_name, sha, path, parser)
+        )
+
+    def _get_dockerfile(self, owner: str, repository_name: str, sha: str, path: str, parser: Parser) -> T.List[T.Tuple]:
+        git_dir = self.git_dir(owner, repository_name)
+
+        with STAGE_DURATION.time(stage="fetch"), span("fetch", "dockerfile", path=path):
+            with self._cat_file(git_dir) as cat_file:
+                obj = cat_file.read(f"{sha}:{path.strip('/')}")
+
+        if obj is None or obj[0] != BLOB_TYPE:
+            raise MirrorMissError(f"{path} not found at {sha} in {git_dir}")
+
+        with STAGE_DURATION.time(stage="parse"), span("parse", "dockerfile", path=path, bytes=len(obj[1])):
+            return parser.parse(obj[1].decode(errors="replace"))
+
+    def close(self):
+        """Closes the idle `git cat-file` processes, and the others once their reads are done"""
+        with self._lock:
+            idle = []
+            for cat_file in self._cat_files.values():
+                idle.extend(self._evict(cat_file))
+            self._cat_files = OrderedDict()
+
+        for cat_file in idle:
+            cat_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class AsyncGitMirrorClient:
+    """Runs a `GitMirrorClient` off the event loop, for `AsyncExtractorService`"""
+    def __init__(self, client: GitMirrorClient):
+        self._client = client
+
+    async def list_repository_files(self, *args, **kwargs) -> T.Iterable:
+        return await asyncio.to_thread(self._client.list_repository_files, *args, **kwargs)
+
+    async def compare_commits(self, *args, **kwargs) -> T.Dict:
+        return await asyncio.to_thread(self._client.compare_commits, *args, **kwargs)
+
+    async def get_dockerfile(self, *args, **kwargs) -> T.List[T.Tuple]:
+        return await asyncio.to_thread(self._client.get_dockerfile, *args, **kwargs)
+
+
+def client_factory(config: Config) -> T.Union[GithubClient, GitMirrorClient]:
+    """Returns the client for `github_client_class`"""
+    clients_map = {
+        "GithubClient": lambda: GithubClient(config=config),
+        "GitMirrorClient": lambda: GitMirrorClient(
+            config=config,
+            fallback=GithubClient(config=config) if config.git_mirror_fallback else None
+        ),
+    }
+
+    assert config.github_client_class in clients_map, (
+        f"Github client class {config.github_client_class} not found in module {__file__}"
+    )
+
+    return clients_map[config.github_client_class]()
@@ -1,11 +1,16 @@
 import abc
-import typing as T
 import re
+import shlex
+import typing as T
 
 
 REPOSITORY_LINE_REGEX = (
     r"^https://(www.)?github.com/[a-zA-z-_0-9]+/[a-zA-z-_0-9]+(.git)? [A-Fa-f0-9]{40}$"
 )
+REPOSITORY_LINE_PATTERN = re.compile(REPOSITORY_LINE_REGEX)
+
+PARSER_DIRECTIVE_PATTERN = re.compile(r"^#\s*([a-zA-Z][a-zA-Z0-9]*)\s*=\s*(\S+)\s*$")
+VARIABLE_PATTERN = re.compile(r"\$(?:\{(\w+)(?::([-+])([^}]*))?\}|(\w+))")
 
 class Parser(abc.ABC):
     @abc.abstractmethod
@@ -15,12 +20,11 @@ class Parser(abc.ABC):
 
 class RepositoryListParser(Parser):
     def parse(self, content: str) -> T.List[T.Tuple]:
-        regex = re.compile(REPOSITORY_LINE_REGEX)
         def filter_fn(el: str) -> bool:
             if not el:
                 return False
             
-            return bool(regex.match(el))
+            return bool(REPOSITORY_LINE_PATTERN.match(el))
 
         return list(
             map(
@@ -32,16 +36,164 @@ class RepositoryListParser(Parser):
             )
         )
 
+    def parse_lines(self, lines: T.Iterable[str]) -> T.Iterator[T.Tuple]:
+        """Validates lines as they arrive, yielding each `(repo, sha)` pair only once"""
+        seen = set()
+
+        for line in lines:
+            if not line or not REPOSITORY_LINE_PATTERN.match(line):
+                continue
+
+            item = tuple(line.split())
+            if item in seen:
+                continue
+
+            seen.add(item)
+            yield item
+
+
+class FromInstruction(T.NamedTuple):
+    """Base image of a Dockerfile's stage, along with the stage's alias and the instruction's line"""
+    image: str
+    alias: T.Optional[str] = None
+    line: int = None
+
 
 class DockerfileParser(Parser):
-    """A very simplistic Dockerfile parser that only takes lines with the FROM instruction"""
-    def parse(self, content: str) -> T.List[T.Tuple]:
-        return list(
-            map(
-                lambda x: tuple(x.split()[1:]),
-                filter(
-                    lambda x: x.upper().startswith("FROM"),
-                    content.splitlines()
-                )
-            )
-        )
+    """Single pass Dockerfile parser that only takes the images of FROM instructions
+
+    Lines are read one at a time, joining those ending with the escape character and
+    skipping comments, so files can be parsed as they're streamed. It understands the
+    `escape` parser directive, skips flags such as `--platform`, and expands the ARGs
+    declared before the first FROM (`$NAME`, `${NAME}`, `${NAME:-default}` and
+    `${NAME:+value}`) in the images' names.
+
+    Since `FROM <stage>` refers to an earlier stage rather than to an image, those
+    instructions are left out.
+    """
+    # Bumped whenever the output changes, to tell apart cached results of older versions
+    version = 2
+
+    def parse(self, content: T.Union[str, T.Iterable[str]]) -> T.List[FromInstruction]:
+        if isinstance(content, str):
+            content = content.splitlines()
+
+        return list(self.iter_parse(content))
+
+    def iter_parse(self, lines: T.Iterable[str]) -> T.Iterator[FromInstruction]:
+        escape = "\\"
+        in_header = True
+        # Lines of the instruction being continued, if it's a FROM or an ARG
+        parts = None
+        # Whether the instruction being continued is one that's skipped
+        skipping = False
+        start = None
+
+        args = {}
+        stages = set()
+        seen_from = False
+
+        for number, line in enumerate(lines, 1):
+            if in_header:
+                directive = PARSER_DIRECTIVE_PATTERN.match(line)
+                if directive:
+                    if directive.group(1).lower() == "escape":
+                        escape = directive.group(2)
+                    continue
+                in_header = False
+
+            line = line.strip()
+            if not line or line[0] == "#":
+                continue
+
+            continued = line[-1] == escape
+
+            if skipping:
+                skipping = continued
+                continue
+
+            if parts is not None:
+                if continued:
+                    parts.append(line[:-1])
+                    continue
+
+                parts.append(line)
+                instruction = " ".join(parts)
+                parts = None
+            else:
+                # Cheap check on the keyword, since most instructions are skipped
+                if line[0] not in "FfAa" or line[:4].upper() not in ("FROM", "ARG ", "ARG\t"):
+                    skipping = continued
+                    continue
+
+                start = number
+                if continued:
+                    parts = [line[:-1]]
+                    continue
+
+                instruction = line
+
+            words = instruction.split(None, 1)
+            keyword = words[0].upper()
+            rest = words[1] if len(words) > 1 else ""
+
+            if keyword == "FROM":
+                seen_from = True
+                record = self._from_instruction(rest, start, args, stages)
+                if record is not None:
+                    yield record
+            elif keyword == "ARG" and not seen_from:
+                # Only the ARGs declared before the first FROM can be used in FROM instructions
+                self._declare_args(rest, args)
+
+    @staticmethod
+    def _from_instruction(
+        rest: str,
+        line: int,
+        args: T.Dict[str, T.Optional[str]],
+        stages: T.Set[str]
+    ) -> T.Optional[FromInstruction]:
+        tokens = [token for token in rest.split() if not token.startswith("--")]
+        if not tokens:
+            return None
+
+        image = expand_args(tokens[0], args)
+        alias = tokens[2] if len(tokens) > 2 and tokens[1].upper() == "AS" else None
+
+        is_stage = image.lower() in stages
+        if alias:
+            stages.add(alias.lower())
+
+        if is_stage or not image:
+            return None
+
+        return FromInstruction(image, alias, line)
+
+    @staticmethod
+    def _declare_args(rest: str, args: T.Dict[str, T.Optional[str]]):
+        try:
+            tokens = shlex.split(rest)
+        except ValueError:
+            tokens = rest.split()
+
+        for token in tokens:
+            name, assigned, value = token.partition("=")
+            args[name] = expand_args(value, args) if assigned else args.get(name)
+
+
+def expand_args(value: str, args: T.Dict[str, T.Optional[str]]) -> str:
+    if "$" not in value:
+        return value
+
+    def replace(match):
+        name = match.group(1) or match.group(4)
+        operator, word = match.group(2), match.group(3)
+        current = args.get(name)
+
+        if operator == "-":
+            return current or word
+        if operator == "+":
+            return word if current else ""
+        return current or ""
+
+    return VARIABLE_PATTERN.sub(replace, value)
@@ -0,0 +1,49 @@
+import typing as T
+
+
+class ExtractionResult(T.NamedTuple):
+    """Images found on a repository's commit, as yielded by the extractor services
+
+    `data` maps each Dockerfile path to its images, and is None when the repository's
+    tree couldn't be listed. `errors` is then that error's message; otherwise it maps the
+    paths of the Dockerfiles that couldn't be read to their error.
+    """
+    repo: str
+    sha: str
+    data: T.Optional[T.Dict[str, T.List[str]]]
+    errors: T.Union[str, T.Dict[str, str], None]
+
+    @property
+    def key(self) -> str:
+        return f"{self.repo}:{self.sha}"
+
+    def to_dict(self) -> T.Dict:
+        return {"repo": self.repo, "sha": self.sha, "data": self.data, "errors": self.errors}
+
+    @classmethod
+    def from_dict(cls, d: T.Dict) -> "ExtractionResult":
+        return cls(d["repo"], d["sha"], d["data"], d["errors"])
+
+
+def collect_results(results: T.Iterable[ExtractionResult]) -> T.Dict:
+    """Gathers results into a single `{"data", "errors"}` document"""
+    data = {}
+    errors = {}
+
+    for result in results:
+        add_result(data, errors, result)
+
+    return {"data": data, "errors": errors}
+
+
+def add_result(data: T.Dict, errors: T.Dict, result: ExtractionResult):
+    key = result.key
+
+    if result.data is not None:
+        data[key] = result.data
+
+    if result.errors:
+        if isinstance(result.errors, dict):
+            errors.setdefault(key, {}).update(result.errors)
+        else:
+            errors[key] = result.errors
@@ -0,0 +1,149 @@
+import threading
+import time
+import typing as T
+from urllib.parse import urlsplit
+
+
+# Github asks to wait at least a minute when hitting a secondary rate limit without `Retry-After`
+DEFAULT_RETRY_AFTER = 60
+RATE_LIMITED_STATUSES = (403, 429)
+# Github's rate limit resources: GraphQL queries have their own budget, apart from the REST API's
+CORE_RESOURCE = "core"
+GRAPHQL_RESOURCE = "graphql"
+
+
+def request_resource(url: str) -> str:
+    """Rate limit resource a request to `url` counts against, before github names it in `X-RateLimit-Resource`"""
+    if urlsplit(url).path.rstrip("/").endswith("/graphql"):
+        return GRAPHQL_RESOURCE
+    return CORE_RESOURCE
+
+
+class HostBudget:
+    """Token bucket for the requests sent to a single host and rate limit resource
+
+    Until the host answers with `X-RateLimit-*` headers there's no known budget and
+    requests are only held back by `blocked_until`. Once known, the bucket refills at the
+    rate that spreads the remaining budget evenly until the reset time, and holds at most
+    `capacity` tokens so that bursts stay short.
+    """
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.tokens = 0.0
+        self.rate = None
+        self.reset = None
+        self.updated = None
+        self.blocked_until = 0.0
+
+    def observe(self, remaining: int, reset: float, now: float):
+        if self.rate is None:
+            self.tokens = min(self.capacity, remaining)
+        else:
+            self._refill(now)
+            self.tokens = min(self.tokens, remaining)
+
+        self.reset = reset
+        self.updated = now
+        self.rate = remaining / max(reset - now, 1)
+
+        if remaining <= 0:
+            self.blocked_until = max(self.blocked_until, reset)
+
+    def reserve(self, now: float) -> float:
+        if self.rate is not None and now >= self.reset:
+            # The window is over, so the budget is unknown (and most likely full) again
+            self.rate = None
+
+        start = max(now, self.blocked_until)
+        if self.rate is None:
+            return start - now
+
+        self._refill(now)
+        self.tokens -= 1
+        if self.tokens >= 0 or self.rate == 0:
+            return start - now
+
+        # Queue behind the requests that already borrowed tokens
+        return max(start, now + -self.tokens / self.rate) - now
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+class RateLimitScheduler:
+    """Paces the requests of every thread sharing a client according to github's rate limits
+
+    Every request reserves a slot with `acquire` (or `reserve` when the caller does the
+    waiting itself, as the asyncio clients do) and reports the response with `update`.
+    The scheduler reads `X-RateLimit-Remaining`/`X-RateLimit-Reset` to keep a token
+    bucket per host and rate limit resource, since github counts GraphQL queries apart
+    from REST calls (`X-RateLimit-Resource`). An exhausted budget on `403`/`429` responses
+    holds back the requests counted against it until the reset, while `Retry-After` (a
+    secondary rate limit, shared by every resource) holds back every request to the host.
+    """
+    def __init__(
+        self,
+        burst: int = 50,
+        clock: T.Callable[[], float] = time.time,
+        sleep: T.Callable[[float], None] = time.sleep
+    ):
+        self._burst = int(burst)
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._budgets = {}
+
+    def _budget(self, url: str, resource: str = None) -> HostBudget:
+        key = urlsplit(url).netloc, resource or request_resource(url)
+        if key not in self._budgets:
+            self._budgets[key] = HostBudget(self._burst)
+        return self._budgets[key]
+
+    def _host_budgets(self, url: str) -> T.List[HostBudget]:
+        host = urlsplit(url).netloc
+        return [budget for (budget_host, _), budget in self._budgets.items() if budget_host == host]
+
+    def reserve(self, url: str) -> float:
+        """Reserves a slot for a request to `url` and returns how long to wait for it"""
+        with self._lock:
+            return self._budget(url).reserve(self._clock())
+
+    def acquire(self, url: str):
+        delay = self.reserve(url)
+        if delay > 0:
+            self._sleep(delay)
+
+    def update(self, url: str, status: int, headers: T.Mapping) -> T.Optional[float]:
+        """Records a response and returns the delay before retrying it if it was rate limited"""
+        remaining = headers.get("X-RateLimit-Remaining")
+        reset = headers.get("X-RateLimit-Reset")
+        retry_after = headers.get("Retry-After")
+        resource = headers.get("X-RateLimit-Resource")
+
+        with self._lock:
+            now = self._clock()
+            budget = self._budget(url, resource)
+
+            if remaining is not None and reset is not None:
+                budget.observe(int(remaining), float(reset), now)
+
+            if status not in RATE_LIMITED_STATUSES:
+                return None
+
+            if retry_after is not None:
+                delay = float(retry_after)
+            elif remaining == "0" and reset is not None:
+                delay = float(reset) - now
+            elif status == 429:
+                delay = DEFAULT_RETRY_AFTER
+            else:
+                # A plain forbidden response, not a rate limit
+                return None
+
+            delay = max(delay, 0)
+            blocked = self._host_budgets(url) if retry_after is not None else [budget]
+            for blocked_budget in blocked:
+                blocked_budget.blocked_until = max(blocked_budget.blocked_until, now + delay)
+
+            return delay
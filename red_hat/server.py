@@ -0,0 +1,206 @@
+import asyncio
+from concurrent import futures
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import logging
+import posixpath
+import threading
+import typing as T
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from config import Config
+from red_hat.client import RepositoryListClient
+from red_hat.metrics import count_results
+from red_hat.mirror import GitMirrorClient, client_factory
+from red_hat.parsers import RepositoryListParser
+from red_hat.results import ExtractionResult
+from red_hat.services import AsyncExtractorService, ThreadedExtractorService, async_client_from, extractor_factory
+
+logger = logging.getLogger(__name__)
+
+
+CONTENT_TYPE = "application/x-ndjson"
+
+
+def _is_under(url: str, prefix: str) -> bool:
+    """Whether `url` has the scheme and host of `prefix`, and its path or one below it
+
+    Paths are normalised first, and those still going up a directory are never under any.
+    """
+    url, prefix = urlsplit(url), urlsplit(prefix)
+    if (url.scheme.lower(), url.netloc.lower()) != (prefix.scheme.lower(), prefix.netloc.lower()):
+        return False
+
+    path = posixpath.normpath(unquote(url.path) or "/")
+    if ".." in path.split("/"):
+        return False
+
+    base = prefix.path.rstrip("/")
+    return path == (base or "/") or path.startswith(base + "/")
+
+
+class ScanServer:
+    """Extractor that keeps running between scans, taking them over a local HTTP endpoint
+
+    The github client, with its sessions, rate limit budget and tree, blob and HTTP caches,
+    the repository list client and, for the `ThreadedExtractorService`, the worker pool are
+    created once and shared by every scan, so a small re-scan only pays for its requests.
+    For the `AsyncExtractorService`, an event loop keeps running along with an open
+    `AsyncGithubClient`, so that its connections are kept alive between scans too.
+
+    `POST /scan` scans the `repo sha` lines of its body, or the list at `?url=`, answering
+    with each repository's result as a line of JSON as soon as it's extracted. Lists are
+    fetched with the github credentials, so only `repository_list_url` and the urls under
+    `server_list_urls` are accepted. `GET /health` answers `ok`.
+    """
+    def __init__(self, config: Config):
+        self._config = config
+        self.client = client_factory(config)
+        self.list_client = RepositoryListClient(config)
+        self.service = extractor_factory(config)
+
+        self._executor = None
+        if issubclass(self.service, ThreadedExtractorService):
+            self._executor = futures.ThreadPoolExecutor(self.service.workers(config))
+
+        self._loop = self._loop_thread = self.async_client = None
+        if issubclass(self.service, AsyncExtractorService) and not isinstance(self.client, GitMirrorClient):
+            self._loop = asyncio.new_event_loop()
+            self._loop_thread = threading.Thread(target=self._loop.run_forever, name="scan-loop", daemon=True)
+            self._loop_thread.start()
+
+            self.async_client = async_client_from(self.client, config)
+            asyncio.run_coroutine_threadsafe(self.async_client.__aenter__(), self._loop).result()
+
+        self._server = ThreadingHTTPServer((config.server_host, config.server_port), self._handler())
+        self._server.daemon_threads = True
+        self._serving = False
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def allows(self, url: str) -> bool:
+        """Whether the list at `url` may be fetched"""
+        allowed = list(self._config.server_list_urls)
+        if self._config.repository_list_url:
+            allowed.append(self._config.repository_list_url)
+
+        return any(_is_under(url, prefix) for prefix in allowed)
+
+    def repositories(self, url: str = None, lines: T.Iterable[str] = ()) -> T.Iterator[T.Tuple]:
+        """Streams the list at `url` if given, or validates `lines` otherwise"""
+        parser = RepositoryListParser()
+        if url:
+            return self.list_client.iter_repositories(parser, url)
+
+        return parser.parse_lines(lines)
+
+    def scan(self, repos: T.Iterable[T.Tuple]) -> T.Iterator[ExtractionResult]:
+        if self._executor is not None:
+            results = self.service.iter_images_from(repos, self._config, self.client, executor=self._executor)
+        elif self._loop is not None:
+            results = self.service.iter_images_from(repos, self._config, self.async_client, loop=self._loop)
+        else:
+            results = self.service.iter_images_from(repos, self._config, self.client)
+
+        return count_results(results)
+
+    def _handler(self) -> T.Type[BaseHTTPRequestHandler]:
+        server = self
+
+        class ScanHandler(BaseHTTPRequestHandler):
+            # Keep connections alive between scans, sending the results in chunks as they come
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                if urlsplit(self.path).path != "/health":
+                    self.send_error(404)
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain")
+                self.send_header("Content-Length", "3")
+                self.end_headers()
+                self.wfile.write(b"ok\n")
+
+            def do_POST(self):
+                url = urlsplit(self.path)
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+                if url.path != "/scan":
+                    self.send_error(404)
+                    return
+
+                list_url = parse_qs(url.query).get("url", [None])[0]
+                if not list_url and not body.strip():
+                    self.send_error(400, explain="Expecting `repo sha` lines or a list url")
+                    return
+
+                if list_url and not server.allows(list_url):
+                    self.send_error(400, explain="List url isn't under any of server_list_urls")
+                    return
+
+                try:
+                    repos = server.repositories(list_url, body.decode().splitlines())
+                except Exception as e:
+                    logger.exception(e)
+                    self.send_error(502, explain=str(e))
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+
+                try:
+                    for result in server.scan(repos):
+                        self._write_chunk(json.dumps(result.to_dict()).encode() + b"\n")
+                    self._write_chunk(b"")
+                except Exception as e:
+                    # The response is cut short without its last chunk, so the client sees it failed
+                    logger.exception(e)
+                    self.close_connection = True
+
+            def _write_chunk(self, data: bytes):
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.flush()
+
+            def log_message(self, *args):
+                pass
+
+        return ScanHandler
+
+    def serve_forever(self):
+        self._serving = True
+        self._server.serve_forever()
+
+    def start(self):
+        """Serves from a background thread"""
+        self._serving = True
+        threading.Thread(target=self._server.serve_forever, name="scan-server", daemon=True).start()
+
+    def close(self):
+        if self._serving:
+            self._server.shutdown()
+        self._server.server_close()
+
+        if self._executor is not None:
+            self._executor.shutdown()
+
+        if self._loop is not None:
+            asyncio.run_coroutine_threadsafe(self.async_client.__aexit__(None, None, None), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._loop_thread.join()
+            self._loop.close()
+
+        if isinstance(self.client, GitMirrorClient):
+            self.client.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
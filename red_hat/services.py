@@ -1,25 +1,122 @@
 import abc
+import asyncio
 from concurrent import futures
+import contextlib
+import functools
+import inspect
 import logging
 import typing as T
 import os
 import queue
+import threading
 
 from config import Config
 
 from red_hat import GithubClient
+from red_hat.cache import CACHEABLE_ERROR_STATUSES, TreeCache
+from red_hat.client import AsyncGithubClient, TreeEntry, _exclusions, is_excluded
+from red_hat.journal import Journal
+from red_hat.metrics import STAGE_DURATION
+from red_hat.mirror import AsyncGitMirrorClient, GitMirrorClient
 from red_hat.parsers import DockerfileParser
+from red_hat.results import ExtractionResult, collect_results
+from red_hat.tracing import span
 from red_hat.utils import extract_repository_from_url
 
 logger = logging.getLogger(__name__)
 
 
+# Github lists at most this many files when comparing commits
+COMPARE_MAX_FILES = 300
+# Comparisons whose files are the changes from the base commit itself
+COMPARABLE_STATUSES = ("ahead", "identical")
+
+
+def is_dockerfile(path: str) -> bool:
+    return "dockerfile" in os.path.basename(path).lower()
+
+
+def images_from_statements(statements: T.List[T.Tuple]) -> T.List:
+    return list(
+        map(
+            lambda x: x[0],
+            filter(
+                lambda x: len(x) > 0,
+                statements
+            )
+        )
+    )
+
+
+def error_status(error: Exception) -> T.Optional[int]:
+    response = getattr(error, "response", None)
+    if response is not None:
+        return response.status_code
+    # aiohttp's ClientResponseError
+    return getattr(error, "status", None)
+
+
+def cached_search(cache: TreeCache, owner: str, repo_name: str, sha: str) -> T.Optional[T.List]:
+    entries = cache.get(owner, repo_name, sha)
+    if entries is None:
+        return None
+
+    return [TreeEntry(path, blob_sha) for path, blob_sha in entries]
+
+
+def cache_search_error(cache: TreeCache, owner: str, repo_name: str, sha: str, error: Exception):
+    status = error_status(error)
+    if status in CACHEABLE_ERROR_STATUSES:
+        cache.put_error(owner, repo_name, sha, str(error), status)
+
+
+def cache_search(cache: TreeCache, owner: str, repo_name: str, sha: str, paths: T.List):
+    cache.put(owner, repo_name, sha, ((path, getattr(path, "sha", None)) for path in paths))
+
+
+def iter_dockerfiles(owner: str, repo_name: str, sha: str, client: GithubClient) -> T.Iterator:
+    """Yields the Dockerfiles of a commit's tree as they're found
+
+    Clients with an `iter_repository_files` stream the tree, so that the first Dockerfiles
+    come out before the rest of it has been read. The whole list goes to the tree cache
+    once the tree has been read in full.
+    """
+    cache = getattr(client, "tree_cache", None)
+    if cache is not None:
+        paths = cached_search(cache, owner, repo_name, sha)
+        if paths is not None:
+            yield from paths
+            return
+
+    paths = []
+    try:
+        with STAGE_DURATION.time(stage="tree"), span("list", "tree", repo=f"{owner}/{repo_name}"):
+            stream = getattr(client, "iter_repository_files", None)
+            if stream is not None:
+                files = stream(owner, repo_name, sha, is_dockerfile)
+            else:
+                files = filter(is_dockerfile, client.list_repository_files(owner, repo_name, sha))
+
+            for path in files:
+                paths.append(path)
+                yield path
+    except Exception as e:
+        if cache is not None:
+            cache_search_error(cache, owner, repo_name, sha, e)
+        raise
+
+    if cache is not None:
+        cache_search(cache, owner, repo_name, sha, paths)
+
+
 def search_for_dockerfile(owner: str, repo_name: str, sha: str, client: GithubClient) -> T.List:
-    paths = client.list_repository_files(owner, repo_name, sha)
-    return list(filter(lambda x: "dockerfile" in os.path.basename(x).lower(), paths))
+    return list(iter_dockerfiles(owner, repo_name, sha, client))
 
 
 def extract_from_paths(owner: str, repo_name: str, sha: str, paths: str, client: GithubClient) -> T.Dict:
+    if getattr(client, "supports_batch", False):
+        return extract_from_paths_batched(owner, repo_name, sha, paths, client)
+
     result = {}
     errors = {}
     for path in paths:
@@ -32,119 +129,750 @@ def extract_from_paths(owner: str, repo_name: str, sha: str, paths: str, client:
     return result, errors
 
 
-def extract_from_dockerfile(owner: str, repo_name: str, sha: str, path: str, client: GithubClient) -> T.Dict:
-    statements = client.get_dockerfile(owner, repo_name, sha, path, parser=DockerfileParser())
+def blob_cache_key(parser: DockerfileParser, path: str, blob_sha: str = None) -> T.Optional[str]:
+    blob_sha = blob_sha or getattr(path, "sha", None)
+    if not blob_sha:
+        return None
 
-    return list(
-        map(
-            lambda x: x[0],
-            filter(
-                lambda x: len(x) > 0,
-                statements
-            )
-        )
+    return f"{type(parser).__name__}.{getattr(parser, 'version', 1)}:{blob_sha}"
+
+
+def extract_from_dockerfile(
+    owner: str,
+    repo_name: str,
+    sha: str,
+    path: str,
+    client: GithubClient,
+    blob_sha: str = None
+) -> T.Dict:
+    """Returns the images used by a Dockerfile
+
+    `blob_sha` defaults to the one carried by `path` when it's a `TreeEntry`, and is used
+    to serve byte-identical Dockerfiles from the client's blob cache.
+    """
+    parser = DockerfileParser()
+    cache = getattr(client, "blob_cache", None)
+    key = blob_cache_key(parser, path, blob_sha)
+
+    statements = cache.get(key) if cache is not None and key else None
+    if statements is None:
+        statements = client.get_dockerfile(owner, repo_name, sha, path, parser=parser)
+
+        if cache is not None and key:
+            cache.put(key, statements)
+
+    return images_from_statements(statements)
+
+
+def split_cached(paths: T.Iterable[str], parser: DockerfileParser, client: GithubClient) -> T.Tuple[T.Dict, T.List]:
+    """Splits `paths` into the images of those in the blob cache and those yet to fetch"""
+    cache = getattr(client, "blob_cache", None)
+    result = {}
+    missing = []
+
+    for path in paths:
+        key = blob_cache_key(parser, path)
+        statements = cache.get(key) if cache is not None and key else None
+
+        if statements is None:
+            missing.append(path)
+        else:
+            result[path] = images_from_statements(statements)
+
+    return result, missing
+
+
+def collect_batch(
+    paths: T.List[str],
+    outcomes: T.List,
+    parser: DockerfileParser,
+    client: GithubClient,
+    result: T.Dict,
+    errors: T.Dict
+):
+    cache = getattr(client, "blob_cache", None)
+
+    for path, outcome in zip(paths, outcomes):
+        if isinstance(outcome, Exception):
+            logger.error("Could not fetch %s: %s", path, outcome)
+            errors[path] = str(outcome)
+            continue
+
+        key = blob_cache_key(parser, path)
+        if cache is not None and key:
+            cache.put(key, outcome)
+
+        result[path] = images_from_statements(outcome)
+
+
+def extract_from_paths_batched(
+    owner: str,
+    repo_name: str,
+    sha: str,
+    paths: str,
+    client: GithubClient
+) -> T.Tuple[T.Dict, T.Dict]:
+    """Same as `extract_from_paths`, but fetches the Dockerfiles in GraphQL batches"""
+    parser = DockerfileParser()
+    result, missing = split_cached(paths, parser, client)
+    errors = {}
+
+    if missing:
+        try:
+            outcomes = client.get_dockerfiles([(owner, repo_name, sha, path) for path in missing], parser)
+        except Exception as e:
+            logger.exception(e)
+            outcomes = [e] * len(missing)
+
+        collect_batch(missing, outcomes, parser, client, result, errors)
+
+    return result, errors
+
+
+def is_reusable(previous: T.Optional[ExtractionResult]) -> bool:
+    return previous is not None and previous.data is not None and not previous.errors
+
+
+def apply_comparison(
+    data: T.Dict[str, T.List[str]],
+    comparison: T.Dict,
+    config: Config
+) -> T.Optional[T.Tuple[T.Dict, T.List[TreeEntry]]]:
+    """Carries a previous result's images forward through the changes of a comparison
+
+    Returns the images of the Dockerfiles left untouched (or just moved) along with the
+    Dockerfiles that were added or modified, or None when the comparison doesn't tell
+    every change from the previous commit.
+    """
+    files = comparison.get("files") or []
+    if comparison.get("status") not in COMPARABLE_STATUSES or len(files) >= COMPARE_MAX_FILES:
+        return None
+
+    exclude = _exclusions(config)
+    data = dict(data)
+    changed = []
+
+    for file in files:
+        path = file["filename"]
+        images = data.pop(path, None)
+
+        if file["status"] == "renamed" and file.get("previous_filename"):
+            images = data.pop(file["previous_filename"], None)
+
+        if file["status"] == "removed" or not is_dockerfile(path) or is_excluded(path, exclude):
+            continue
+
+        if file["status"] == "renamed" and not file.get("changes") and images is not None:
+            data[path] = images
+        else:
+            changed.append(TreeEntry(path, file.get("sha")))
+
+    return data, changed
+
+
+def rescan_repository(
+    repo: str,
+    sha: str,
+    previous: T.Optional[ExtractionResult],
+    config: Config,
+    client: GithubClient
+) -> T.Optional[ExtractionResult]:
+    """Brings a previous run's result of `repo` up to `sha`, only fetching what changed
+
+    Returns None when the repository has to be scanned in full: the previous result is
+    missing or failed, the client can't compare commits, or the comparison doesn't tell
+    every change (see `apply_comparison`).
+    """
+    if not is_reusable(previous):
+        return None
+
+    if previous.sha == sha:
+        return previous
+
+    if not hasattr(client, "compare_commits"):
+        return None
+
+    owner, repo_name = extract_repository_from_url(repo)
+    try:
+        comparison = client.compare_commits(owner, repo_name, previous.sha, sha)
+    except Exception as e:
+        logger.warning("Could not compare %s from %s to %s, scanning it in full: %s", repo, previous.sha, sha, e)
+        return None
+
+    changes = apply_comparison(previous.data, comparison, config)
+    if changes is None:
+        return None
+
+    data, changed = changes
+    images, err = extract_from_paths(owner, repo_name, sha, changed, client)
+    data.update(images)
+
+    return ExtractionResult(repo, sha, data, err)
+
+
+async def async_search_for_dockerfile(owner: str, repo_name: str, sha: str, client: AsyncGithubClient) -> T.List:
+    cache = getattr(client, "tree_cache", None)
+    if cache is not None:
+        paths = cached_search(cache, owner, repo_name, sha)
+        if paths is not None:
+            return paths
+
+    try:
+        with STAGE_DURATION.time(stage="tree"), span("list", "tree", repo=f"{owner}/{repo_name}"):
+            paths = list(filter(is_dockerfile, await client.list_repository_files(owner, repo_name, sha)))
+    except Exception as e:
+        if cache is not None:
+            cache_search_error(cache, owner, repo_name, sha, e)
+        raise
+
+    if cache is not None:
+        cache_search(cache, owner, repo_name, sha, paths)
+
+    return paths
+
+
+async def async_extract_from_paths(
+    owner: str,
+    repo_name: str,
+    sha: str,
+    paths: str,
+    client: AsyncGithubClient
+) -> T.Dict:
+    if getattr(client, "supports_batch", False):
+        return await async_extract_from_paths_batched(owner, repo_name, sha, paths, client)
+
+    paths = list(paths)
+    outcomes = await asyncio.gather(
+        *(async_extract_from_dockerfile(owner, repo_name, sha, path, client) for path in paths),
+        return_exceptions=True
     )
 
+    result = {}
+    errors = {}
+    for path, outcome in zip(paths, outcomes):
+        if isinstance(outcome, Exception):
+            logger.exception(outcome, exc_info=outcome)
+            errors[path] = str(outcome)
+        else:
+            result[path] = outcome
+
+    return result, errors
+
+
+async def async_extract_from_dockerfile(
+    owner: str,
+    repo_name: str,
+    sha: str,
+    path: str,
+    client: AsyncGithubClient,
+    blob_sha: str = None
+) -> T.Dict:
+    parser = DockerfileParser()
+    cache = getattr(client, "blob_cache", None)
+    key = blob_cache_key(parser, path, blob_sha)
+
+    statements = cache.get(key) if cache is not None and key else None
+    if statements is None:
+        statements = await client.get_dockerfile(owner, repo_name, sha, path, parser=parser)
+
+        if cache is not None and key:
+            cache.put(key, statements)
+
+    return images_from_statements(statements)
+
+
+async def async_extract_from_paths_batched(
+    owner: str,
+    repo_name: str,
+    sha: str,
+    paths: str,
+    client: AsyncGithubClient
+) -> T.Tuple[T.Dict, T.Dict]:
+    parser = DockerfileParser()
+    result, missing = split_cached(paths, parser, client)
+    errors = {}
+
+    if missing:
+        try:
+            outcomes = await client.get_dockerfiles([(owner, repo_name, sha, path) for path in missing], parser)
+        except Exception as e:
+            logger.exception(e)
+            outcomes = [e] * len(missing)
+
+        collect_batch(missing, outcomes, parser, client, result, errors)
+
+    return result, errors
+
+
+async def async_rescan_repository(
+    repo: str,
+    sha: str,
+    previous: T.Optional[ExtractionResult],
+    config: Config,
+    client: AsyncGithubClient
+) -> T.Optional[ExtractionResult]:
+    """Same as `rescan_repository`"""
+    if not is_reusable(previous):
+        return None
+
+    if previous.sha == sha:
+        return previous
+
+    if not hasattr(client, "compare_commits"):
+        return None
+
+    owner, repo_name = extract_repository_from_url(repo)
+    try:
+        comparison = await client.compare_commits(owner, repo_name, previous.sha, sha)
+    except Exception as e:
+        logger.warning("Could not compare %s from %s to %s, scanning it in full: %s", repo, previous.sha, sha, e)
+        return None
+
+    changes = apply_comparison(previous.data, comparison, config)
+    if changes is None:
+        return None
+
+    data, changed = changes
+    images, err = await async_extract_from_paths(owner, repo_name, sha, changed, client)
+    data.update(images)
+
+    return ExtractionResult(repo, sha, data, err)
+
+
+def async_client_from(client: GithubClient, config: Config) -> AsyncGithubClient:
+    """An `AsyncGithubClient` sharing the rate limit budget, concurrency limits and caches of `client`"""
+    async_client = AsyncGithubClient(
+        config=config,
+        scheduler=getattr(client, "scheduler", None),
+        concurrency=getattr(client, "concurrency", None)
+    )
+    # Keep using the caches the blocking client already warmed up
+    async_client.tree_cache = getattr(client, "tree_cache", async_client.tree_cache)
+    async_client.blob_cache = getattr(client, "blob_cache", async_client.blob_cache)
+
+    return async_client
+
+
+async def iterate_without_blocking(items: T.Iterable) -> T.AsyncIterator:
+    """Iterates `items` in a worker thread, since lazy iterables may block on the network"""
+    if isinstance(items, (list, tuple)):
+        for item in items:
+            yield item
+        return
+
+    loop = asyncio.get_running_loop()
+    iterator = iter(items)
+    end = object()
+
+    while True:
+        item = await loop.run_in_executor(None, next, iterator, end)
+        if item is end:
+            return
+        yield item
+
 
 class ExtractorService(abc.ABC):
     @classmethod
     @abc.abstractmethod
-    def extract_images_from(cls, repos: T.Iterable[T.Tuple], config: Config, client: GithubClient) -> T.Dict:
+    def iter_images_from(
+        cls,
+        repos: T.Iterable[T.Tuple],
+        config: Config,
+        client: GithubClient,
+        previous: T.Mapping[str, ExtractionResult] = None
+    ) -> T.Iterator[ExtractionResult]:
+        """Yields each repository's results as soon as they're ready
+
+        `previous` maps repositories to their result on a previous run. Those on the same
+        commit are yielded as they were, while those re-pinned to a descendant commit only
+        get the Dockerfiles changed since then fetched (see `rescan_repository`).
+        """
         pass
 
+    @classmethod
+    def extract_images_from(
+        cls,
+        repos: T.Iterable[T.Tuple],
+        config: Config,
+        client: GithubClient,
+        previous: T.Mapping[str, ExtractionResult] = None
+    ) -> T.Dict:
+        return collect_results(cls.iter_images_from(repos, config, client, previous))
+
+    @classmethod
+    def resume_images_from(
+        cls,
+        repos: T.Iterable[T.Tuple],
+        config: Config,
+        client: GithubClient,
+        journal: Journal,
+        previous: T.Mapping[str, ExtractionResult] = None
+    ) -> T.Iterator[ExtractionResult]:
+        """Same as `iter_images_from`, skipping the repositories already in the journal
+
+        Their recorded results are yielded instead, as `repos` reaches them, so that results
+        journaled for repositories no longer listed aren't. Results without errors are
+        recorded as they're yielded, while failed repositories are left to retry on the
+        next run.
+        """
+        done = journal.load()
+        # Filled by whichever thread reads `repos`, as it skips them
+        replayed = queue.SimpleQueue()
+
+        def pending():
+            skipped = set()
+            for repo, sha in repos:
+                key = f"{repo}:{sha}"
+                if key not in done:
+                    yield repo, sha
+                elif key not in skipped:
+                    skipped.add(key)
+                    replayed.put(done[key])
+
+        def drain():
+            while not replayed.empty():
+                yield replayed.get()
+
+        for result in cls.iter_images_from(pending(), config, client, previous):
+            yield from drain()
+
+            if not result.errors:
+                journal.record(result)
+            yield result
+
+        yield from drain()
+
 
-class SequentialExtractorService(abc.ABC):
+class SequentialExtractorService(ExtractorService):
     @classmethod
-    def extract_images_from(cls, repos: T.Iterable[T.Tuple], config: Config, client: GithubClient) -> T.Dict:
-        data = {}
-        errors = {}
+    def iter_images_from(
+        cls,
+        repos: T.Iterable[T.Tuple],
+        config: Config,
+        client: GithubClient,
+        previous: T.Mapping[str, ExtractionResult] = None
+    ) -> T.Iterator[ExtractionResult]:
+        previous = previous or {}
+
+        def extract(repo, sha):
+            result = rescan_repository(repo, sha, previous.get(repo), config, client)
+            if result is not None:
+                return result
 
-        for repo, sha in repos:
-            key = f"{repo}:{sha}"
             owner, repo_name = extract_repository_from_url(repo)
             try:
                 paths = search_for_dockerfile(owner, repo_name, sha, client)
             except Exception as e:
                 logger.exception(e)
-                errors[key] = str(e)
-                continue
+                return ExtractionResult(repo, sha, None, str(e))
 
             images, err = extract_from_paths(owner, repo_name, sha, paths, client)
 
-            if err:
-                if key not in errors:
-                    errors[key] = {}
-                for path in err:
-                    errors[key][path] = err[path]
+            return ExtractionResult(repo, sha, images, err)
 
-            data[key] = images
+        for repo, sha in repos:
+            with span("repository", "repository", repo=repo, sha=sha):
+                result = extract(repo, sha)
+
+            yield result
+
+
+class PendingRepository:
+    """Results of a repository gathered as the tasks fetching its Dockerfiles complete
+
+    Dockerfiles are fetched while the tree is still being listed, so tasks are counted as
+    they're started, on top of the `tasks` already running (such as the listing itself).
+    """
+    def __init__(self, repo: str, sha: str, data: T.Dict, tasks: int):
+        self.repo = repo
+        self.sha = sha
+        self.data = data
+        self.errors = {}
+        self.error = None
+        self._remaining = tasks
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            self._remaining += 1
+
+    def fail(self, error: str):
+        """Fails the whole repository, as when its tree couldn't be listed"""
+        with self._lock:
+            self.error = error
+
+    def add(self, data: T.Dict, errors: T.Dict) -> T.Optional[ExtractionResult]:
+        """Adds the outcome of a task, returning the repository's result once it was the last one"""
+        with self._lock:
+            self.data.update(data)
+            self.errors.update(errors)
+            self._remaining -= 1
+
+            if self._remaining == 0:
+                if self.error is not None:
+                    return ExtractionResult(self.repo, self.sha, None, self.error)
+                return ExtractionResult(self.repo, self.sha, self.data, self.errors)
+
+        return None
+
+
+class ThreadedExtractorService(ExtractorService):
+    """Runs the extraction as a pipeline of tasks on a pool of `thread_pool_size` threads
+
+    Listing a repository's tree is a task, and so is fetching each of its Dockerfiles (or
+    each GraphQL batch of them when batching). The listing hands each Dockerfile over as
+    soon as it's found in the streamed tree, and the other tasks are chained through
+    completion callbacks, so no worker ever waits on another task, and the Dockerfiles
+    of a monorepo are fetched concurrently rather than one after another. At most
+    `PIPELINE_DEPTH` times `thread_pool_size` repositories are in flight, so that long
+    (or streamed) lists are only read as fast as the pipeline drains.
+
+    With `adaptive_concurrency`, the pool has `adaptive_concurrency_max` threads while
+    the client's limits decide how many of them have a request in flight.
+
+    A long-lived `executor` of that many threads can be given instead, to be shared by
+    successive (or concurrent) extractions without starting a pool for each of them.
+    """
+    PIPELINE_DEPTH = 4
+
+    @staticmethod
+    def workers(config: Config) -> int:
+        # With adaptive concurrency, the client decides how many requests go out at once
+        return config.adaptive_concurrency_max if config.adaptive_concurrency else config.thread_pool_size
 
-        return {"data": data, "errors": errors}
+    @classmethod
+    def iter_images_from(
+        cls,
+        repos: T.Iterable[T.Tuple],
+        config: Config,
+        client: GithubClient,
+        previous: T.Mapping[str, ExtractionResult] = None,
+        executor: futures.Executor = None
+    ) -> T.Iterator[ExtractionResult]:
+        previous = previous or {}
+        completed = queue.Queue()
+        parser = DockerfileParser()
+        chunk_size = config.graphql_batch_size if getattr(client, "supports_batch", False) else 1
+
+        def search(executor, repo, sha):
+            with span("search", "repository", repo=repo, sha=sha):
+                result = rescan_repository(repo, sha, previous.get(repo), config, client)
+                if result is not None:
+                    return result
+
+                owner, repo_name = extract_repository_from_url(repo)
+                # The listing counts as a task until the whole tree has been read
+                pending = PendingRepository(repo, sha, {}, 1)
+                data = {}
+                chunk = []
+
+                def fetch(paths):
+                    pending.start()
+                    executor.submit(extract, owner, repo_name, sha, paths).add_done_callback(
+                        functools.partial(extracted, pending, paths)
+                    )
+
+                try:
+                    for path in iter_dockerfiles(owner, repo_name, sha, client):
+                        cached, missing = split_cached([path], parser, client)
+                        data.update(cached)
+                        chunk.extend(missing)
+
+                        if len(chunk) >= chunk_size:
+                            fetch(chunk)
+                            chunk = []
+
+                    if chunk:
+                        fetch(chunk)
+                except Exception as e:
+                    logger.exception(e)
+                    pending.fail(str(e))
+
+                return pending.add(data, {})
+
+        def extract(owner, repo_name, sha, paths):
+            with span("extract", "repository", repo=f"{owner}/{repo_name}", sha=sha, dockerfiles=len(paths)):
+                return extract_from_paths(owner, repo_name, sha, paths, client)
+
+        def searched(repo, sha, future):
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.exception(e)
+                result = ExtractionResult(repo, sha, None, str(e))
 
+            if result is not None:
+                completed.put(result)
 
-class ThreadedExtractorService:
-    @classmethod
-    def extract_images_from(cls, repos: T.Iterable[T.Tuple], config: Config, client: GithubClient) -> T.Dict:
-        def extract_paths(repo, sha):
-            owner, repo_name = extract_repository_from_url(repo)
+        def extracted(pending, chunk, future):
             try:
-                paths = search_for_dockerfile(owner, repo_name, sha, client)
+                data, errors = future.result()
             except Exception as e:
-                error = (repo, sha, e)
-                return error
+                logger.exception(e)
+                data, errors = {}, {path: str(e) for path in chunk}
 
-            return (repo, sha, paths)
+            result = pending.add(data, errors)
+            if result is not None:
+                completed.put(result)
 
-        def extract_dockerfiles(future):
-            item = future.result()
+        workers = cls.workers(config)
+        in_flight = 0
+        max_in_flight = cls.PIPELINE_DEPTH * workers
 
-            repo, sha, paths = item
+        pool = contextlib.nullcontext(executor) if executor is not None else futures.ThreadPoolExecutor(workers)
+        with pool as executor:
+            for repo, sha in repos:
+                # Wait for the pipeline to drain before reading any further
+                while in_flight >= max_in_flight:
+                    in_flight -= 1
+                    yield completed.get()
+
+                executor.submit(search, executor, repo, sha).add_done_callback(
+                    functools.partial(searched, repo, sha)
+                )
+                in_flight += 1
+
+                # Hand out what's already done while the list is still being read
+                while not completed.empty():
+                    in_flight -= 1
+                    yield completed.get()
+
+            for _ in range(in_flight):
+                yield completed.get()
+
+
+class AsyncExtractorService(ExtractorService):
+    """Runs the extraction on an event loop instead of a thread pool
+
+    Every repository and every Dockerfile is a task, while the number of requests in
+    flight is bounded by the client (`async_concurrency`). When given a blocking client,
+    such as the `GithubClient` built by `app.py`, an `AsyncGithubClient` is created
+    from the configuration so that switching engines only takes `extractor_class`.
+
+    `iter_images_from` runs the event loop in a separate thread, or the extraction on the
+    running `loop` if given, handing each result over to the calling one as it completes.
+    An `AsyncGithubClient` that's already open is left open, to be shared between runs on
+    the same `loop`.
+    """
+    @classmethod
+    def iter_images_from(
+        cls,
+        repos: T.Iterable[T.Tuple],
+        config: Config,
+        client: T.Union[GithubClient, AsyncGithubClient],
+        previous: T.Mapping[str, ExtractionResult] = None,
+        loop: asyncio.AbstractEventLoop = None
+    ) -> T.Iterator[ExtractionResult]:
+        results = queue.Queue()
+        end = object()
+
+        async def produce():
+            async for result in cls.async_iter_images_from(repos, config, client, previous):
+                results.put(result)
+
+        def run():
+            try:
+                asyncio.run(produce())
+            except BaseException as e:
+                results.put(e)
+            finally:
+                results.put(end)
+
+        def produced(future: futures.Future):
+            if not future.cancelled() and future.exception() is not None:
+                results.put(future.exception())
+            results.put(end)
+
+        if loop is None:
+            threading.Thread(target=run, name="async-extractor", daemon=True).start()
+        else:
+            asyncio.run_coroutine_threadsafe(produce(), loop).add_done_callback(produced)
+
+        while True:
+            result = results.get()
+            if result is end:
+                return
+            if isinstance(result, BaseException):
+                raise result
+            yield result
 
-            if isinstance(paths, Exception):
-                return (repo, sha, {}, str(paths))
+    @classmethod
+    async def async_extract_images_from(
+        cls,
+        repos: T.Iterable[T.Tuple],
+        config: Config,
+        client: T.Union[GithubClient, AsyncGithubClient],
+        previous: T.Mapping[str, ExtractionResult] = None
+    ) -> T.Dict:
+        return collect_results(
+            [result async for result in cls.async_iter_images_from(repos, config, client, previous)]
+        )
 
-            owner, repo_name = extract_repository_from_url(repo)
-            images, err = extract_from_paths(owner, repo_name, sha, paths, client)
+    @classmethod
+    async def async_iter_images_from(
+        cls,
+        repos: T.Iterable[T.Tuple],
+        config: Config,
+        client: T.Union[GithubClient, AsyncGithubClient],
+        previous: T.Mapping[str, ExtractionResult] = None
+    ) -> T.AsyncIterator[ExtractionResult]:
+        previous = previous or {}
+
+        if isinstance(client, GitMirrorClient):
+            client = AsyncGitMirrorClient(client)
+        elif not inspect.iscoroutinefunction(client.list_repository_files):
+            client = async_client_from(client, config)
+
+        async def extract(repo, sha):
+            result = await async_rescan_repository(repo, sha, previous.get(repo), config, client)
+            if result is not None:
+                return result
 
-            return (repo, sha, images, err)
+            owner, repo_name = extract_repository_from_url(repo)
+            try:
+                paths = await async_search_for_dockerfile(owner, repo_name, sha, client)
+            except Exception as e:
+                logger.exception(e)
+                return ExtractionResult(repo, sha, None, str(e))
 
-        # Launch threads
-        results = []
-        with futures.ThreadPoolExecutor(config.thread_pool_size) as executor:
-            for repo, sha in repos:
-                r = executor.submit(extract_paths, repo, sha)
-                results.append(executor.submit(extract_dockerfiles, r))
+            images, err = await async_extract_from_paths(owner, repo_name, sha, paths, client)
 
-        # Collect results and errors from the futures' results
-        data = {}
-        errors = {}
+            return ExtractionResult(repo, sha, images, err)
 
-        for result in results:
-            repo, sha, images, err = result.result()
+        async def traced_extract(repo, sha):
+            with span("repository", "repository", repo=repo, sha=sha):
+                return await extract(repo, sha)
 
-            key = f"{repo}:{sha}"
+        async def extract_all():
+            completed = asyncio.Queue()
+            pending = 0
 
-            if key not in data:
-                data[key] = {}
-            data[key] = images
+            # Start extracting each repository as soon as it's read from a streamed list
+            async for repo, sha in iterate_without_blocking(repos):
+                asyncio.ensure_future(traced_extract(repo, sha)).add_done_callback(completed.put_nowait)
+                pending += 1
 
-            if err:
-                if key not in errors:
-                    errors[key] = {}
+                while not completed.empty():
+                    pending -= 1
+                    yield completed.get_nowait().result()
 
-                if isinstance(err, dict):
-                    for path in err:
-                        errors[key][path] = err[path]
-                else:
-                    errors[key] = err
+            for _ in range(pending):
+                yield (await completed.get()).result()
 
-        return {"data": data, "errors": errors}
+        if isinstance(client, AsyncGithubClient) and not client.is_open:
+            async with client:
+                async for result in extract_all():
+                    yield result
+        else:
+            async for result in extract_all():
+                yield result
 
 
 def extractor_factory(config: Config) -> ExtractorService:
     services_map = {
         "SequentialExtractorService": SequentialExtractorService,
         "ThreadedExtractorService": ThreadedExtractorService,
+        "AsyncExtractorService": AsyncExtractorService,
     }
 
     assert config.extractor_class in services_map, (
@@ -0,0 +1,79 @@
+from dataclasses import replace
+import hashlib
+from itertools import chain
+import os
+import typing as T
+
+from config import Config
+from red_hat.results import collect_results
+from red_hat.sinks import read_results
+
+
+# Set by kubernetes on each pod of an Indexed Job
+JOB_COMPLETION_INDEX_ENVVAR = "JOB_COMPLETION_INDEX"
+# Files every shard would write to at once without a `{shard_index}` in their path
+SHARD_FILES = ("output_path", "journal_path")
+
+
+def shard_of(repo: str, sha: str, shard_count: int) -> int:
+    """Stable shard of a `(repo, sha)` pair, the same across processes and machines"""
+    digest = hashlib.sha1(f"{repo}:{sha}".encode()).digest()
+    return int.from_bytes(digest[:8], "big") % shard_count
+
+
+def select_shard(repos: T.Iterable[T.Tuple], shard_index: int, shard_count: int) -> T.Iterator[T.Tuple]:
+    for repo, sha in repos:
+        if shard_of(repo, sha, shard_count) == shard_index:
+            yield repo, sha
+
+
+def shard_settings(config: Config) -> Config:
+    """Resolves the settings of this process' shard
+
+    The shard index is taken from `shard_index` or, when unset, from the Indexed Job's
+    `JOB_COMPLETION_INDEX`. `{shard_index}` is replaced in `output_path`, `journal_path`,
+    `metrics_path` and `profile_path` so that each shard writes its own files, and the
+    shard picks its `id:secret` pair from `shard_credentials`, if any. The files in
+    `SHARD_FILES` must have the placeholder, unless `output_path` is stdout.
+    """
+    shard_count = config.shard_count
+    if shard_count <= 1:
+        return replace(config, shard_index=0, shard_count=1)
+
+    shard_index = config.shard_index
+    if shard_index is None:
+        shard_index = os.environ.get(JOB_COMPLETION_INDEX_ENVVAR)
+
+    if shard_index is None:
+        raise ValueError(f"shard_index or {JOB_COMPLETION_INDEX_ENVVAR} must be set when shard_count is over 1")
+
+    shard_index = int(shard_index)
+    if not 0 <= shard_index < shard_count:
+        raise ValueError(f"Shard index {shard_index} out of range for {shard_count} shards")
+
+    for name in SHARD_FILES:
+        path = getattr(config, name)
+        if path and path != "-" and "{shard_index}" not in path:
+            raise ValueError(f"{name} must contain {{shard_index}} when shard_count is over 1")
+
+    changes = dict(shard_index=shard_index, shard_count=shard_count)
+
+    for name in ("output_path", "journal_path", "metrics_path", "profile_path"):
+        path = getattr(config, name)
+        if path:
+            changes[name] = path.format(shard_index=shard_index)
+
+    credentials = config.shard_credentials or []
+    if isinstance(credentials, str):
+        credentials = credentials.split(",")
+
+    if credentials:
+        access_id, _, access_secret = credentials[shard_index % len(credentials)].strip().partition(":")
+        changes.update(github_access_id=access_id, github_access_secret=access_secret)
+
+    return replace(config, **changes)
+
+
+def merge_shards(paths: T.Iterable[str]) -> T.Dict:
+    """Combines the `jsonl` (or `sqlite`) outputs of every shard into a single `{"data", "errors"}` document"""
+    return collect_results(chain.from_iterable(read_results(path) for path in paths))
@@ -0,0 +1,136 @@
+import threading
+import time
+import typing as T
+
+from config import Config
+
+
+R = T.TypeVar("R")
+I = T.TypeVar("I")
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.finished = None
+
+
+class SingleFlight:
+    """Coalesces concurrent calls that share a key into a single one
+
+    The first call for a key runs, while those arriving before it finishes wait for it
+    and get its result (or its error). The outcome is remembered for `memo_ttl` seconds
+    afterwards, for the calls that arrive just after. At most `max_entries` outcomes are
+    remembered at once.
+    """
+    def __init__(self, memo_ttl: float = 5.0, max_entries: int = 10000):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._memo_ttl = float(memo_ttl)
+        self._max_entries = int(max_entries)
+        self.calls = 0
+        self.shared = 0
+
+    @classmethod
+    def from_config(cls, config: Config) -> T.Optional["SingleFlight"]:
+        if not config.single_flight:
+            return None
+
+        return cls(config.single_flight_memo_ttl)
+
+    def do(self, key: T.Hashable, fn: T.Callable[[], R]) -> R:
+        with self._lock:
+            self.calls += 1
+            call = self._calls.get(key)
+
+            if call is not None and call.finished is not None and time.monotonic() - call.finished > self._memo_ttl:
+                call = None
+
+            if call is None:
+                call = self._calls[key] = _Call()
+                owner = True
+            else:
+                self.shared += 1
+                owner = False
+
+        if owner:
+            self._run(call, fn)
+        else:
+            call.done.wait()
+
+        if call.error is not None:
+            raise call.error
+
+        return call.result
+
+    def _run(self, call: _Call, fn: T.Callable):
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+        finally:
+            with self._lock:
+                call.finished = time.monotonic()
+                self._evict()
+            call.done.set()
+
+    def _evict(self):
+        if len(self._calls) <= self._max_entries:
+            return
+
+        now = time.monotonic()
+        for key, call in list(self._calls.items()):
+            if call.finished is not None and now - call.finished > self._memo_ttl:
+                del self._calls[key]
+
+        # Still too many, so forget the oldest finished calls
+        finished = sorted(
+            ((call.finished, key) for key, call in self._calls.items() if call.finished is not None),
+            key=lambda item: item[0]
+        )
+        for _, key in finished[:len(self._calls) - self._max_entries]:
+            del self._calls[key]
+
+
+class Replay(T.Generic[I]):
+    """Iterable reading `iterable` once, however many times it's iterated over, even concurrently
+
+    Items are pulled from `iterable` by whichever iteration is furthest ahead and kept, so
+    that each iteration gets them as soon as they're read rather than once `iterable` is
+    exhausted. An error raised by `iterable` is raised again by each iteration reaching it.
+    """
+    def __init__(self, iterable: T.Iterable[I]):
+        self._lock = threading.Lock()
+        self._source = iter(iterable)
+        self._items = []
+        self._error = None
+        self._exhausted = False
+
+    def __iter__(self) -> T.Iterator[I]:
+        index = 0
+
+        while True:
+            if index < len(self._items):
+                yield self._items[index]
+                index += 1
+                continue
+
+            with self._lock:
+                if index == len(self._items) and not self._exhausted:
+                    self._pull()
+
+            if index == len(self._items):
+                if self._error is not None:
+                    raise self._error
+                return
+
+    def _pull(self):
+        try:
+            self._items.append(next(self._source))
+        except StopIteration:
+            self._exhausted = True
+        except Exception as e:
+            self._error = e
+            self._exhausted = True
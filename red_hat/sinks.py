@@ -0,0 +1,189 @@
+import abc
+import glob
+import gzip
+import json
+import queue
+import sys
+import threading
+import time
+import typing as T
+
+from config import Config
+from red_hat.database import ResultDatabase, is_database
+from red_hat.results import ExtractionResult
+
+
+STDOUT = "-"
+
+
+class Sink(abc.ABC):
+    """Destination of the results yielded by the extractor services"""
+    @abc.abstractmethod
+    def write(self, result: ExtractionResult):
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class JsonLinesSink(Sink):
+    """Writes each result as a line of JSON to a file (or stdout), optionally gzipped
+
+    Lines are flushed at most every `flush_interval` seconds, so that results become
+    visible while the run goes on without flushing (and breaking the gzip stream's
+    compression) on every single result.
+    """
+    def __init__(self, path: str = STDOUT, compress: bool = False, flush_interval: float = 1.0):
+        if not path or path == STDOUT:
+            self._file = None
+            stream = sys.stdout.buffer
+        else:
+            self._file = stream = open(path, "wb")
+
+        self._gzip = gzip.GzipFile(fileobj=stream, mode="wb") if compress else None
+        self._stream = self._gzip or stream
+        self._flush_interval = float(flush_interval)
+        self._flushed = time.monotonic()
+
+    def write(self, result: ExtractionResult):
+        self._stream.write(json.dumps(result.to_dict()).encode() + b"\n")
+
+        now = time.monotonic()
+        if now - self._flushed >= self._flush_interval:
+            self._stream.flush()
+            self._flushed = now
+
+    def close(self):
+        if self._gzip is not None:
+            self._gzip.close()
+
+        if self._file is not None:
+            self._file.close()
+        else:
+            sys.stdout.buffer.flush()
+
+
+class SqliteSink(Sink):
+    """Writes results into a `ResultDatabase`, as a new scan alongside the earlier ones
+
+    Results are handed over to a single writer thread, which inserts them in batches of
+    up to `batch_size` within a transaction, at least every `flush_interval` seconds, so
+    the extraction doesn't wait on the database.
+    """
+    _CLOSE = object()
+
+    def __init__(self, path: str, batch_size: int = 500, flush_interval: float = 1.0):
+        assert path and path != STDOUT, "The sqlite output needs an output_path"
+
+        self._database = ResultDatabase(path)
+        self.scan_id = self._database.start_scan()
+        self._batch_size = int(batch_size)
+        self._flush_interval = float(flush_interval)
+        self._queue = queue.Queue(maxsize=4 * self._batch_size)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name="sqlite-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, result: ExtractionResult):
+        if self._error is not None:
+            raise self._error
+
+        self._queue.put(result)
+
+    def _run(self):
+        batch = []
+        deadline = time.monotonic() + self._flush_interval
+
+        while True:
+            try:
+                item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                item = None
+
+            if item is not None and item is not self._CLOSE:
+                batch.append(item)
+
+            if batch and (item is None or item is self._CLOSE or len(batch) >= self._batch_size):
+                try:
+                    self._database.insert(self.scan_id, batch)
+                except Exception as e:
+                    self._error = e
+                batch = []
+
+            if item is None or not batch:
+                deadline = time.monotonic() + self._flush_interval
+
+            if item is self._CLOSE:
+                return
+
+    def close(self):
+        self._queue.put(self._CLOSE)
+        self._thread.join()
+
+        if self._error is None:
+            self._database.finish_scan(self.scan_id)
+        self._database.close()
+
+        if self._error is not None:
+            raise self._error
+
+
+def read_json_lines(path: str) -> T.Iterator[ExtractionResult]:
+    """Reads back the results written by a `JsonLinesSink`, gzipped or not"""
+    with open(path, "rb") as f:
+        compressed = f.read(2) == b"\x1f\x8b"
+
+    with (gzip.open(path, "rb") if compressed else open(path, "rb")) as f:
+        for line in f:
+            if line.strip():
+                yield ExtractionResult.from_dict(json.loads(line))
+
+
+def read_results(path: str) -> T.Iterator[ExtractionResult]:
+    """Reads back the results of a `jsonl` output, or of the last scan of a `sqlite` one"""
+    if not is_database(path):
+        yield from read_json_lines(path)
+        return
+
+    database = ResultDatabase(path)
+    try:
+        yield from database.results()
+    finally:
+        database.close()
+
+
+def previous_results(pattern: str) -> T.Dict[str, ExtractionResult]:
+    """Reads the `jsonl` or `sqlite` output of a previous run, keeping the last result of each repository
+
+    `pattern` may be a glob, to read back the outputs of every shard of a sharded run
+    (a repository moves across shards when its commit changes).
+    """
+    results = {}
+    for path in sorted(glob.glob(pattern)) or [pattern]:
+        for result in read_results(path):
+            results[result.repo] = result
+
+    return results
+
+
+def sink_factory(config: Config) -> T.Optional[Sink]:
+    """Returns the sink for `output_format`, or None to collect every result in a single dict"""
+    sinks_map = {
+        "jsonl": lambda: JsonLinesSink(config.output_path, config.output_gzip, config.output_flush_interval),
+        "sqlite": lambda: SqliteSink(config.output_path, config.output_batch_size, config.output_flush_interval),
+    }
+
+    if config.output_format == "dict":
+        return None
+
+    assert config.output_format in sinks_map, (
+        f"Output format {config.output_format} not found in module {__file__}"
+    )
+
+    return sinks_map[config.output_format]()
@@ -0,0 +1,182 @@
+from array import array
+import typing as T
+
+from red_hat.results import ExtractionResult, collect_results
+
+
+# Image id of the row standing for a Dockerfile without images
+NO_IMAGE = 0xFFFFFFFF
+SHA_SIZE = 20
+
+
+class Usage(T.NamedTuple):
+    """Dockerfile using an image"""
+    repo: str
+    sha: str
+    path: str
+
+
+def _pack_sha(sha: str) -> T.Optional[bytes]:
+    """The 20 bytes of a lowercase hex commit SHA, or None for any other string"""
+    if len(sha) != 2 * SHA_SIZE or sha != sha.lower():
+        return None
+
+    try:
+        return bytes.fromhex(sha)
+    except ValueError:
+        return None
+
+
+class ResultStore:
+    """Compact store of extraction results, indexed by image
+
+    Repositories, paths and images are interned once in a string table, and commit SHAs
+    packed into 20 bytes. Each image found on a Dockerfile is then a row of `array`
+    columns holding the ids of its result, path and image (a Dockerfile without images
+    gets a single row with `NO_IMAGE`), so a result costs a few bytes per image instead of
+    a dict of lists of strings. An inverted index maps every image to its rows as results
+    are added, so the Dockerfiles using an image are found without going through the others.
+
+    Adding a repository's commit again replaces its previous result.
+    """
+    def __init__(self):
+        self._ids: T.Dict[str, int] = {}
+        self._strings: T.List[str] = []
+        # Last result of the repository interned with each id, or -1
+        self._last_result = array("i")
+
+        # One entry per result
+        self._repos = array("I")
+        self._shas = bytearray()
+        self._other_shas: T.Dict[int, str] = {}
+        self._previous = array("i")
+        self._replaced = bytearray()
+        self._starts = array("I")
+        self._failed = bytearray()
+        self._errors: T.Dict[int, T.Union[str, T.Dict[str, str]]] = {}
+
+        # One entry per row
+        self._results = array("I")
+        self._paths = array("I")
+        self._images = array("I")
+        self._by_image: T.Dict[int, array] = {}
+
+    @classmethod
+    def from_results(cls, results: T.Iterable[ExtractionResult]) -> "ResultStore":
+        store = cls()
+        store.extend(results)
+        return store
+
+    def _intern(self, string: str) -> int:
+        id_ = self._ids.get(string)
+        if id_ is None:
+            id_ = self._ids[string] = len(self._strings)
+            self._strings.append(string)
+            self._last_result.append(-1)
+        return id_
+
+    def _sha(self, index: int) -> str:
+        if index in self._other_shas:
+            return self._other_shas[index]
+        return self._shas[index * SHA_SIZE:(index + 1) * SHA_SIZE].hex()
+
+    def _replace(self, repo_id: int, sha: str):
+        """Marks the result of the repository's commit added earlier, if any, as replaced"""
+        index = self._last_result[repo_id]
+        while index != -1:
+            if not self._replaced[index] and self._sha(index) == sha:
+                self._replaced[index] = True
+                return
+            index = self._previous[index]
+
+    def add(self, result: ExtractionResult):
+        index = len(self._repos)
+        repo_id = self._intern(result.repo)
+        self._replace(repo_id, result.sha)
+
+        packed = _pack_sha(result.sha)
+        if packed is None:
+            self._other_shas[index] = result.sha
+        self._shas += packed or bytes(SHA_SIZE)
+
+        self._repos.append(repo_id)
+        self._previous.append(self._last_result[repo_id])
+        self._last_result[repo_id] = index
+        self._replaced.append(False)
+        self._starts.append(len(self._results))
+        self._failed.append(result.data is None)
+
+        if result.errors:
+            self._errors[index] = result.errors
+
+        for path, images in (result.data or {}).items():
+            path_id = self._intern(path)
+            for image_id in [self._intern(image) for image in images] or [NO_IMAGE]:
+                row = len(self._results)
+                self._results.append(index)
+                self._paths.append(path_id)
+                self._images.append(image_id)
+
+                if image_id != NO_IMAGE:
+                    self._by_image.setdefault(image_id, array("I")).append(row)
+
+    def extend(self, results: T.Iterable[ExtractionResult]):
+        for result in results:
+            self.add(result)
+
+    def __len__(self):
+        return len(self._replaced) - sum(self._replaced)
+
+    def repositories_using(self, image: str) -> T.List[Usage]:
+        """Dockerfiles using `image`, as an exact reference such as `python:3.9-slim`"""
+        image_id = self._ids.get(image)
+        if image_id is None:
+            return []
+
+        strings = self._strings
+        return [
+            Usage(strings[self._repos[index]], self._sha(index), strings[path_id])
+            for index, path_id in self._dockerfiles(self._by_image.get(image_id, ()))
+        ]
+
+    def _dockerfiles(self, rows: T.Iterable[int]) -> T.Iterator[T.Tuple[int, int]]:
+        """`(result, path id)` of the current results' Dockerfiles among `rows`, once each"""
+        previous = None
+        for row in rows:
+            dockerfile = self._results[row], self._paths[row]
+            # A Dockerfile's rows are contiguous, so an image used by many of its stages is on adjacent rows
+            if dockerfile != previous and not self._replaced[dockerfile[0]]:
+                yield dockerfile
+            previous = dockerfile
+
+    def images(self) -> T.Dict[str, int]:
+        """Number of Dockerfiles using each image"""
+        counts = {}
+        for image_id, rows in self._by_image.items():
+            count = sum(1 for _ in self._dockerfiles(rows))
+            if count:
+                counts[self._strings[image_id]] = count
+
+        return counts
+
+    def results(self) -> T.Iterator[ExtractionResult]:
+        strings = self._strings
+
+        for index in range(len(self._repos)):
+            if self._replaced[index]:
+                continue
+
+            data = None
+            if not self._failed[index]:
+                end = self._starts[index + 1] if index + 1 < len(self._starts) else len(self._results)
+                data = {}
+                for row in range(self._starts[index], end):
+                    images = data.setdefault(strings[self._paths[row]], [])
+                    if self._images[row] != NO_IMAGE:
+                        images.append(strings[self._images[row]])
+
+            yield ExtractionResult(strings[self._repos[index]], self._sha(index), data, self._errors.get(index, {}))
+
+    def to_dict(self) -> T.Dict:
+        """Same `{"data", "errors"}` document as `collect_results`"""
+        return collect_results(self.results())
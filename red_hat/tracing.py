@@ -0,0 +1,177 @@
+import asyncio
+from collections import Counter
+from contextlib import contextmanager
+import json
+import os
+import sys
+import threading
+import time
+import typing as T
+
+from config import Config
+
+
+class Tracer:
+    """Records spans as Chrome trace events, to be opened in chrome://tracing or Perfetto
+
+    Each span is a complete (`X`) event on the track of the thread it ran on or, within
+    an event loop, of the asyncio task it ran in, so that the tasks interleaved on a
+    single thread don't overlap. Its `args` hold what the span was working on, such as
+    the repository or the bytes it handled.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._events = []
+        self._tracks = {}
+        self._origin = time.perf_counter()
+
+    def _track(self) -> int:
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+
+        if task is not None:
+            key, name = ("task", id(task)), task.get_name()
+        else:
+            thread = threading.current_thread()
+            key, name = ("thread", thread.ident), thread.name
+
+        with self._lock:
+            if key not in self._tracks:
+                self._tracks[key] = (len(self._tracks) + 1, name)
+            return self._tracks[key][0]
+
+    def add(self, name: str, category: str, start: float, end: float, args: T.Dict):
+        event = {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": (start - self._origin) * 1e6,
+            "dur": (end - start) * 1e6,
+            "pid": os.getpid(),
+            "tid": self._track(),
+            "args": args,
+        }
+
+        with self._lock:
+            self._events.append(event)
+
+    def events(self) -> T.List[T.Dict]:
+        with self._lock:
+            tracks = [
+                {"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": name}}
+                for tid, name in self._tracks.values()
+            ]
+            return tracks + list(self._events)
+
+    def write(self):
+        with open(self.path, "w") as f:
+            json.dump({"traceEvents": self.events(), "displayTimeUnit": "ms"}, f)
+
+
+class StackSampler:
+    """Samples the stack of every thread every `interval` seconds
+
+    Blocked threads are sampled too, so the profile shows where the time goes whether it's
+    spent on the CPU or waiting on the network. Samples are written as folded stacks, one
+    `thread;outer;...;inner count` line per distinct stack, which flamegraph.pl and
+    speedscope read.
+    """
+    def __init__(self, path: str, interval: float):
+        self.path = path
+        self._interval = float(interval)
+        self._samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    @staticmethod
+    def _frame_name(frame) -> str:
+        code = frame.f_code
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+    def _sample(self):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        own = threading.get_ident()
+
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+
+            stack = []
+            while frame is not None:
+                stack.append(self._frame_name(frame))
+                frame = frame.f_back
+
+            stack.append(names.get(ident, str(ident)))
+            self._samples[";".join(reversed(stack))] += 1
+
+    def _run(self):
+        while not self._stop.wait(self._interval):
+            self._sample()
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+        with open(self.path, "w") as f:
+            for stack, count in self._samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+_tracer: T.Optional[Tracer] = None
+
+
+@contextmanager
+def span(name: str, category: str, **args) -> T.Iterator[T.Dict]:
+    """Records a span on the active tracer, if any
+
+    Yields the span's `args`, so that what's only known at its end (such as the bytes
+    read) can be added to them.
+    """
+    tracer = _tracer
+    if tracer is None:
+        yield args
+        return
+
+    start = time.perf_counter()
+    try:
+        yield args
+    finally:
+        tracer.add(name, category, start, time.perf_counter(), args)
+
+
+def sampled_profile_path(path: str) -> str:
+    return os.path.splitext(path)[0] + ".folded"
+
+
+@contextmanager
+def profiling(config: Config) -> T.Iterator[T.Optional[Tracer]]:
+    """Traces the spans recorded within the block to `profile_path`, if set
+
+    With `profile_sampling_interval`, the stacks of every thread are sampled as well and
+    written next to the trace, with a `.folded` extension.
+    """
+    global _tracer
+
+    if not config.profile_path:
+        yield None
+        return
+
+    tracer = _tracer = Tracer(config.profile_path)
+    sampler = None
+    if config.profile_sampling_interval:
+        sampler = StackSampler(sampled_profile_path(config.profile_path), config.profile_sampling_interval)
+        sampler.start()
+
+    try:
+        yield tracer
+    finally:
+        _tracer = None
+        if sampler is not None:
+            sampler.stop()
+        tracer.write()
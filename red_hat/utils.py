@@ -20,3 +20,16 @@ def extract_repository_from_url(url: str) -> T.Tuple:
     parts = match.split("/")[-2:]
 
     return tuple(parts)
+
+
+def split_image_reference(reference: str) -> T.Tuple[str, T.Optional[str], T.Optional[str]]:
+    """Splits an image reference such as `quay.io:443/org/image:tag@sha256:...` into its name, tag and digest"""
+    name, _, digest = reference.partition("@")
+    tag = None
+
+    # A colon before the last slash separates a registry's port, not a tag
+    colon = name.rfind(":")
+    if colon > name.rfind("/"):
+        name, tag = name[:colon], name[colon + 1:]
+
+    return name, tag or None, digest or None
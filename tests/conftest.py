@@ -1,6 +1,7 @@
 import pytest
 
 from config import setup
+from tests.stub_server import StubServer
 
 
 @pytest.fixture(scope="session")
@@ -36,3 +37,9 @@ def dockerfile():
 @pytest.fixture(scope="session")
 def settings():
     return setup()
+
+
+@pytest.fixture
+def stub_server():
+    with StubServer() as server:
+        yield server
@@ -0,0 +1,65 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import typing as T
+
+
+Handler = T.Callable[[str], T.Tuple[int, T.Dict[str, str], bytes]]
+
+
+class StubServer:
+    """Local HTTP server standing in for github in tests
+
+    Each route maps a path prefix to a handler that takes the request path and returns
+    `(status, headers, body)`. Requested paths are recorded in `requests`, their headers
+    in `headers`, and the bodies of POST requests in `bodies`.
+    """
+    def __init__(self, routes: T.Dict[str, Handler] = None):
+        self.routes = routes or {}
+        self.requests = []
+        self.headers = []
+        self.bodies = []
+
+        stub = self
+
+        class RequestHandler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                stub.bodies.append(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                self.do_GET()
+
+            def do_GET(self):
+                stub.requests.append(self.path)
+                stub.headers.append(dict(self.headers))
+                status, headers, body = stub.handle(self.path)
+
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), RequestHandler)
+        self._thread = threading.Thread(target=self._server.serve_forever, args=(0.05,), daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def handle(self, path: str) -> T.Tuple[int, T.Dict[str, str], bytes]:
+        for prefix, handler in self.routes.items():
+            if path.startswith(prefix):
+                return handler(path)
+
+        return 404, {}, b"Not Found"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
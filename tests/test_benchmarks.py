@@ -0,0 +1,45 @@
+from benchmarks import result_store_benchmark, tree_stream_benchmark
+from benchmarks.extractor_benchmark import extractor_classes, percentile, run_once
+from benchmarks.github_stand_in import GithubStandIn, Profile
+from config import Config
+
+
+def test_every_service_is_benchmarked():
+    assert extractor_classes() == ["SequentialExtractorService", "ThreadedExtractorService", "AsyncExtractorService"]
+
+
+def test_percentile():
+    assert percentile(list(range(100)), 50) == 50
+    assert percentile(list(range(100)), 99) == 99
+    assert percentile([], 50) is None
+
+
+def test_run_against_stand_in():
+    with GithubStandIn(Profile(tree_size=10, dockerfiles=2, rate_limit=100)) as stand_in:
+        config = Config(
+            repository_list_url=f"{stand_in.api_url}/list?size=5",
+            github_api_url=stand_in.api_url,
+            github_raw_url=stand_in.raw_url,
+        )
+
+        r = run_once(config)
+
+    assert r["repos"] == 5
+    assert r["failed_repos"] == 0
+    assert r["p50"] <= r["p99"]
+    assert stand_in.requests == {"list": 1, "tree": 5, "raw": 10}
+
+
+def test_result_store_benchmark():
+    dict_run, store_run = result_store_benchmark.run(repos=200, images=20)
+
+    assert dict_run["common_image_dockerfiles"] == store_run["common_image_dockerfiles"] > 0
+    assert dict_run["rare_image_dockerfiles"] == store_run["rare_image_dockerfiles"]
+    assert store_run["bytes"] < dict_run["bytes"]
+
+
+def test_tree_stream_benchmark():
+    json_run, stream_run = tree_stream_benchmark.run(entries=2000, dockerfiles=10)
+
+    assert json_run["dockerfiles"] == stream_run["dockerfiles"] == 10
+    assert stream_run["peak_bytes"] < json_run["peak_bytes"]
@@ -0,0 +1,135 @@
+from dataclasses import replace
+
+import pytest
+
+from red_hat.cache import BlobCache, CachedError, HttpCache, TreeCache, listing_of
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = TreeCache(str(tmp_path / "trees.db"), max_entries=2)
+    yield cache
+    cache.close()
+
+
+class TestTreeCache:
+    def test_miss(self, cache):
+        assert cache.get("owner", "repo", "sha") is None
+
+    def test_stores_entries_and_blob_shas(self, cache):
+        cache.put("owner", "repo", "sha", [("Dockerfile", "blob-sha"), ("a/Dockerfile.test", "other-sha")])
+
+        assert cache.get("owner", "repo", "sha") == [("Dockerfile", "blob-sha"), ("a/Dockerfile.test", "other-sha")]
+
+    def test_stores_commits_without_dockerfiles(self, cache):
+        cache.put("owner", "repo", "sha", [])
+
+        assert cache.get("owner", "repo", "sha") == []
+
+    def test_stores_errors(self, cache):
+        cache.put_error("owner", "repo", "sha", "404 Client Error: Not Found", 404)
+
+        with pytest.raises(CachedError) as e:
+            cache.get("owner", "repo", "sha")
+
+        assert str(e.value) == "404 Client Error: Not Found"
+        assert e.value.status == 404
+
+    def test_evicts_least_recently_used(self, cache):
+        cache.put("owner", "repo", "first", [])
+        cache.put("owner", "repo", "second", [])
+        cache.get("owner", "repo", "first")
+
+        cache.put("owner", "repo", "third", [])
+
+        assert len(cache) == 2
+        assert cache.get("owner", "repo", "second") is None
+        assert cache.get("owner", "repo", "first") == []
+        assert cache.get("owner", "repo", "third") == []
+
+    def test_replaced_entries_are_counted_once(self, cache):
+        cache.put("owner", "repo", "first", [])
+        cache.put("owner", "repo", "first", [("Dockerfile", "blob-sha")])
+        cache.put("owner", "repo", "second", [])
+
+        assert len(cache) == 2
+        assert cache.get("owner", "repo", "first") == [("Dockerfile", "blob-sha")]
+
+    def test_listings_are_only_served_to_the_same_settings(self, tmp_path, settings):
+        path = str(tmp_path / "trees.db")
+        excluding = replace(settings, tree_cache_path=path, tree_walk_exclude="vendor, node_modules/")
+        TreeCache.from_config(excluding).put("owner", "repo", "sha", [("Dockerfile", "blob-sha")])
+
+        assert TreeCache.from_config(replace(excluding, tree_walk_exclude=["node_modules", "vendor"])).get(
+            "owner", "repo", "sha"
+        ) == [("Dockerfile", "blob-sha")]
+        assert TreeCache.from_config(replace(excluding, tree_walk_exclude=[])).get("owner", "repo", "sha") is None
+        assert TreeCache.from_config(replace(excluding, tree_walk="never")).get("owner", "repo", "sha") is None
+        assert listing_of(excluding) != listing_of(settings)
+
+    def test_persists_across_instances(self, tmp_path):
+        path = str(tmp_path / "trees.db")
+        cache = TreeCache(path)
+        cache.put("owner", "repo", "sha", [("Dockerfile", "blob-sha")])
+        cache.close()
+
+        cache = TreeCache(path)
+        assert cache.get("owner", "repo", "sha") == [("Dockerfile", "blob-sha")]
+        cache.close()
+
+
+class TestBlobCache:
+    def test_miss(self):
+        assert BlobCache().get("parser:sha") is None
+
+    def test_memory_entries_are_evicted(self):
+        cache = BlobCache(max_entries=2)
+        cache.put("first", [("python:3.9-slim",)])
+        cache.put("second", [])
+        cache.get("first")
+
+        cache.put("third", [])
+
+        assert len(cache) == 2
+        assert cache.get("second") is None
+        assert cache.get("first") == [("python:3.9-slim",)]
+
+    def test_disk_entries_outlive_the_instance(self, tmp_path):
+        path = str(tmp_path / "blobs.db")
+        cache = BlobCache(path=path)
+        cache.put("parser:sha", [("alpine:latest", "as", "base"), ()])
+        cache.close()
+
+        cache = BlobCache(path=path)
+        assert cache.get("parser:sha") == [("alpine:latest", "as", "base"), ()]
+        cache.close()
+
+
+class TestHttpCache:
+    def test_responses_are_stored_with_their_validators(self, tmp_path):
+        cache = HttpCache(str(tmp_path / "http.db"))
+        headers = {"ETag": '"v1"', "Content-Length": "4", "Content-Type": "text/plain"}
+        cache.put("https://example.com/list", headers, b"body")
+
+        cached = cache.get("https://example.com/list")
+
+        assert cached.body == b"body"
+        assert cached.headers == {"ETag": '"v1"', "Content-Type": "text/plain"}
+        assert cached.validators() == {"If-None-Match": '"v1"'}
+        assert cache.get("https://example.com/other") is None
+        cache.close()
+
+    def test_evicts_least_recently_used_past_max_bytes(self, tmp_path):
+        cache = HttpCache(str(tmp_path / "http.db"), max_bytes=10)
+        cache.put("first", {"ETag": "1"}, b"12345")
+        cache.put("second", {"ETag": "2"}, b"12345")
+        cache.get("first")
+
+        cache.put("third", {"ETag": "3"}, b"12345")
+        cache.put("too-big", {"ETag": "4"}, b"12345678901")
+
+        assert len(cache) == 2
+        assert cache.get("second") is None
+        assert cache.get("too-big") is None
+        assert cache.get("first").body == b"12345"
+        cache.close()
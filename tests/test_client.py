@@ -0,0 +1,380 @@
+import asyncio
+from concurrent import futures
+from dataclasses import replace
+import json
+import threading
+import time
+
+import pytest
+from requests import HTTPError
+
+from red_hat import client as client_module
+from red_hat.client import AsyncGithubClient, GithubClient, RepositoryListClient, is_excluded
+from red_hat.hedging import Hedger, LatencyTracker
+from red_hat.json_stream import ObjectStream
+from red_hat.metrics import CACHE_LOOKUPS
+from red_hat.parsers import DockerfileParser, FromInstruction, RepositoryListParser
+from red_hat.scheduler import RateLimitScheduler
+from tests.stub_server import StubServer
+
+
+class RecordingSleep:
+    def __init__(self):
+        self.delays = []
+
+    def __call__(self, seconds):
+        self.delays.append(seconds)
+
+
+@pytest.fixture
+def sleep():
+    return RecordingSleep()
+
+
+@pytest.fixture
+def github_client(stub_server, settings, sleep):
+    settings = replace(
+        settings,
+        github_access_id=None,
+        github_access_secret=None,
+        github_api_url=stub_server.url,
+        github_raw_url=stub_server.url + "/raw",
+        rate_limit_retries=3,
+    )
+
+    return GithubClient(settings, scheduler=RateLimitScheduler(sleep=sleep))
+
+
+def tree(*paths):
+    return json.dumps({"tree": [{"path": path, "type": "blob", "sha": f"sha-{path}"} for path in paths]}).encode()
+
+
+def responses(*items):
+    items = list(items)
+    return lambda path: items.pop(0)
+
+
+class TestRateLimiting:
+    def test_rate_limited_requests_are_queued(self, stub_server, github_client, sleep):
+        stub_server.routes["/repos/"] = responses(
+            (403, {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": "0"}, b"rate limited"),
+            (429, {"Retry-After": "2"}, b"secondary rate limit"),
+            (200, {}, tree("Dockerfile")),
+        )
+
+        r = list(github_client.list_repository_files("owner", "repo", "sha"))
+
+        assert r == ["Dockerfile"]
+        assert r[0].sha == "sha-Dockerfile"
+        assert len(stub_server.requests) == 3
+        assert sleep.delays == [pytest.approx(2, abs=0.1)]
+
+    def test_gives_up_after_retries(self, stub_server, github_client):
+        stub_server.routes["/repos/"] = lambda path: (429, {"Retry-After": "0"}, b"secondary rate limit")
+
+        with pytest.raises(HTTPError) as e:
+            github_client.list_repository_files("owner", "repo", "sha")
+
+        assert e.value.response.status_code == 429
+        assert len(stub_server.requests) == 3
+
+    def test_forbidden_is_not_retried(self, stub_server, github_client):
+        stub_server.routes["/repos/"] = lambda path: (403, {}, b"forbidden")
+
+        with pytest.raises(HTTPError):
+            github_client.list_repository_files("owner", "repo", "sha")
+
+        assert len(stub_server.requests) == 1
+
+    def test_raw_content_is_not_paced_by_api_budget(self, stub_server, github_client, sleep):
+        stub_server.routes["/repos/"] = lambda path: (
+            200, {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": "9999999999"}, tree("Dockerfile")
+        )
+        github_client.list_repository_files("owner", "repo", "sha")
+
+        with StubServer({"/raw/": lambda path: (200, {}, b"FROM python:3.9-slim\n")}) as raw_server:
+            github_client._config = replace(github_client._config, github_raw_url=raw_server.url + "/raw")
+            r = github_client.get_dockerfile("owner", "repo", "sha", "Dockerfile", DockerfileParser())
+
+        assert r == [FromInstruction("python:3.9-slim", line=1)]
+        assert sleep.delays == []
+
+
+class TestHedging:
+    def test_slow_raw_content_is_hedged(self, stub_server, github_client):
+        github_client.hedger = Hedger(percentile=90, max_ratio=1, tracker=LatencyTracker(min_samples=1))
+        github_client.hedger._tracker.record(0.01)
+        release = threading.Event()
+        calls = []
+
+        def raw_content(path):
+            calls.append(path)
+            if len(calls) == 1:
+                release.wait(5)
+            return 200, {}, f"FROM image-{len(calls)}\n".encode()
+
+        stub_server.routes["/raw/"] = raw_content
+
+        r = github_client.get_dockerfile("owner", "repo", "sha", "Dockerfile", DockerfileParser())
+        release.set()
+
+        assert r == [FromInstruction("image-2", line=1)]
+        assert github_client.hedger.hedge_wins == 1
+
+
+class TestBatchedDockerfiles:
+    def test_files_are_fetched_in_chunks(self, stub_server, github_client):
+        github_client._config = replace(
+            github_client._config, github_access_id="id", github_access_secret="secret", graphql_batch_size=2
+        )
+
+        def graphql(path):
+            query = json.loads(stub_server.bodies[-1])["query"]
+            data = {}
+            for alias in ("b0", "b1"):
+                if f"{alias}: object" in query:
+                    data.setdefault("r0", {})[alias] = {"text": f"FROM image-{len(stub_server.bodies)}-{alias}\n"}
+            return 200, {}, json.dumps({"data": data}).encode()
+
+        stub_server.routes["/graphql"] = graphql
+        refs = [("owner", "repo", "sha", path) for path in ("a/Dockerfile", "b/Dockerfile", "c/Dockerfile")]
+
+        assert github_client.supports_batch
+        r = github_client.get_dockerfiles(refs, DockerfileParser())
+
+        assert [[record.image for record in records] for records in r] == [
+            ["image-1-b0"], ["image-1-b1"], ["image-2-b0"]
+        ]
+        assert stub_server.requests == ["/graphql", "/graphql"]
+
+
+TREES = {
+    "root": [
+        {"path": "Dockerfile", "type": "blob", "sha": "blob-1"},
+        {"path": "services", "type": "tree", "sha": "services"},
+        {"path": "node_modules", "type": "tree", "sha": "node_modules"},
+    ],
+    "services": [
+        {"path": "api", "type": "tree", "sha": "api"},
+        {"path": "README.md", "type": "blob", "sha": "blob-2"},
+    ],
+    "api": [{"path": "Dockerfile", "type": "blob", "sha": "blob-3"}],
+    "node_modules": [{"path": "Dockerfile", "type": "blob", "sha": "blob-4"}],
+}
+
+
+def git_trees(path):
+    tree_sha, recursive = path.split("/git/trees/")[1].split("?recursive=")
+    if recursive == "1":
+        return 200, {}, json.dumps({"truncated": True, "tree": TREES[tree_sha][:1]}).encode()
+    return 200, {}, json.dumps({"truncated": False, "tree": TREES[tree_sha]}).encode()
+
+
+class TestTreeWalk:
+    def test_truncated_trees_are_walked(self, stub_server, github_client):
+        stub_server.routes["/repos/"] = git_trees
+
+        r = list(github_client.list_repository_files("owner", "repo", "root"))
+
+        assert r == ["Dockerfile", "node_modules/Dockerfile", "services/README.md", "services/api/Dockerfile"]
+        assert [entry.sha for entry in r] == ["blob-1", "blob-4", "blob-2", "blob-3"]
+
+    def test_excluded_directories_are_not_fetched(self, stub_server, github_client):
+        stub_server.routes["/repos/"] = git_trees
+        github_client._config = replace(github_client._config, tree_walk="always", tree_walk_exclude=["node_modules/"])
+
+        r = list(github_client.list_repository_files("owner", "repo", "root"))
+
+        assert r == ["Dockerfile", "services/README.md", "services/api/Dockerfile"]
+        assert not any("recursive=1" in request for request in stub_server.requests)
+        assert not any("node_modules" in request for request in stub_server.requests)
+
+    def test_truncated_trees_are_kept_without_walking(self, stub_server, github_client):
+        stub_server.routes["/repos/"] = git_trees
+        github_client._config = replace(github_client._config, tree_walk="never")
+
+        r = list(github_client.list_repository_files("owner", "repo", "root"))
+
+        assert r == ["Dockerfile"]
+        assert len(stub_server.requests) == 1
+
+
+class TestStreamedTree:
+    def test_only_kept_blobs_are_yielded(self, stub_server, github_client):
+        stub_server.routes["/repos/"] = lambda path: (200, {}, tree("README.md", "app/Dockerfile", "app/main.py"))
+
+        r = list(github_client.iter_repository_files("owner", "repo", "sha", lambda path: "Dockerfile" in path))
+
+        assert r == ["app/Dockerfile"]
+        assert r[0].sha == "sha-app/Dockerfile"
+
+    def test_truncated_trees_are_walked_for_what_they_did_not_list(self, stub_server, github_client):
+        stub_server.routes["/repos/"] = git_trees
+
+        r = list(github_client.iter_repository_files("owner", "repo", "root", lambda path: "Dockerfile" in path))
+
+        assert r == ["Dockerfile", "node_modules/Dockerfile", "services/api/Dockerfile"]
+        assert [entry.sha for entry in r] == ["blob-1", "blob-4", "blob-3"]
+
+    def test_shared_trees_are_streamed_to_every_caller(self, stub_server, github_client, monkeypatch):
+        paths = [f"app-{index}/Dockerfile" for index in range(5000)]
+        body = tree(*paths)
+        stub_server.routes["/repos/"] = lambda path: (200, {}, body)
+
+        streams = []
+        stream_tree = github_client._stream_tree
+        def spied(*args):
+            streams.append(stream_tree(*args))
+            return streams[-1]
+
+        monkeypatch.setattr(github_client, "_stream_tree", spied)
+
+        first = github_client.iter_repository_files("owner", "repo", "sha")
+        second = github_client.iter_repository_files("owner", "repo", "sha")
+
+        assert next(first) == next(second) == paths[0]
+        assert streams[0].size < len(body)
+        assert list(first) == list(second) == paths[1:]
+        assert len(streams) == 1
+        assert github_client.single_flight.shared == 1
+
+    def test_failures_are_raised_before_decoding(self, stub_server, github_client):
+        stub_server.routes["/repos/"] = lambda path: (404, {}, b"Not Found")
+
+        with pytest.raises(HTTPError):
+            next(github_client.iter_repository_files("owner", "repo", "sha"))
+
+
+@pytest.mark.parametrize(
+    "path,exclude,expected",
+    [
+        ("node_modules/pkg/Dockerfile", ["node_modules"], True),
+        ("app/node_modules/Dockerfile", ["node_modules"], True),
+        ("app/.github/Dockerfile", [".git*"], True),
+        ("docs/Dockerfile", ["docs/*"], True),
+        ("app/docs/Dockerfile", ["docs/*"], False),
+        ("vendored/Dockerfile", ["vendor"], False),
+        ("Dockerfile", [], False),
+    ]
+)
+def test_is_excluded(path, exclude, expected):
+    assert is_excluded(path, exclude) is expected
+
+
+def test_async_truncated_trees_are_walked(stub_server, settings):
+    pytest.importorskip("aiohttp")
+    stub_server.routes["/repos/"] = git_trees
+    settings = replace(settings, github_access_id=None, github_access_secret=None, github_api_url=stub_server.url)
+
+    async def list_files():
+        async with AsyncGithubClient(settings) as client:
+            return list(await client.list_repository_files("owner", "repo", "root"))
+
+    assert asyncio.run(list_files()) == [
+        "Dockerfile", "node_modules/Dockerfile", "services/README.md", "services/api/Dockerfile"
+    ]
+
+
+def test_async_trees_are_decoded_as_they_are_read(stub_server, settings, monkeypatch):
+    pytest.importorskip("aiohttp")
+    paths = [f"app-{index}/Dockerfile" for index in range(5000)]
+    body = tree(*paths)
+    stub_server.routes["/repos/"] = lambda path: (200, {}, body)
+    settings = replace(settings, github_access_id=None, github_access_secret=None, github_api_url=stub_server.url)
+
+    streams = []
+
+    def spied(*args):
+        streams.append(ObjectStream(*args))
+        return streams[-1]
+
+    monkeypatch.setattr(client_module, "ObjectStream", spied)
+
+    async def list_files():
+        async with AsyncGithubClient(settings) as client:
+            return list(await client.list_repository_files("owner", "repo", "sha"))
+
+    assert asyncio.run(list_files()) == paths
+    assert [stream.size for stream in streams] == [len(body)]
+
+
+class TestRepositoryList:
+    def test_list_is_streamed(self, stub_server, settings, repository_list):
+        stub_server.routes["/list"] = lambda path: (200, {"Content-Type": "text/plain"}, (repository_list * 2).encode())
+        settings = replace(settings, repository_list_url=stub_server.url + "/list")
+
+        r = RepositoryListClient(settings).iter_repositories(RepositoryListParser())
+
+        assert list(r) == RepositoryListParser().parse(repository_list)
+
+    def test_responses_addressed_by_sha_are_not_http_cached(self, stub_server, settings, tmp_path):
+        stub_server.routes["/repos/"] = lambda path: (200, {"ETag": '"v1"'}, tree("Dockerfile"))
+        settings = replace(
+            settings,
+            github_access_id=None,
+            github_api_url=stub_server.url,
+            single_flight=False,
+            http_cache_path=str(tmp_path / "http.db"),
+        )
+        client = GithubClient(settings)
+
+        for _ in range(2):
+            assert list(client.iter_repository_files("owner", "repo", "sha")) == ["Dockerfile"]
+
+        assert len(client.http_cache) == 0
+        assert [h.get("If-None-Match") for h in stub_server.headers] == [None, None]
+
+    def test_unchanged_list_is_served_from_the_http_cache(self, stub_server, settings, repository_list, tmp_path):
+        def conditional(path):
+            if stub_server.headers[-1].get("If-None-Match") == '"v1"':
+                return 304, {"ETag": '"v1"'}, b""
+            return 200, {"Content-Type": "text/plain", "ETag": '"v1"'}, repository_list.encode()
+
+        stub_server.routes["/list"] = conditional
+        settings = replace(
+            settings, repository_list_url=stub_server.url + "/list", http_cache_path=str(tmp_path / "http.db")
+        )
+        hits = CACHE_LOOKUPS.value(cache="http", result="hit")
+
+        first = RepositoryListClient(settings).list_of_repositories(RepositoryListParser())
+        streamed = list(RepositoryListClient(settings).iter_repositories(RepositoryListParser()))
+
+        assert first == streamed == RepositoryListParser().parse(repository_list)
+        assert [h.get("If-None-Match") for h in stub_server.headers] == [None, '"v1"']
+        assert CACHE_LOOKUPS.value(cache="http", result="hit") == hits + 1
+
+    def test_missing_url_fails_before_streaming(self, settings):
+        with pytest.raises(ValueError):
+            RepositoryListClient(replace(settings, repository_list_url=None)).iter_repositories(RepositoryListParser())
+
+
+class TestSingleFlight:
+    def test_concurrent_fetches_of_a_file_share_one_request(self, stub_server, github_client):
+        release = threading.Event()
+
+        def raw_content(path):
+            release.wait(5)
+            return 200, {}, b"FROM python:3.9-slim\n"
+
+        stub_server.routes["/raw/"] = raw_content
+
+        with futures.ThreadPoolExecutor(4) as executor:
+            results = [
+                executor.submit(github_client.get_dockerfile, "owner", "repo", "sha", "Dockerfile", DockerfileParser())
+                for _ in range(4)
+            ]
+            while github_client.single_flight.shared < 3:
+                time.sleep(0.001)
+            release.set()
+
+        assert [future.result() for future in results] == [[FromInstruction("python:3.9-slim", line=1)]] * 4
+        assert stub_server.requests == ["/raw/owner/repo/sha/Dockerfile"]
+
+
+def test_commits_are_compared_without_listing_commits(stub_server, github_client):
+    stub_server.routes["/repos/"] = lambda path: (200, {}, json.dumps({"status": "ahead", "files": []}).encode())
+
+    r = github_client.compare_commits("owner", "repo", "old-sha", "new-sha")
+
+    assert r == {"status": "ahead", "files": []}
+    assert stub_server.requests == ["/repos/owner/repo/compare/old-sha...new-sha?per_page=1"]
@@ -0,0 +1,177 @@
+import asyncio
+from concurrent import futures
+from dataclasses import replace
+import json
+import threading
+import time
+
+import pytest
+
+from red_hat.client import GithubClient
+from red_hat.concurrency import AdaptiveConcurrency, AIMDLimit, HostGate, is_throttled
+from red_hat.metrics import CONCURRENCY_LIMIT
+from red_hat.scheduler import RateLimitScheduler
+
+
+class TestAIMDLimit:
+    def test_limit_grows_by_about_one_per_round_trip(self):
+        limit = AIMDLimit(4, max_limit=100)
+
+        for _ in range(4):
+            limit.update(0.01, False, in_flight=3)
+
+        assert limit.value == pytest.approx(5, abs=0.2)
+
+    def test_limit_only_grows_while_in_use(self):
+        limit = AIMDLimit(4)
+
+        limit.update(0.01, False, in_flight=0)
+
+        assert limit.value == 4
+
+    def test_throttled_responses_halve_the_limit_once_per_window(self):
+        limit = AIMDLimit(16)
+
+        limit.update(0.01, True, in_flight=7)
+        # Sent before the cut
+        for _ in range(7):
+            limit.update(0.01, True, in_flight=6)
+
+        assert limit.value == 8
+
+        limit.update(0.01, True, in_flight=0)
+
+        assert limit.value == 4
+
+    def test_limit_stays_within_bounds(self):
+        limit = AIMDLimit(2, min_limit=1, max_limit=3)
+
+        for _ in range(5):
+            limit.update(None, True, in_flight=0)
+        assert limit.value == 1
+
+        for _ in range(50):
+            limit.update(0.01, False, in_flight=5)
+        assert limit.value == 3
+
+    def test_latency_spikes_cut_the_limit(self):
+        limit = AIMDLimit(10, max_limit=10)
+
+        for _ in range(AIMDLimit.WARMUP):
+            limit.update(0.01, False, in_flight=0)
+
+        limit.update(1.0, False, in_flight=0)
+        assert limit.value == 5
+
+        limit.update(1.0, False, in_flight=0)
+        assert limit.value == 5
+
+
+@pytest.mark.parametrize("status, headers, expected", [
+    (200, {}, False),
+    (404, {}, False),
+    (403, {}, False),
+    (403, {"Retry-After": "60"}, True),
+    (403, {"X-RateLimit-Remaining": "0"}, True),
+    (429, {}, True),
+    (503, {}, True),
+    (None, None, True),
+])
+def test_is_throttled(status, headers, expected):
+    assert is_throttled(status, headers) is expected
+
+
+def test_gate_bounds_threads_in_flight():
+    gate = HostGate("github", AIMDLimit(3, max_limit=3))
+    lock = threading.Lock()
+    in_flight = []
+    peak = []
+
+    def request():
+        gate.acquire()
+        with lock:
+            in_flight.append(None)
+            peak.append(len(in_flight))
+        time.sleep(0.01)
+        with lock:
+            in_flight.pop()
+        gate.release(0.01, False)
+
+    with futures.ThreadPoolExecutor(10) as executor:
+        list(executor.map(lambda _: request(), range(30)))
+
+    assert max(peak) == 3
+    assert gate.in_flight == 0
+
+
+def test_gate_bounds_tasks_in_flight():
+    gate = HostGate("github", AIMDLimit(2, max_limit=2))
+    in_flight = []
+    peak = []
+
+    async def request():
+        await gate.acquire_async()
+        in_flight.append(None)
+        peak.append(len(in_flight))
+        await asyncio.sleep(0.01)
+        in_flight.pop()
+        gate.release(0.01, False)
+
+    async def main():
+        await asyncio.gather(*(request() for _ in range(10)))
+
+    asyncio.run(main())
+
+    assert max(peak) == 2
+    assert gate.in_flight == 0
+
+
+def test_concurrency_adapts_to_a_throttling_server(stub_server, settings):
+    """The server answers with 429s once more than `threshold` requests are in flight"""
+    threshold = 4
+    lock = threading.Lock()
+    in_flight = []
+    throttled = []
+    tree = json.dumps({"tree": [{"path": "Dockerfile", "type": "blob", "sha": "blob-sha"}]}).encode()
+
+    def handler(path):
+        with lock:
+            in_flight.append(None)
+            overloaded = len(in_flight) > threshold
+        try:
+            if overloaded:
+                throttled.append(path)
+                return 429, {"Retry-After": "0"}, b"secondary rate limit"
+            time.sleep(0.01)
+            return 200, {}, tree
+        finally:
+            with lock:
+                in_flight.pop()
+
+    stub_server.routes["/repos/"] = handler
+    settings = replace(
+        settings,
+        github_access_id=None,
+        github_access_secret=None,
+        github_api_url=stub_server.url,
+        rate_limit_retries=20,
+        thread_pool_size=2,
+        adaptive_concurrency=True,
+        adaptive_concurrency_max=32,
+    )
+    client = GithubClient(settings, scheduler=RateLimitScheduler(sleep=lambda seconds: None))
+
+    with futures.ThreadPoolExecutor(32) as executor:
+        r = list(executor.map(lambda i: client.list_repository_files("owner", "repo", f"sha-{i}"), range(400)))
+
+    host = stub_server.url.split("//")[1]
+    limit = client.concurrency.limit(stub_server.url)
+
+    assert all(files == ["Dockerfile"] for files in r)
+    assert throttled
+    assert 1 <= limit <= 2 * threshold
+    assert CONCURRENCY_LIMIT.value(host=host) == limit
+
+
+def test_adaptive_concurrency_is_off_by_default(settings):
+    assert AdaptiveConcurrency.from_config(replace(settings, adaptive_concurrency=False)) is None
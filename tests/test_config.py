@@ -0,0 +1,49 @@
+import pytest
+
+from config import CONFIG_PATH_ENVVAR, setup
+
+
+@pytest.fixture
+def config_path(tmp_path, monkeypatch):
+    path = tmp_path / "config.yml"
+    path.write_text('repository_list_url: "https://example.com/list"\nthread_pool_size: 4\n')
+    monkeypatch.setenv(CONFIG_PATH_ENVVAR, str(path))
+    return path
+
+
+@pytest.mark.parametrize("env,value,expected", [
+    ("RATE_LIMIT_RETRIES", "3", 3),
+    ("THREAD_POOL_SIZE", "16", 16),
+    ("HEDGE_PERCENTILE", "99.5", 99.5),
+    ("SINGLE_FLIGHT", "false", False),
+    ("OUTPUT_GZIP", "False", False),
+    ("ADAPTIVE_CONCURRENCY", "1", True),
+    ("STREAM_REPOSITORY_LIST", "yes", True),
+    ("METRICS_PORT", "9100", 9100),
+    ("METRICS_PORT", "", None),
+    ("SHARD_INDEX", "2", 2),
+    ("TREE_WALK_EXCLUDE", "node_modules, vendor", ["node_modules", "vendor"]),
+    ("GITHUB_API_URL", "http://localhost:8080", "http://localhost:8080"),
+    ("JOURNAL_PATH", "", ""),
+])
+def test_env_overrides_are_parsed_as_their_setting(config_path, monkeypatch, env, value, expected):
+    monkeypatch.setenv(env, value)
+
+    settings = setup()
+
+    assert getattr(settings, env.lower()) == expected
+    assert type(getattr(settings, env.lower())) is type(expected)
+
+
+def test_yaml_settings_are_kept_without_env(config_path):
+    settings = setup()
+
+    assert settings.thread_pool_size == 4
+    assert settings.single_flight is True
+
+
+def test_invalid_booleans_are_rejected(config_path, monkeypatch):
+    monkeypatch.setenv("SINGLE_FLIGHT", "maybe")
+
+    with pytest.raises(ValueError):
+        setup()
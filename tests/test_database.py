@@ -0,0 +1,103 @@
+from dataclasses import replace
+
+import pytest
+
+from red_hat.database import ResultDatabase, is_database
+from red_hat.results import ExtractionResult, collect_results
+from red_hat.sharding import merge_shards
+from red_hat.sinks import SqliteSink, previous_results, sink_factory
+
+
+@pytest.fixture
+def results():
+    return [
+        ExtractionResult("https://github.com/dummy/code.git", "sha", {
+            "Dockerfile": ["python:3.9-slim", "alpine:latest"],
+            "empty/Dockerfile": [],
+        }, {}),
+        ExtractionResult("https://github.com/dummy/broken.git", "sha", None, "Dummy exception"),
+        ExtractionResult(
+            "https://github.com/dummy/partial.git", "sha",
+            {"Dockerfile": ["python:3.11@sha256:abc"]}, {"other/Dockerfile": "Dummy exception"}
+        ),
+    ]
+
+
+@pytest.fixture
+def database(tmp_path, results):
+    database = ResultDatabase(str(tmp_path / "results.db"))
+    database.insert(database.start_scan(), results)
+    yield database
+    database.close()
+
+
+class TestResultDatabase:
+    def test_results_round_trip(self, database, results):
+        assert list(database.results()) == results
+
+    def test_usage_by_name_tag_and_digest(self, database):
+        assert database.usage("python:3.9-slim") == [
+            {
+                "repo": "https://github.com/dummy/code.git",
+                "sha": "sha",
+                "path": "Dockerfile",
+                "image": "python:3.9-slim",
+            }
+        ]
+        assert [u["image"] for u in database.usage("python")] == ["python:3.9-slim", "python:3.11@sha256:abc"]
+        assert [u["repo"] for u in database.usage("python@sha256:abc")] == ["https://github.com/dummy/partial.git"]
+        assert database.usage("python:2") == []
+
+    def test_scans_are_appended(self, database):
+        scan_id = database.start_scan()
+        database.insert(scan_id, [
+            ExtractionResult("https://github.com/dummy/code.git", "new-sha", {"Dockerfile": ["alpine:latest"]}, {})
+        ])
+
+        assert [scan["repositories"] for scan in database.scans()] == [3, 1]
+        assert database.usage("python") == []
+        assert len(database.usage("python", scan_id=scan_id - 1)) == 2
+        assert [point["repositories"] for point in database.trend("python")] == [2, 0]
+        assert database.images() == {"alpine:latest": 1}
+
+
+class TestSqliteSink:
+    def test_results_are_written_in_batches(self, tmp_path, results):
+        path = str(tmp_path / "results.db")
+
+        for _ in range(2):
+            with SqliteSink(path, batch_size=2, flush_interval=60) as sink:
+                for result in results:
+                    sink.write(result)
+
+        assert is_database(path)
+        database = ResultDatabase(path)
+        scans = database.scans()
+        database.close()
+
+        assert [scan["repositories"] for scan in scans] == [3, 3]
+        assert all(scan["finished_at"] is not None for scan in scans)
+        assert previous_results(path) == {result.repo: result for result in results}
+
+    def test_factory(self, settings, tmp_path):
+        sink = sink_factory(replace(settings, output_format="sqlite", output_path=str(tmp_path / "results.db")))
+
+        assert isinstance(sink, SqliteSink)
+        sink.close()
+
+    def test_write_failures_are_raised(self, tmp_path):
+        sink = SqliteSink(str(tmp_path / "results.db"), batch_size=1)
+        sink.write(ExtractionResult("https://github.com/dummy/code.git", "sha", {"Dockerfile": [None]}, {}))
+
+        with pytest.raises(AttributeError):
+            sink.close()
+
+
+def test_merged_databases_match_collected_results(tmp_path, results):
+    paths = []
+    for index, result in enumerate(results):
+        paths.append(str(tmp_path / f"shard-{index}.db"))
+        with SqliteSink(paths[-1]) as sink:
+            sink.write(result)
+
+    assert merge_shards(paths) == collect_results(results)
@@ -0,0 +1,54 @@
+from red_hat.graphql import BlobNotFound, build_blob_query, split_blob_response
+
+
+REFS = [
+    ("owner", "repo", "sha", "Dockerfile"),
+    ("other", "repo", "sha", "/build/Dockerfile"),
+    ("owner", "repo", "sha", "missing/Dockerfile"),
+]
+
+
+class TestBuildBlobQuery:
+    def test_blobs_are_grouped_by_repository(self):
+        query = build_blob_query(REFS)
+
+        assert query == (
+            'query { '
+            'r0: repository(owner: "owner", name: "repo") { '
+            'b0: object(expression: "sha:Dockerfile") { ... on Blob { text } } '
+            'b2: object(expression: "sha:missing/Dockerfile") { ... on Blob { text } } } '
+            'r1: repository(owner: "other", name: "repo") { '
+            'b1: object(expression: "sha:build/Dockerfile") { ... on Blob { text } } } '
+            '}'
+        )
+
+    def test_strings_are_escaped(self):
+        query = build_blob_query([("owner", "repo", "sha", 'weird "name"/Dockerfile')])
+
+        assert '"sha:weird \\"name\\"/Dockerfile"' in query
+
+
+class TestSplitBlobResponse:
+    def test_results_are_aligned_with_refs(self):
+        payload = {"data": {
+            "r0": {"b0": {"text": "FROM python:3.9-slim\n"}, "b2": None},
+            "r1": {"b1": {"text": "FROM alpine:latest\n"}},
+        }}
+
+        first, second, third = split_blob_response(REFS, payload)
+
+        assert first == "FROM python:3.9-slim\n"
+        assert second == "FROM alpine:latest\n"
+        assert isinstance(third, BlobNotFound)
+
+    def test_missing_repositories_carry_the_error(self):
+        payload = {
+            "data": {"r0": {"b0": {"text": "FROM python:3.9-slim\n"}, "b2": {"text": None}}, "r1": None},
+            "errors": [{"path": ["r1"], "message": "Could not resolve to a Repository"}],
+        }
+
+        first, second, third = split_blob_response(REFS, payload)
+
+        assert first == "FROM python:3.9-slim\n"
+        assert str(second) == "Could not resolve to a Repository"
+        assert isinstance(third, BlobNotFound)
@@ -0,0 +1,122 @@
+from dataclasses import replace
+import threading
+import time
+
+import pytest
+
+from red_hat.hedging import Hedger, LatencyTracker
+
+
+@pytest.fixture
+def tracker():
+    tracker = LatencyTracker(window=10, min_samples=5)
+    for _ in range(10):
+        tracker.record(0.01)
+    return tracker
+
+
+class SlowOnce:
+    """Callable whose first call hangs until released"""
+    def __init__(self):
+        self.calls = 0
+        self.release = threading.Event()
+
+    def __call__(self):
+        self.calls += 1
+        if self.calls == 1:
+            self.release.wait(5)
+            return "slow"
+        return "fast"
+
+
+class TestLatencyTracker:
+    def test_needs_enough_samples(self):
+        tracker = LatencyTracker(min_samples=2)
+        tracker.record(1)
+
+        assert tracker.percentile(50) is None
+
+    def test_percentile(self):
+        tracker = LatencyTracker(min_samples=1)
+        for seconds in range(1, 101):
+            tracker.record(seconds)
+
+        assert tracker.percentile(50) == 51
+        assert tracker.percentile(99) == 100
+
+
+class TestHedger:
+    def test_slow_request_is_hedged(self, tracker):
+        hedger = Hedger(percentile=90, max_ratio=1, tracker=tracker)
+        fn = SlowOnce()
+
+        start = time.monotonic()
+        r = hedger.call(fn)
+        elapsed = time.monotonic() - start
+        fn.release.set()
+
+        assert r == "fast"
+        assert elapsed < 1
+        assert hedger.hedges == 1
+        assert hedger.hedge_wins == 1
+
+    def test_hedges_are_capped(self, tracker):
+        hedger = Hedger(percentile=90, max_ratio=0.5, tracker=tracker)
+        fn = SlowOnce()
+        fn.release.set()
+
+        # One hedge for every two requests at most, so the first one can't be hedged
+        assert hedger.call(fn) == "slow"
+        assert hedger.hedges == 0
+
+    def test_failed_hedge_falls_back_to_primary(self, tracker):
+        hedger = Hedger(percentile=90, max_ratio=1, tracker=tracker)
+        calls = []
+
+        def fn():
+            calls.append(None)
+            if len(calls) == 1:
+                time.sleep(0.2)
+                return "primary"
+            raise Exception("Dummy exception")
+
+        assert hedger.call(fn) == "primary"
+        assert hedger.hedges == 1
+        assert hedger.hedge_wins == 0
+
+    def test_no_hedging_without_latency_samples(self):
+        hedger = Hedger(percentile=90, max_ratio=1)
+
+        assert hedger.call(lambda: "done") == "done"
+        assert hedger.hedges == 0
+
+    def test_delay_starts_when_the_primary_does(self, tracker):
+        hedger = Hedger(percentile=90, max_ratio=1, max_workers=1, tracker=tracker)
+        busy = threading.Event()
+        hedger._executor.submit(busy.wait, 5)
+
+        def release():
+            time.sleep(0.2)
+            busy.set()
+
+        threading.Thread(target=release).start()
+
+        # Queued behind a busy thread for longer than the delay, but quick once started
+        assert hedger.call(lambda: time.sleep(0.005) or "primary") == "primary"
+        assert hedger.hedges == 0
+
+
+@pytest.mark.parametrize("adaptive, workers", [(False, 8), (True, 128)])
+def test_pool_fits_every_worker(settings, adaptive, workers):
+    config = replace(
+        settings,
+        hedge_raw_requests=True,
+        thread_pool_size=4,
+        adaptive_concurrency=adaptive,
+        adaptive_concurrency_max=64,
+    )
+
+    hedger = Hedger.from_config(config)
+
+    assert hedger._executor._max_workers == workers
+    hedger.shutdown()
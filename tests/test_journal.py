@@ -0,0 +1,116 @@
+import os
+
+import pytest
+
+from red_hat import services
+from red_hat.journal import Journal
+from red_hat.results import ExtractionResult
+from tests.test_services import DummyClient
+
+
+@pytest.fixture
+def journal_path(tmp_path):
+    return str(tmp_path / "journal" / "run.jsonl")
+
+
+@pytest.fixture
+def result():
+    return ExtractionResult("https://github.com/dummy/code.git", "sha", {"Dockerfile": ["python:3.9-slim"]}, {})
+
+
+class TestJournal:
+    def test_records_are_buffered_until_the_interval(self, journal_path, result):
+        journal = Journal(journal_path, fsync_interval=3600)
+        journal.record(result)
+
+        assert Journal(journal_path).load() == {}
+
+        journal.close()
+        assert Journal(journal_path).load() == {result.key: result}
+
+    def test_records_are_appended_across_runs(self, journal_path, result):
+        with Journal(journal_path, fsync_interval=0) as journal:
+            journal.record(result)
+
+        other = result._replace(repo="https://github.com/dummy/other.git")
+        with Journal(journal_path, fsync_interval=0) as journal:
+            journal.record(other)
+
+        assert Journal(journal_path).load() == {result.key: result, other.key: other}
+
+    def test_line_cut_short_is_ignored(self, journal_path, result):
+        with Journal(journal_path) as journal:
+            journal.record(result)
+
+        with open(journal_path, "ab") as f:
+            f.write(b'{"repo": "https://github.com/dummy/cut')
+
+        assert Journal(journal_path).load() == {result.key: result}
+
+    def test_line_cut_short_is_dropped_before_appending(self, journal_path, result):
+        with Journal(journal_path) as journal:
+            journal.record(result)
+
+        with open(journal_path, "ab") as f:
+            f.write(b'{"repo": "https://github.com/dummy/cut')
+
+        other = result._replace(repo="https://github.com/dummy/other.git")
+        with Journal(journal_path) as journal:
+            journal.record(other)
+
+        assert Journal(journal_path).load() == {result.key: result, other.key: other}
+
+    def test_line_cut_short_without_full_lines_is_dropped(self, journal_path, result):
+        os.makedirs(os.path.dirname(journal_path))
+        with open(journal_path, "wb") as f:
+            f.write(b'{"repo": ' + b"x" * 10000)
+
+        with Journal(journal_path) as journal:
+            journal.record(result)
+
+        assert Journal(journal_path).load() == {result.key: result}
+
+
+class CountingClient(DummyClient):
+    def __init__(self):
+        super().__init__()
+        self.listed = []
+
+    def list_repository_files(self, owner, repo_name, sha):
+        self.listed.append(repo_name)
+        if repo_name == "broken":
+            raise Exception("Dummy exception")
+        return super().list_repository_files()
+
+
+def test_resume_skips_journaled_repositories(journal_path, settings):
+    repos = [(f"https://github.com/dummy/{name}.git", "sha") for name in ("first", "broken", "second")]
+
+    with Journal(journal_path) as journal:
+        first_run = list(
+            services.SequentialExtractorService.resume_images_from(repos[:2], settings, CountingClient(), journal)
+        )
+
+    client = CountingClient()
+    with Journal(journal_path) as journal:
+        second_run = list(services.SequentialExtractorService.resume_images_from(repos, settings, client, journal))
+
+    # Failed repositories aren't journaled, so they're retried
+    assert client.listed == ["broken", "second"]
+    assert second_run[0] == first_run[0]
+    assert [result.key for result in second_run] == [f"{repo}:{sha}" for repo, sha in repos]
+
+
+@pytest.mark.parametrize("service", [services.SequentialExtractorService, services.ThreadedExtractorService])
+def test_resume_only_replays_listed_repositories(journal_path, settings, service):
+    repos = [(f"https://github.com/dummy/{name}.git", "sha") for name in ("first", "second", "third")]
+
+    with Journal(journal_path) as journal:
+        list(service.resume_images_from(repos[:2], settings, CountingClient(), journal))
+
+    client = CountingClient()
+    with Journal(journal_path) as journal:
+        r = list(service.resume_images_from([repos[1], repos[2], repos[1]], settings, client, journal))
+
+    assert client.listed == ["third"]
+    assert sorted(result.key for result in r) == [f"{repo}:{sha}" for repo, sha in repos[1:]]
@@ -0,0 +1,62 @@
+import json
+
+import pytest
+
+from red_hat.json_stream import ObjectStream
+
+
+DOCUMENT = {
+    "sha": "root",
+    "tree": [
+        {"path": "Dockerfile", "type": "blob", "sha": "blob-1", "size": 1234567},
+        {"path": "naïve/Dockerfile", "type": "blob", "sha": "blob-2", "size": 0.5},
+        {"path": "services", "type": "tree", "sha": "tree-1", "nested": {"list": [1, [2], {}]}},
+    ],
+    "truncated": False,
+    "count": 31415,
+}
+
+
+def chunks(body: bytes, size: int):
+    return (body[start:start + size] for start in range(0, len(body), size))
+
+
+@pytest.mark.parametrize("size", [1, 2, 7, 64, 4096])
+def test_decodes_chunked_documents(size):
+    body = json.dumps(DOCUMENT, ensure_ascii=False, indent=1).encode()
+    stream = ObjectStream(chunks(body, size), "tree")
+
+    assert list(stream.items()) == DOCUMENT["tree"]
+    assert stream.fields == {"sha": "root", "truncated": False, "count": 31415}
+    assert stream.size == len(body)
+
+
+def test_elements_are_yielded_before_the_end_of_the_stream():
+    read = []
+
+    def tracked():
+        for chunk in chunks(json.dumps(DOCUMENT).encode(), 16):
+            read.append(chunk)
+            yield chunk
+
+    items = ObjectStream(tracked(), "tree").items()
+    next(items)
+
+    assert len(read) < len(json.dumps(DOCUMENT)) / 16 / 2
+
+
+@pytest.mark.parametrize("body", [b'{"tree": []}', b'{}', b' { "tree" : [ ] , "truncated" : true } '])
+def test_empty_arrays_and_objects(body):
+    assert list(ObjectStream([body], "tree").items()) == []
+
+
+@pytest.mark.parametrize("body", [
+    b'{"tree": [{"path": "Dockerfile"}',
+    b'{"tree": [{"path": "Dockerfile"}}',
+    b'[{"path": "Dockerfile"}]',
+    b'{"tree": []} {}',
+    b'{1: 2}',
+])
+def test_invalid_documents_raise(body):
+    with pytest.raises(ValueError):
+        list(ObjectStream(chunks(body, 3), "tree").items())
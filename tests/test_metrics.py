@@ -0,0 +1,125 @@
+from dataclasses import replace
+import json
+from urllib.request import urlopen
+
+import pytest
+
+import app
+from red_hat import metrics
+from red_hat.cache import BlobCache
+from red_hat.client import GithubClient
+from red_hat.metrics import Counter, Gauge, Histogram, Registry
+from red_hat.results import ExtractionResult
+from red_hat.scheduler import RateLimitScheduler
+
+
+def test_text_format():
+    registry = Registry()
+    requests = Counter("requests_total", "Requests sent", ("endpoint", "status"), registry=registry)
+    in_flight = Gauge("in_flight", "Requests in flight", registry=registry)
+    latency = Histogram("latency_seconds", "Latency", buckets=(0.1, 1), registry=registry)
+
+    requests.inc(endpoint="tree", status=200)
+    requests.inc(2, endpoint="raw", status='5"0"0')
+    in_flight.set(3)
+    for value in (0.05, 0.5, 5):
+        latency.observe(value)
+
+    assert registry.render() == (
+        '# HELP requests_total Requests sent\n'
+        '# TYPE requests_total counter\n'
+        'requests_total{endpoint="raw",status="5\\"0\\"0"} 2\n'
+        'requests_total{endpoint="tree",status="200"} 1\n'
+        '# HELP in_flight Requests in flight\n'
+        '# TYPE in_flight gauge\n'
+        'in_flight 3\n'
+        '# HELP latency_seconds Latency\n'
+        '# TYPE latency_seconds histogram\n'
+        'latency_seconds_bucket{le="0.1"} 1\n'
+        'latency_seconds_bucket{le="1"} 2\n'
+        'latency_seconds_bucket{le="+Inf"} 3\n'
+        'latency_seconds_sum 5.55\n'
+        'latency_seconds_count 3\n'
+    )
+
+
+def test_write(tmp_path):
+    registry = Registry()
+    Counter("requests_total", "Requests sent", registry=registry).inc()
+    path = tmp_path / "metrics" / "extractor.prom"
+
+    registry.write(str(path))
+
+    assert path.read_text() == registry.render()
+    assert [p.name for p in path.parent.iterdir()] == ["extractor.prom"]
+
+
+def test_serve():
+    registry = Registry()
+    Counter("requests_total", "Requests sent", registry=registry).inc()
+    server = metrics.serve(0, "127.0.0.1", registry)
+
+    try:
+        host, port = server.server_address
+        with urlopen(f"http://{host}:{port}/metrics") as r:
+            assert r.read().decode() == registry.render()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_client_requests_are_measured(stub_server, settings):
+    settings = replace(settings, github_access_id=None, github_access_secret=None, github_api_url=stub_server.url)
+    client = GithubClient(settings, scheduler=RateLimitScheduler())
+    tree = json.dumps({"tree": [{"path": "Dockerfile", "type": "blob", "sha": "blob-sha"}]}).encode()
+    headers = {"X-RateLimit-Remaining": "41", "X-RateLimit-Resource": "core"}
+    stub_server.routes["/repos/"] = lambda path: (200, headers, tree)
+    stub_server.routes["/graphql"] = lambda path: (200, {"X-RateLimit-Remaining": "9"}, b'{"data": {}}')
+    host = stub_server.url.split("//")[1]
+
+    before = metrics.HTTP_REQUESTS.value(endpoint="tree", status=200)
+    client.list_repository_files("owner", "repo", "sha")
+    client._request("POST", f"{stub_server.url}/graphql", json={})
+
+    assert metrics.HTTP_REQUESTS.value(endpoint="tree", status=200) == before + 1
+    assert metrics.RATE_LIMIT_REMAINING.value(host=host, resource="core") == 41
+    assert metrics.RATE_LIMIT_REMAINING.value(host=host, resource="graphql") == 9
+    assert metrics.HTTP_REQUESTS_IN_FLIGHT.value(endpoint="tree") == 0
+
+
+def test_cache_lookups_are_counted():
+    cache = BlobCache()
+    cache.put("key", [("python:3.9-slim",)])
+    hits = metrics.CACHE_LOOKUPS.value(cache="blob", result="hit")
+    misses = metrics.CACHE_LOOKUPS.value(cache="blob", result="miss")
+
+    cache.get("key")
+    cache.get("other")
+
+    assert metrics.CACHE_LOOKUPS.value(cache="blob", result="hit") == hits + 1
+    assert metrics.CACHE_LOOKUPS.value(cache="blob", result="miss") == misses + 1
+
+
+def test_results_are_counted_by_outcome():
+    results = [
+        ExtractionResult("repo", "sha", {}, {}),
+        ExtractionResult("repo", "sha", {}, {"Dockerfile": "Dummy exception"}),
+        ExtractionResult("repo", "sha", None, "Dummy exception"),
+    ]
+    before = {outcome: metrics.REPOSITORIES.value(outcome=outcome) for outcome in ("ok", "partial", "failed")}
+
+    assert list(metrics.count_results(results)) == results
+
+    for outcome, count in before.items():
+        assert metrics.REPOSITORIES.value(outcome=outcome) == count + 1
+
+
+def test_metrics_server_is_shut_down_when_setup_fails(settings, monkeypatch):
+    server = metrics.serve(0, "127.0.0.1")
+    monkeypatch.setattr(app, "serve_from_config", lambda config: server)
+
+    with pytest.raises(AssertionError):
+        app.extract(replace(settings, extractor_class="MissingExtractorService"))
+
+    with pytest.raises(OSError):
+        urlopen(f"http://127.0.0.1:{server.server_address[1]}/metrics", timeout=1)
@@ -0,0 +1,222 @@
+from concurrent import futures
+from dataclasses import replace
+import os
+import subprocess
+
+import pytest
+
+from red_hat import services
+from red_hat.client import GithubClient
+from red_hat.mirror import GitMirrorClient, MirrorMissError, client_factory
+from red_hat.parsers import DockerfileParser
+from red_hat.results import ExtractionResult
+
+
+def git(cwd, *args) -> str:
+    return subprocess.run(
+        ["git", "-c", "user.name=test", "-c", "user.email=test@example.com", *args],
+        cwd=cwd, check=True, capture_output=True, text=True
+    ).stdout.strip()
+
+
+def commit(work_dir, files, removed=(), renamed=()) -> str:
+    for old, new in renamed:
+        os.makedirs(os.path.dirname(os.path.join(work_dir, new)) or work_dir, exist_ok=True)
+        git(work_dir, "mv", old, new)
+
+    for path in removed:
+        git(work_dir, "rm", "-q", path)
+
+    for path, content in files.items():
+        full_path = os.path.join(work_dir, path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, "w") as f:
+            f.write(content)
+        git(work_dir, "add", path)
+
+    git(work_dir, "commit", "-q", "-m", "commit")
+    return git(work_dir, "rev-parse", "HEAD")
+
+
+@pytest.fixture
+def mirror(tmp_path):
+    """A bare mirror of `dummy/code` at `tmp_path/dummy/code.git`, along with its commits"""
+    work_dir = tmp_path / "work"
+    work_dir.mkdir()
+    git(work_dir, "init", "-q")
+
+    first = commit(work_dir, {
+        "Dockerfile": "FROM python:3.9-slim\n",
+        "moved/Dockerfile": "FROM scratch\n",
+        "removed/Dockerfile": "FROM alpine:latest\n",
+        "vendor/Dockerfile": "FROM centos:7\n",
+        "src/main.py": "print()\n",
+    })
+    second = commit(
+        work_dir,
+        {"Dockerfile": "FROM python:3.11-slim AS build\nFROM scratch\n", "added/Dockerfile": "FROM busybox\n"},
+        removed=["removed/Dockerfile"],
+        renamed=[("moved/Dockerfile", "renamed/Dockerfile")],
+    )
+
+    (tmp_path / "dummy").mkdir()
+    git(tmp_path, "clone", "-q", "--bare", str(work_dir), str(tmp_path / "dummy" / "code.git"))
+
+    return tmp_path, first, second
+
+
+@pytest.fixture
+def mirror_settings(settings, mirror):
+    root, _, _ = mirror
+    return replace(
+        settings,
+        github_client_class="GitMirrorClient",
+        git_mirror_path=str(root / "{owner}" / "{name}.git"),
+        git_mirror_fallback=False,
+        tree_walk_exclude=["vendor/**"],
+    )
+
+
+class FallbackClient:
+    def __init__(self):
+        self.calls = []
+
+    def list_repository_files(self, owner, repository_name, sha, recursive=True):
+        self.calls.append(("tree", owner, repository_name))
+        return ["Dockerfile"]
+
+    def get_dockerfile(self, owner, repository_name, sha, path, parser):
+        self.calls.append(("raw", owner, repository_name, path))
+        return [("fallback:latest",)]
+
+
+class TestGitMirrorClient:
+    def test_files_are_listed_with_their_blob_sha(self, mirror, mirror_settings):
+        root, first, _ = mirror
+
+        with GitMirrorClient(mirror_settings) as client:
+            files = client.list_repository_files("dummy", "code", first)
+
+        assert sorted(files) == ["Dockerfile", "moved/Dockerfile", "removed/Dockerfile", "src/main.py"]
+        blob_sha = git(root / "dummy" / "code.git", "rev-parse", f"{first}:src/main.py")
+        assert [f.sha for f in files if f == "src/main.py"] == [blob_sha]
+
+    def test_dockerfiles_are_read_and_parsed(self, mirror, mirror_settings):
+        _, first, second = mirror
+
+        with GitMirrorClient(mirror_settings) as client:
+            first_images = client.get_dockerfile("dummy", "code", first, "/Dockerfile", DockerfileParser())
+            second_images = client.get_dockerfile("dummy", "code", second, "Dockerfile", DockerfileParser())
+
+        assert [i.image for i in first_images] == ["python:3.9-slim"]
+        assert [(i.image, i.alias) for i in second_images] == [("python:3.11-slim", "build"), ("scratch", None)]
+
+    def test_missing_objects_raise_without_fallback(self, mirror, mirror_settings):
+        _, first, _ = mirror
+
+        with GitMirrorClient(mirror_settings) as client:
+            with pytest.raises(MirrorMissError):
+                client.list_repository_files("dummy", "other", first)
+            with pytest.raises(MirrorMissError):
+                client.list_repository_files("dummy", "code", "0" * 40)
+            with pytest.raises(MirrorMissError):
+                client.get_dockerfile("dummy", "code", first, "added/Dockerfile", DockerfileParser())
+
+    def test_missing_objects_are_read_through_the_fallback(self, mirror, mirror_settings):
+        _, first, _ = mirror
+        fallback = FallbackClient()
+
+        with GitMirrorClient(mirror_settings, fallback=fallback) as client:
+            assert client.list_repository_files("dummy", "other", first) == ["Dockerfile"]
+            assert client.get_dockerfile("dummy", "code", first, "added/Dockerfile", None) == [("fallback:latest",)]
+            r = client.get_dockerfile("dummy", "code", first, "Dockerfile", DockerfileParser())
+            assert [i.image for i in r] == ["python:3.9-slim"]
+
+        assert fallback.calls == [("tree", "dummy", "other"), ("raw", "dummy", "code", "added/Dockerfile")]
+
+    def test_missing_git_falls_back(self, mirror, mirror_settings, monkeypatch):
+        _, first, _ = mirror
+        fallback = FallbackClient()
+        monkeypatch.setenv("PATH", "")
+
+        with GitMirrorClient(mirror_settings, fallback=fallback) as client:
+            assert client.list_repository_files("dummy", "code", first) == ["Dockerfile"]
+            assert client.get_dockerfile("dummy", "code", first, "Dockerfile", None) == [("fallback:latest",)]
+
+        assert fallback.calls == [("tree", "dummy", "code"), ("raw", "dummy", "code", "Dockerfile")]
+
+    def test_cat_file_processes_are_bounded(self, mirror, mirror_settings):
+        root, first, _ = mirror
+        git(root, "clone", "-q", "--bare", str(root / "dummy" / "code.git"), str(root / "dummy" / "copy.git"))
+
+        with GitMirrorClient(replace(mirror_settings, git_mirror_processes=1)) as client:
+            for name in ("code", "copy", "code"):
+                client.get_dockerfile("dummy", name, first, "Dockerfile", DockerfileParser())
+
+            assert list(client._cat_files) == [str(root / "dummy" / "code.git")]
+
+    def test_processes_evicted_while_in_use_are_closed_once_idle(self, mirror, mirror_settings):
+        root, first, _ = mirror
+        names = ["code", "copy-1", "copy-2", "copy-3"]
+        for name in names[1:]:
+            git(root, "clone", "-q", "--bare", str(root / "dummy" / "code.git"), str(root / "dummy" / f"{name}.git"))
+
+        def read(client, index):
+            name = names[index % len(names)]
+            return [i.image for i in client.get_dockerfile("dummy", name, first, "Dockerfile", DockerfileParser())]
+
+        with GitMirrorClient(replace(mirror_settings, git_mirror_processes=1)) as client:
+            with futures.ThreadPoolExecutor(4) as executor:
+                r = list(executor.map(lambda index: read(client, index), range(200)))
+
+        assert r == [["python:3.9-slim"]] * 200
+
+    def test_commits_are_compared_like_github_does(self, mirror, mirror_settings):
+        _, first, second = mirror
+
+        with GitMirrorClient(mirror_settings) as client:
+            comparison = client.compare_commits("dummy", "code", first, second)
+            assert client.compare_commits("dummy", "code", second, first)["status"] == "diverged"
+            assert client.compare_commits("dummy", "code", second, second) == {"status": "identical", "files": []}
+
+        assert comparison["status"] == "ahead"
+        assert sorted((f["status"], f["filename"]) for f in comparison["files"]) == [
+            ("added", "added/Dockerfile"),
+            ("modified", "Dockerfile"),
+            ("removed", "removed/Dockerfile"),
+            ("renamed", "renamed/Dockerfile"),
+        ]
+        renamed = next(f for f in comparison["files"] if f["status"] == "renamed")
+        assert (renamed["previous_filename"], renamed["changes"]) == ("moved/Dockerfile", 0)
+
+    def test_factory_returns_the_configured_client(self, settings, mirror_settings):
+        assert type(client_factory(settings)) is GithubClient
+
+        client = client_factory(replace(mirror_settings, git_mirror_fallback=True))
+        assert isinstance(client, GitMirrorClient)
+        assert isinstance(client.fallback, GithubClient)
+
+
+@pytest.mark.parametrize(
+    "service",
+    [services.SequentialExtractorService, services.ThreadedExtractorService, services.AsyncExtractorService]
+)
+def test_services_extract_from_mirrors(service, mirror, mirror_settings):
+    _, first, second = mirror
+    repo = "https://github.com/dummy/code.git"
+    previous = {repo: ExtractionResult(repo, first, {
+        "Dockerfile": ["python:3.9-slim"],
+        "moved/Dockerfile": ["scratch"],
+        "removed/Dockerfile": ["alpine:latest"],
+    }, {})}
+
+    with GitMirrorClient(mirror_settings) as client:
+        full = service.extract_images_from([(repo, first)], mirror_settings, client)
+        rescanned = service.extract_images_from([(repo, second)], mirror_settings, client, previous)
+
+    assert full == {"data": {f"{repo}:{first}": previous[repo].data}, "errors": {}}
+    assert rescanned == {"data": {f"{repo}:{second}": {
+        "Dockerfile": ["python:3.11-slim", "scratch"],
+        "renamed/Dockerfile": ["scratch"],
+        "added/Dockerfile": ["busybox"],
+    }}, "errors": {}}
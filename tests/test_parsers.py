@@ -1,6 +1,6 @@
 import pytest
 
-from red_hat.parsers import DockerfileParser, RepositoryListParser
+from red_hat.parsers import DockerfileParser, FromInstruction, RepositoryListParser
 
 
 @pytest.fixture
@@ -22,16 +22,77 @@ class TestRepositoryListParser:
             assert repo_url == expected_repo_url
             assert sha == expected_sha
 
+    def test_lines_are_parsed_lazily_and_deduplicated(self, repository_list: str):
+        parser = RepositoryListParser()
+        lines = repository_list.splitlines()
+        first_line = lines[0].split()
+
+        r = parser.parse_lines(iter(lines + lines[:2]))
+
+        assert list(next(r)) == first_line
+        assert len(list(r)) == 2
+
 
 class TestDockerfileParser:
-    def test_only_4_different_statements_declared(self, dockerfile_parser: DockerfileParser, dockerfile: str):
+    def test_references_to_stages_are_dropped(self, dockerfile_parser: DockerfileParser, dockerfile: str):
         r = dockerfile_parser.parse(dockerfile)
 
-        assert len(r) == 2
+        assert len(r) == 1
 
-    def test_only_two_from_statements_declared(self, dockerfile_parser: DockerfileParser, dockerfile: str):
+    def test_only_one_image_declared(self, dockerfile_parser: DockerfileParser, dockerfile: str):
         r = dockerfile_parser.parse(dockerfile)
 
-        assert len(r) == 2
-        assert r[0] == ("docker/image:latest", "as", "base")
-        assert r[1] == ("base",)
+        assert r[0] == FromInstruction("docker/image:latest", "base", 1)
+        assert r[0].image == "docker/image:latest"
+
+    def test_continuations_comments_and_flags(self, dockerfile_parser: DockerfileParser):
+        r = dockerfile_parser.parse(
+            "# syntax=docker/dockerfile:1\n"
+            "FROM --platform=$BUILDPLATFORM \\\n"
+            "    # a comment within the instruction\n"
+            "    golang:1.17 \\\n"
+            "    AS build\n"
+            "RUN go build \\\n"
+            "    FROM nothing\n"
+            "# FROM commented:out\n"
+            "\tfrom\tbuild\n"
+            "FROM build AS test\n"
+            "FROM gcr.io/distroless/base\n"
+        )
+
+        assert r == [
+            FromInstruction("golang:1.17", "build", 2),
+            FromInstruction("gcr.io/distroless/base", None, 11),
+        ]
+
+    def test_global_args_are_expanded(self, dockerfile_parser: DockerfileParser):
+        r = dockerfile_parser.parse(
+            "ARG REGISTRY=quay.io\n"
+            "ARG VERSION=\"3.9\" VARIANT\n"
+            "ARG IMAGE=${REGISTRY}/python\n"
+            "FROM $IMAGE:${VERSION}-${VARIANT:-slim}\n"
+            "ARG VERSION=4.0\n"
+            "FROM ${REGISTRY}/alpine:${VERSION}${VARIANT:+-custom}\n"
+            "FROM ${UNDECLARED}alpine:latest\n"
+        )
+
+        assert [record.image for record in r] == [
+            "quay.io/python:3.9-slim",
+            "quay.io/alpine:3.9",
+            "alpine:latest",
+        ]
+
+    def test_escape_directive(self, dockerfile_parser: DockerfileParser):
+        r = dockerfile_parser.parse(
+            "# escape=`\n"
+            "\n"
+            "FROM mcr.microsoft.com/windows/servercore `\n"
+            "    AS base\n"
+        )
+
+        assert r == [FromInstruction("mcr.microsoft.com/windows/servercore", "base", 3)]
+
+    def test_streamed_lines(self, dockerfile_parser: DockerfileParser, dockerfile: str):
+        r = dockerfile_parser.iter_parse(iter(dockerfile.splitlines()))
+
+        assert next(r).image == "docker/image:latest"
@@ -0,0 +1,91 @@
+import pytest
+
+from red_hat.scheduler import DEFAULT_RETRY_AFTER, RateLimitScheduler
+
+
+API_URL = "https://api.github.com/repos/owner/repo/git/trees/sha"
+RAW_URL = "https://raw.githubusercontent.com/owner/repo/sha/Dockerfile"
+GRAPHQL_URL = "https://api.github.com/graphql"
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def scheduler(clock):
+    return RateLimitScheduler(burst=2, clock=clock, sleep=clock.sleep)
+
+
+def rate_limit_headers(remaining, reset):
+    return {"X-RateLimit-Remaining": str(remaining), "X-RateLimit-Reset": str(reset)}
+
+
+class TestRateLimitScheduler:
+    def test_unknown_budget_does_not_wait(self, scheduler):
+        assert [scheduler.reserve(API_URL) for _ in range(10)] == [0] * 10
+
+    def test_bursts_then_spreads_the_remaining_budget(self, scheduler, clock):
+        # 10 requests left over the next 100 seconds: one every 10 seconds after the burst
+        scheduler.update(API_URL, 200, rate_limit_headers(10, clock.now + 100))
+
+        delays = [scheduler.reserve(API_URL) for _ in range(4)]
+
+        assert delays == [0, 0, pytest.approx(10), pytest.approx(20)]
+
+    def test_budgets_are_per_host(self, scheduler, clock):
+        scheduler.update(API_URL, 200, rate_limit_headers(0, clock.now + 100))
+
+        assert scheduler.reserve(RAW_URL) == 0
+        assert scheduler.reserve(API_URL) == pytest.approx(100)
+
+    def test_graphql_and_rest_budgets_are_apart(self, scheduler, clock):
+        headers = {**rate_limit_headers(0, clock.now + 100), "X-RateLimit-Resource": "graphql"}
+
+        assert scheduler.update(GRAPHQL_URL, 403, headers) == pytest.approx(100)
+        assert scheduler.reserve(API_URL) == 0
+        assert scheduler.reserve(GRAPHQL_URL) == pytest.approx(100)
+
+        scheduler.update(API_URL, 200, {**rate_limit_headers(10, clock.now + 100), "X-RateLimit-Resource": "core"})
+        assert scheduler.reserve(GRAPHQL_URL) == pytest.approx(100)
+
+    def test_secondary_rate_limits_hold_back_every_resource(self, scheduler):
+        scheduler.reserve(GRAPHQL_URL)
+
+        assert scheduler.update(API_URL, 403, {"Retry-After": "7"}) == 7
+        assert scheduler.reserve(GRAPHQL_URL) == pytest.approx(7)
+        assert scheduler.reserve(RAW_URL) == 0
+
+    def test_exhausted_budget_waits_for_reset(self, scheduler, clock):
+        delay = scheduler.update(API_URL, 403, rate_limit_headers(0, clock.now + 30))
+
+        assert delay == pytest.approx(30)
+
+        scheduler.acquire(API_URL)
+        assert clock.now == pytest.approx(1030)
+
+        # The window is over, so requests flow freely again
+        assert scheduler.reserve(API_URL) == 0
+
+    def test_retry_after(self, scheduler):
+        assert scheduler.update(API_URL, 403, {"Retry-After": "7"}) == 7
+        assert scheduler.reserve(API_URL) == pytest.approx(7)
+
+    def test_too_many_requests_without_retry_after(self, scheduler):
+        assert scheduler.update(API_URL, 429, {}) == DEFAULT_RETRY_AFTER
+
+    def test_forbidden_is_not_rate_limited(self, scheduler):
+        assert scheduler.update(API_URL, 403, {}) is None
+        assert scheduler.reserve(API_URL) == 0
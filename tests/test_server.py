@@ -0,0 +1,122 @@
+import json
+
+import pytest
+import requests
+
+from benchmarks.github_stand_in import GithubStandIn, Profile, repository_list
+from config import Config
+from red_hat.server import ScanServer, _is_under
+
+
+@pytest.fixture
+def stand_in():
+    with GithubStandIn(Profile(tree_size=10, dockerfiles=2)) as stand_in:
+        yield stand_in
+
+
+@pytest.fixture
+def server(stand_in):
+    config = Config(
+        repository_list_url=None,
+        extractor_class="ThreadedExtractorService",
+        thread_pool_size=4,
+        github_api_url=stand_in.api_url,
+        github_raw_url=stand_in.raw_url,
+        server_port=0,
+        server_list_urls=[f"{stand_in.api_url}/"],
+    )
+
+    with ScanServer(config) as server:
+        server.start()
+        yield server
+
+
+def scan(server, session=requests, **kwargs):
+    with session.post(f"{server.url}/scan", stream=True, **kwargs) as r:
+        r.raise_for_status()
+        return sorted((json.loads(line) for line in r.iter_lines() if line), key=lambda result: result["repo"])
+
+
+def test_inline_lists_are_scanned(server, stand_in):
+    results = scan(server, data=repository_list(3))
+
+    assert len(results) == 3
+    assert all(len(result["data"]) == 2 and not result["errors"] for result in results)
+    assert stand_in.requests == {"tree": 3, "raw": 6}
+
+
+def test_list_urls_are_scanned(server, stand_in):
+    results = scan(server, params={"url": f"{stand_in.api_url}/list?size=5"})
+
+    assert len(results) == 5
+    assert stand_in.requests == {"list": 1, "tree": 5, "raw": 10}
+
+
+def test_caches_stay_warm_between_scans(server, stand_in):
+    with requests.Session() as session:
+        first = scan(server, session, data=repository_list(3))
+        second = scan(server, session, data=repository_list(3))
+
+    assert first == second
+    # Trees are still memoized by the single flight and Dockerfiles in the blob cache
+    assert stand_in.requests == {"tree": 3, "raw": 6}
+
+
+def test_async_scans_share_an_open_client(stand_in):
+    pytest.importorskip("aiohttp")
+    config = Config(
+        repository_list_url=None,
+        extractor_class="AsyncExtractorService",
+        github_api_url=stand_in.api_url,
+        github_raw_url=stand_in.raw_url,
+        server_port=0,
+    )
+
+    with ScanServer(config) as server:
+        server.start()
+        session = server.async_client._client
+
+        with requests.Session() as http:
+            first = scan(server, http, data=repository_list(3))
+            second = scan(server, http, data=repository_list(3))
+
+        assert server.async_client._client is session
+        assert not session.closed
+
+    assert session.closed
+    assert len(first) == len(second) == 3
+    assert all(len(result["data"]) == 2 and not result["errors"] for result in first + second)
+
+
+def test_bad_requests(server, stand_in):
+    assert requests.get(f"{server.url}/health").text == "ok\n"
+    assert requests.post(f"{server.url}/scan").status_code == 400
+    assert requests.post(f"{server.url}/scan", params={"url": f"{stand_in.api_url}/missing"}).status_code == 502
+    assert requests.post(f"{server.url}/other", data="x").status_code == 404
+
+
+@pytest.mark.parametrize("url", ["http://127.0.0.1:1/list", "{api_url}@127.0.0.1:1/list", "/list"])
+def test_list_urls_must_be_allowed(server, stand_in, url):
+    r = requests.post(f"{server.url}/scan", params={"url": url.format(api_url=stand_in.api_url)})
+
+    assert r.status_code == 400
+    assert stand_in.requests == {}
+
+
+@pytest.mark.parametrize(
+    "url, allowed",
+    [
+        ("https://host/lists", True),
+        ("https://host/lists/team.txt", True),
+        ("https://HOST/lists/./team.txt", True),
+        ("https://host/lists-evil/team.txt", False),
+        ("https://host/lists/../secret", False),
+        ("https://host/lists/%2e%2e/secret", False),
+        ("https://host/lists/../lists/team.txt", True),
+        ("http://host/lists/team.txt", False),
+        ("https://other/lists/team.txt", False),
+    ]
+)
+def test_list_urls_under_a_prefix(url, allowed):
+    assert _is_under(url, "https://host/lists") is allowed
+    assert _is_under(url, "https://host/lists/") is allowed
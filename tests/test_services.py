@@ -1,8 +1,13 @@
+from dataclasses import replace
+import threading
+import time
 import typing as T
 
 import pytest
 
 from red_hat import services
+from red_hat.cache import BlobCache, TreeCache
+from red_hat.client import TreeEntry
 
 
 class DummyClient:
@@ -243,6 +248,8 @@ class TestThreadedExtractor:
 
     def test_error_request_for_dockerfiles(self, dummy_repo, settings, fail_extractor_client):
         url, sha = dummy_repo[0]
+        # A single worker keeps the canned responses in the order the Dockerfiles are listed
+        settings = replace(settings, thread_pool_size=1)
 
         r = services.ThreadedExtractorService.extract_images_from(dummy_repo, settings, fail_extractor_client)
 
@@ -288,3 +295,397 @@ class TestThreadedExtractor:
         err = errors[ref]
 
         assert err == 'Dummy exception'
+
+    def test_single_worker_does_not_deadlock(self, settings):
+        repos = [(f"https://github.com/dummy/code-{i}.git", "sha") for i in range(20)]
+
+        config = replace(settings, thread_pool_size=1)
+        r = list(services.ThreadedExtractorService.iter_images_from(repos, config, DummyClient()))
+
+        assert len(r) == 20
+        assert all(len(result.data) == 5 for result in r)
+
+    def test_dockerfiles_of_a_repository_are_fetched_concurrently(self, dummy_repo, settings):
+        # Each of the 5 Dockerfiles waits for the others to be fetched at the same time
+        barrier = threading.Barrier(5, timeout=5)
+
+        class ConcurrentClient(DummyClient):
+            def get_dockerfile(self, *args, **kwargs):
+                barrier.wait()
+                return super().get_dockerfile(*args, **kwargs)
+
+        r = services.ThreadedExtractorService.extract_images_from(
+            dummy_repo, replace(settings, thread_pool_size=5), ConcurrentClient()
+        )
+
+        assert r["errors"] == {}
+        assert len(r["data"]["https://github.com/dummy/code.git:sha"]) == 5
+
+    def test_dockerfiles_are_fetched_while_the_tree_is_read(self, dummy_repo, settings):
+        fetched = threading.Event()
+        listed_after_fetch = []
+
+        class StreamingClient(DummyClient):
+            def iter_repository_files(self, owner, repo_name, sha, keep):
+                yield "Dockerfile"
+                listed_after_fetch.append(fetched.wait(5))
+                yield "app/Dockerfile"
+
+            def get_dockerfile(self, *args, **kwargs):
+                fetched.set()
+                return super().get_dockerfile(*args, **kwargs)
+
+        r = services.ThreadedExtractorService.extract_images_from(
+            dummy_repo, replace(settings, thread_pool_size=2), StreamingClient()
+        )
+
+        assert listed_after_fetch == [True]
+        assert sorted(r["data"]["https://github.com/dummy/code.git:sha"]) == ["Dockerfile", "app/Dockerfile"]
+
+    def test_tree_failing_midway_fails_the_repository(self, dummy_repo, settings):
+        class BrokenStreamClient(DummyClient):
+            def iter_repository_files(self, owner, repo_name, sha, keep):
+                yield "Dockerfile"
+                raise Exception("Dummy exception")
+
+        r = list(services.ThreadedExtractorService.iter_images_from(dummy_repo, settings, BrokenStreamClient()))
+
+        assert len(r) == 1
+        assert r[0].data is None
+        assert r[0].errors == "Dummy exception"
+
+    def test_list_is_read_as_the_pipeline_drains(self, settings):
+        read = []
+        searching = threading.Event()
+        release = threading.Event()
+
+        class BlockingClient(DummyClient):
+            def list_repository_files(self, *args, **kwargs):
+                searching.set()
+                release.wait(5)
+                return super().list_repository_files(*args, **kwargs)
+
+        def repos():
+            for i in range(100):
+                read.append(i)
+                yield f"https://github.com/dummy/code-{i}.git", "sha"
+
+        results = services.ThreadedExtractorService.iter_images_from(
+            repos(), replace(settings, thread_pool_size=1), BlockingClient()
+        )
+        consumer = threading.Thread(target=lambda: next(results))
+        consumer.start()
+
+        searching.wait(5)
+        time.sleep(0.05)
+        assert len(read) == services.ThreadedExtractorService.PIPELINE_DEPTH + 1
+
+        release.set()
+        consumer.join()
+        assert len(list(results)) == 99
+
+
+class AsyncDummyClient:
+    def __init__(self, client: DummyClient):
+        self._client = client
+
+    async def list_repository_files(self, *args, **kwargs):
+        return self._client.list_repository_files(*args, **kwargs)
+
+    async def get_dockerfile(self, *args, **kwargs):
+        return self._client.get_dockerfile(*args, **kwargs)
+
+    async def compare_commits(self, *args, **kwargs):
+        return self._client.compare_commits(*args, **kwargs)
+
+
+class TestAsyncExtractor:
+    def test_happy_path(self, dummy_repo, settings, extractor_client):
+        url, sha = dummy_repo[0]
+
+        r = services.AsyncExtractorService.extract_images_from(dummy_repo, settings, AsyncDummyClient(extractor_client))
+
+        assert "errors" in r
+        assert r["errors"] == {}
+
+        assert "data" in r
+        data = r["data"]
+
+        ref = f"{url}:{sha}"
+        assert ref in data
+        files = data[ref]
+
+        assert len(files) == 1
+        assert "some/deep/dockerfiles/directory/Dockerfile" in files
+        images = files["some/deep/dockerfiles/directory/Dockerfile"]
+
+        assert len(images) == 2
+        assert "python:3.9-slim" in images
+        assert "alpine:latest" in images
+
+    def test_error_request_for_dockerfiles(self, dummy_repo, settings, fail_extractor_client):
+        url, sha = dummy_repo[0]
+
+        client = AsyncDummyClient(fail_extractor_client)
+        r = services.AsyncExtractorService.extract_images_from(dummy_repo, settings, client)
+
+        ref = f"{url}:{sha}"
+
+        errors = r["errors"]
+        assert ref in errors
+        files = errors[ref]
+
+        assert len(files) == 1
+        assert files["dockerfiles/Dockerfile.Failure"] == "Dummy exception"
+
+        data = r["data"]
+        assert ref in data
+        files = data[ref]
+
+        assert len(files) == 1
+        assert files["some/deep/dockerfiles/directory/Dockerfile"] == ["python:3.9-slim"]
+
+    def test_error_request_for_repository_tree(self, dummy_repo, settings, fail_extractor_client):
+        fail_extractor_client._responses['list_repository_files'] = [failure_fn]
+        url, sha = dummy_repo[0]
+
+        client = AsyncDummyClient(fail_extractor_client)
+        r = services.AsyncExtractorService.extract_images_from(dummy_repo, settings, client)
+
+        ref = f"{url}:{sha}"
+
+        assert r["errors"][ref] == 'Dummy exception'
+
+    def test_factory_returns_async_service(self, settings):
+        settings = replace(settings, extractor_class="AsyncExtractorService")
+
+        assert services.extractor_factory(settings) is services.AsyncExtractorService
+
+
+class NotFound(Exception):
+    def __init__(self):
+        super().__init__("404 Client Error: Not Found")
+        self.status = 404
+
+
+def not_found_fn():
+    raise NotFound()
+
+
+class TestTreeCache:
+    def test_search_is_served_from_cache(self, tmp_path, client):
+        client.tree_cache = TreeCache(str(tmp_path / "trees.db"))
+        client._responses = {'list_repository_files': [[
+            TreeEntry("Dockerfile", "blob-sha"),
+            TreeEntry("setup.py", "other-sha"),
+        ]]}
+
+        first = services.search_for_dockerfile('dummy-owner', 'dummy-repo', 'sha', client)
+        second = services.search_for_dockerfile('dummy-owner', 'dummy-repo', 'sha', client)
+
+        assert first == second == ["Dockerfile"]
+        assert second[0].sha == "blob-sha"
+
+    def test_not_found_trees_are_cached(self, tmp_path, client):
+        client.tree_cache = TreeCache(str(tmp_path / "trees.db"))
+        client._responses = {'list_repository_files': [not_found_fn]}
+
+        for _ in range(2):
+            with pytest.raises(Exception) as e:
+                services.search_for_dockerfile('dummy-owner', 'dummy-repo', 'sha', client)
+
+            assert str(e.value) == "404 Client Error: Not Found"
+
+
+class TestBlobCache:
+    def test_identical_dockerfiles_are_fetched_once(self, fail_client):
+        fail_client.blob_cache = BlobCache()
+        paths = [TreeEntry("Dockerfile", "blob-sha"), TreeEntry("vendor/Dockerfile", "blob-sha")]
+
+        r, err = services.extract_from_paths('dummy-owner', 'dummy-repo', 'not-sha', paths, fail_client)
+
+        assert err == {}
+        assert r == {"Dockerfile": ["python:3.9-slim"], "vendor/Dockerfile": ["python:3.9-slim"]}
+
+    def test_paths_without_blob_sha_are_not_cached(self, fail_client):
+        fail_client.blob_cache = BlobCache()
+
+        paths = ['Dockerfile', 'Dockerfile']
+        r, err = services.extract_from_paths('dummy-owner', 'dummy-repo', 'not-sha', paths, fail_client)
+
+        assert len(fail_client.blob_cache) == 0
+        assert err == {'Dockerfile': 'Dummy exception'}
+
+
+class BatchDummyClient(DummyClient):
+    supports_batch = True
+
+    def __init__(self, responses: T.Dict[str, T.List] = None):
+        super().__init__(responses)
+        self.batches = []
+
+    def get_dockerfiles(self, refs, parser):
+        self.batches.append(refs)
+        return [
+            Exception("Dummy exception") if path.endswith("Failure") else self.get_dockerfile()
+            for _, _, _, path in refs
+        ]
+
+
+class TestBatchedExtraction:
+    def test_dockerfiles_are_fetched_in_one_batch(self):
+        client = BatchDummyClient()
+        paths = ['Dockerfile', 'dockerfiles/Dockerfile.Failure', 'other/Dockerfile']
+
+        r, err = services.extract_from_paths('dummy-owner', 'dummy-repo', 'not-sha', paths, client)
+
+        assert client.batches == [[('dummy-owner', 'dummy-repo', 'not-sha', path) for path in paths]]
+        assert r == {
+            'Dockerfile': ['python:3.9-slim', 'alpine:latest'],
+            'other/Dockerfile': ['python:3.9-slim', 'alpine:latest'],
+        }
+        assert err == {'dockerfiles/Dockerfile.Failure': 'Dummy exception'}
+
+    def test_cached_blobs_are_not_batched(self):
+        client = BatchDummyClient()
+        client.blob_cache = BlobCache()
+        client.blob_cache.put("DockerfileParser.2:blob-sha", [("scratch",)])
+
+        r, _ = services.extract_from_paths(
+            'dummy-owner', 'dummy-repo', 'not-sha', [TreeEntry('Dockerfile', 'blob-sha')], client
+        )
+
+        assert client.batches == []
+        assert r == {'Dockerfile': ['scratch']}
+
+
+def test_async_extractor_consumes_lazy_iterables(dummy_repo, settings, extractor_client):
+    client = AsyncDummyClient(extractor_client)
+    r = services.AsyncExtractorService.extract_images_from(iter(dummy_repo), settings, client)
+
+    assert list(r["data"]) == ["https://github.com/dummy/code.git:sha"]
+
+
+@pytest.mark.parametrize(
+    "service",
+    [services.SequentialExtractorService, services.ThreadedExtractorService, services.AsyncExtractorService]
+)
+def test_results_are_yielded_per_repository(service, settings):
+    repos = [(f"https://github.com/dummy/code-{i}.git", "sha") for i in range(3)]
+    client = DummyClient()
+    if service is services.AsyncExtractorService:
+        client = AsyncDummyClient(client)
+
+    r = list(service.iter_images_from(repos, settings, client))
+
+    assert sorted(result.key for result in r) == [f"{repo}:{sha}" for repo, sha in repos]
+    assert all(len(result.data) == 5 for result in r)
+
+
+class CompareDummyClient(DummyClient):
+    def __init__(self, comparison, responses: T.Dict[str, T.List] = None):
+        super().__init__(responses)
+        self.comparison = comparison
+        self.compared = []
+        self.fetched = []
+
+    def compare_commits(self, owner, repo_name, base, head):
+        self.compared.append((owner, repo_name, base, head))
+        if isinstance(self.comparison, Exception):
+            raise self.comparison
+        return self.comparison
+
+    def list_repository_files(self, *args, **kwargs):
+        self.fetched.append("tree")
+        return super().list_repository_files(*args, **kwargs)
+
+    def get_dockerfile(self, owner, repo_name, sha, path, parser):
+        self.fetched.append(path)
+        return super().get_dockerfile()
+
+
+def comparison(*files, status="ahead"):
+    return {"status": status, "files": [dict(zip(("status", "filename", "previous_filename"), f)) for f in files]}
+
+
+@pytest.fixture
+def previous():
+    repo = "https://github.com/dummy/code.git"
+    return {
+        repo: services.ExtractionResult(repo, "old-sha", {
+            "Dockerfile": ["python:3.9-slim"],
+            "removed/Dockerfile": ["alpine:latest"],
+            "moved/Dockerfile": ["scratch"],
+            "modified/Dockerfile": ["centos:7"],
+        }, {})
+    }
+
+
+class TestIncrementalRescan:
+    def test_only_changed_dockerfiles_are_fetched(self, settings, previous):
+        client = CompareDummyClient(comparison(
+            ("removed", "removed/Dockerfile"),
+            ("renamed", "renamed/Dockerfile", "moved/Dockerfile"),
+            ("modified", "modified/Dockerfile"),
+            ("added", "added/Dockerfile"),
+            ("modified", "README.md"),
+        ))
+
+        result = previous["https://github.com/dummy/code.git"]
+
+        r = services.rescan_repository(result.repo, "new-sha", result, settings, client)
+
+        assert client.compared == [("dummy", "code", "old-sha", "new-sha")]
+        assert sorted(client.fetched) == ["added/Dockerfile", "modified/Dockerfile"]
+        assert r == services.ExtractionResult("https://github.com/dummy/code.git", "new-sha", {
+            "Dockerfile": ["python:3.9-slim"],
+            "renamed/Dockerfile": ["scratch"],
+            "modified/Dockerfile": ["python:3.9-slim", "alpine:latest"],
+            "added/Dockerfile": ["python:3.9-slim", "alpine:latest"],
+        }, {})
+
+    def test_unchanged_repositories_are_carried_forward(self, settings, previous):
+        client = CompareDummyClient(comparison())
+        result = previous["https://github.com/dummy/code.git"]
+
+        r = services.rescan_repository(result.repo, "old-sha", result, settings, client)
+
+        assert r is result
+        assert client.compared == client.fetched == []
+
+    @pytest.mark.parametrize("changes", [
+        comparison(("modified", "Dockerfile"), status="diverged"),
+        comparison(*[("modified", f"{i}/Dockerfile") for i in range(services.COMPARE_MAX_FILES)]),
+        Exception("Dummy exception"),
+    ])
+    def test_repositories_are_scanned_in_full_when_changes_are_unknown(self, settings, previous, changes):
+        client = CompareDummyClient(changes)
+        result = previous["https://github.com/dummy/code.git"]
+
+        assert services.rescan_repository(result.repo, "new-sha", result, settings, client) is None
+
+    def test_failed_repositories_are_scanned_in_full(self, settings, previous):
+        client = CompareDummyClient(comparison())
+        result = previous["https://github.com/dummy/code.git"]._replace(errors={"Dockerfile": "Dummy exception"})
+
+        assert services.rescan_repository(result.repo, "old-sha", result, settings, client) is None
+        assert client.compared == []
+
+    @pytest.mark.parametrize(
+        "service",
+        [services.SequentialExtractorService, services.ThreadedExtractorService, services.AsyncExtractorService]
+    )
+    def test_services_rescan_with_previous_results(self, service, settings, previous):
+        repos = [("https://github.com/dummy/code.git", "new-sha"), ("https://github.com/dummy/other.git", "sha")]
+        client = CompareDummyClient(comparison(("removed", "removed/Dockerfile")))
+        if service is services.AsyncExtractorService:
+            client = AsyncDummyClient(client)
+
+        r = service.extract_images_from(repos, settings, client, previous)
+
+        assert r["data"]["https://github.com/dummy/code.git:new-sha"] == {
+            "Dockerfile": ["python:3.9-slim"],
+            "moved/Dockerfile": ["scratch"],
+            "modified/Dockerfile": ["centos:7"],
+        }
+        assert len(r["data"]["https://github.com/dummy/other.git:sha"]) == 5
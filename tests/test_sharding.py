@@ -0,0 +1,114 @@
+from dataclasses import replace
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+import yaml
+
+from red_hat.results import ExtractionResult
+from red_hat.sharding import merge_shards, select_shard, shard_of, shard_settings
+from red_hat.sinks import JsonLinesSink
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPOS = [(f"https://github.com/dummy/repo-{i}", f"{i:040x}") for i in range(40)]
+
+
+class TestShards:
+    def test_shard_is_stable(self):
+        assert [shard_of(repo, sha, 4) for repo, sha in REPOS] == [shard_of(repo, sha, 4) for repo, sha in REPOS]
+
+    def test_shards_partition_the_list(self):
+        shards = [list(select_shard(REPOS, index, 3)) for index in range(3)]
+
+        assert sorted(sum(shards, [])) == sorted(REPOS)
+        assert all(shards)
+
+
+class TestShardSettings:
+    def test_unsharded(self, settings):
+        r = shard_settings(replace(settings, shard_count=1))
+
+        assert (r.shard_index, r.shard_count) == (0, 1)
+
+    def test_index_from_indexed_job(self, settings, monkeypatch):
+        monkeypatch.setenv("JOB_COMPLETION_INDEX", "2")
+
+        r = shard_settings(replace(settings, shard_count=3, output_path="out/shard-{shard_index}.jsonl"))
+
+        assert r.shard_index == 2
+        assert r.output_path == "out/shard-2.jsonl"
+
+    def test_missing_index(self, settings, monkeypatch):
+        monkeypatch.delenv("JOB_COMPLETION_INDEX", raising=False)
+
+        with pytest.raises(ValueError):
+            shard_settings(replace(settings, shard_count=3))
+
+    @pytest.mark.parametrize("name", ["output_path", "journal_path"])
+    def test_shared_files(self, settings, name):
+        with pytest.raises(ValueError, match=name):
+            shard_settings(replace(settings, shard_count=3, shard_index=1, **{name: "out/results.jsonl"}))
+
+    def test_credentials_per_shard(self, settings):
+        r = shard_settings(replace(settings, shard_count=3, shard_index=1, shard_credentials="first:a, second:b"))
+
+        assert (r.github_access_id, r.github_access_secret) == ("second", "b")
+
+
+def test_merge_shards(tmp_path):
+    paths = []
+    for index, (repo, sha) in enumerate(REPOS[:2]):
+        paths.append(str(tmp_path / f"shard-{index}.jsonl"))
+        with JsonLinesSink(paths[-1], compress=bool(index)) as sink:
+            sink.write(ExtractionResult(repo, sha, {"Dockerfile": ["python:3.9-slim"]}, {}))
+
+    r = merge_shards(paths)
+
+    assert r == {
+        "data": {f"{repo}:{sha}": {"Dockerfile": ["python:3.9-slim"]} for repo, sha in REPOS[:2]},
+        "errors": {},
+    }
+
+
+def github(path):
+    if path.startswith("/list"):
+        return 200, {}, "".join(f"{repo} {sha}\n" for repo, sha in REPOS).encode()
+
+    if "/git/trees/" in path:
+        blob_sha = path.split("/git/trees/")[1].split("?")[0]
+        return 200, {}, json.dumps({"tree": [{"path": "Dockerfile", "type": "blob", "sha": blob_sha}]}).encode()
+
+    name = path.split("/")[3]
+    return 200, {}, f"FROM {name}:latest\n".encode()
+
+
+def test_sharded_processes_match_a_single_run(stub_server, tmp_path):
+    stub_server.routes["/"] = github
+    config = {
+        "repository_list_url": stub_server.url + "/list",
+        "github_api_url": stub_server.url,
+        "github_raw_url": stub_server.url + "/raw",
+        "extractor_class": "SequentialExtractorService",
+        "output_format": "jsonl",
+        "output_path": str(tmp_path / "shard-{shard_index}.jsonl"),
+        "shard_count": 3,
+    }
+    config_path = tmp_path / "config.yml"
+    config_path.write_text(yaml.dump(config))
+
+    env = {**os.environ, "DOCKERFILE_EXTRACTOR_CONFIG_PATH": str(config_path)}
+    processes = [
+        subprocess.Popen([sys.executable, "app.py"], cwd=ROOT, env={**env, "JOB_COMPLETION_INDEX": str(index)})
+        for index in range(3)
+    ]
+    assert [process.wait(timeout=60) for process in processes] == [0, 0, 0]
+
+    merged = merge_shards(str(tmp_path / f"shard-{index}.jsonl") for index in range(3))
+
+    assert merged["errors"] == {}
+    assert merged["data"] == {
+        f"{repo}:{sha}": {"Dockerfile": [f"{repo.split('/')[-1]}:latest"]} for repo, sha in REPOS
+    }
@@ -0,0 +1,134 @@
+from concurrent import futures
+import threading
+import time
+
+import pytest
+
+from red_hat.singleflight import Replay, SingleFlight
+
+
+class BlockingCall:
+    def __init__(self, error: Exception = None):
+        self.calls = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.error = error
+
+    def __call__(self):
+        self.calls += 1
+        self.started.set()
+        self.release.wait(5)
+        if self.error:
+            raise self.error
+        return self.calls
+
+
+def run_concurrently(single_flight, fn, count=5):
+    with futures.ThreadPoolExecutor(count) as executor:
+        first = executor.submit(single_flight.do, "key", fn)
+        fn.started.wait(5)
+        others = [executor.submit(single_flight.do, "key", fn) for _ in range(count - 1)]
+
+        while single_flight.shared < count - 1:
+            time.sleep(0.001)
+        fn.release.set()
+
+        return [first] + others
+
+
+class TestSingleFlight:
+    def test_concurrent_calls_share_the_result(self):
+        single_flight = SingleFlight()
+        fn = BlockingCall()
+
+        results = run_concurrently(single_flight, fn)
+
+        assert [future.result() for future in results] == [1] * 5
+        assert fn.calls == 1
+
+    def test_concurrent_calls_share_the_error(self):
+        single_flight = SingleFlight()
+        fn = BlockingCall(error=Exception("Dummy exception"))
+
+        results = run_concurrently(single_flight, fn)
+
+        for future in results:
+            with pytest.raises(Exception, match="Dummy exception"):
+                future.result()
+        assert fn.calls == 1
+
+    def test_results_are_remembered_for_a_while(self):
+        single_flight = SingleFlight(memo_ttl=60)
+        calls = []
+
+        for _ in range(3):
+            single_flight.do("key", lambda: calls.append(None))
+
+        assert len(calls) == 1
+
+    def test_results_are_forgotten_after_the_ttl(self):
+        single_flight = SingleFlight(memo_ttl=0)
+        calls = []
+
+        single_flight.do("key", lambda: calls.append(None))
+        time.sleep(0.01)
+        single_flight.do("key", lambda: calls.append(None))
+
+        assert len(calls) == 2
+
+    def test_different_keys_are_not_shared(self):
+        single_flight = SingleFlight(memo_ttl=60)
+
+        assert single_flight.do("first", lambda: 1) == 1
+        assert single_flight.do("second", lambda: 2) == 2
+
+    def test_number_of_entries_is_bounded(self):
+        single_flight = SingleFlight(memo_ttl=60, max_entries=2)
+
+        for key in range(5):
+            single_flight.do(key, lambda: key)
+
+        assert len(single_flight._calls) == 2
+
+
+class TestReplay:
+    def test_items_are_read_once_and_replayed(self):
+        reads = []
+        replay = Replay(reads.append(i) or i for i in range(3))
+
+        first, second = iter(replay), iter(replay)
+
+        assert next(first) == 0
+        assert next(second) == 0
+        assert list(first) == list(second) == [1, 2]
+        assert reads == [0, 1, 2]
+
+    def test_items_are_replayed_as_they_are_read(self):
+        read = threading.Event()
+
+        def items():
+            yield 1
+            read.wait(5)
+            yield 2
+
+        replay = Replay(items())
+        with futures.ThreadPoolExecutor(2) as executor:
+            first, second = iter(replay), iter(replay)
+            assert executor.submit(next, first).result(5) == 1
+            assert executor.submit(next, second).result(5) == 1
+
+            read.set()
+            assert list(first) == list(second) == [2]
+
+    def test_errors_are_raised_to_every_iteration(self):
+        def items():
+            yield 1
+            raise Exception("Dummy exception")
+
+        replay = Replay(items())
+
+        for _ in range(2):
+            iteration = iter(replay)
+            assert next(iteration) == 1
+            with pytest.raises(Exception, match="Dummy exception"):
+                next(iteration)
@@ -0,0 +1,98 @@
+from dataclasses import replace
+import gzip
+import json
+
+import pytest
+
+from red_hat.results import ExtractionResult, collect_results
+from red_hat.sinks import JsonLinesSink, previous_results, read_json_lines, sink_factory
+
+
+@pytest.fixture
+def results():
+    return [
+        ExtractionResult("https://github.com/dummy/code.git", "sha", {"Dockerfile": ["python:3.9-slim"]}, {}),
+        ExtractionResult("https://github.com/dummy/broken.git", "sha", None, "Dummy exception"),
+        ExtractionResult(
+            "https://github.com/dummy/partial.git", "sha",
+            {"Dockerfile": ["alpine:latest"]}, {"other/Dockerfile": "Dummy exception"}
+        ),
+    ]
+
+
+def test_collect_results(results):
+    r = collect_results(results)
+
+    assert r == {
+        "data": {
+            "https://github.com/dummy/code.git:sha": {"Dockerfile": ["python:3.9-slim"]},
+            "https://github.com/dummy/partial.git:sha": {"Dockerfile": ["alpine:latest"]},
+        },
+        "errors": {
+            "https://github.com/dummy/broken.git:sha": "Dummy exception",
+            "https://github.com/dummy/partial.git:sha": {"other/Dockerfile": "Dummy exception"},
+        },
+    }
+
+
+class TestJsonLinesSink:
+    def test_one_line_per_result(self, tmp_path, results):
+        path = str(tmp_path / "results.jsonl")
+
+        with JsonLinesSink(path) as sink:
+            for result in results:
+                sink.write(result)
+
+        with open(path) as f:
+            lines = [json.loads(line) for line in f]
+
+        assert lines == [result.to_dict() for result in results]
+
+    def test_gzip(self, tmp_path, results):
+        path = str(tmp_path / "results.jsonl.gz")
+
+        with JsonLinesSink(path, compress=True) as sink:
+            for result in results:
+                sink.write(result)
+
+        with gzip.open(path, "rt") as f:
+            assert len(f.readlines()) == 3
+
+        assert list(read_json_lines(path)) == results
+
+    def test_lines_are_flushed_as_they_are_written(self, tmp_path, results):
+        path = str(tmp_path / "results.jsonl")
+
+        with JsonLinesSink(path, flush_interval=0) as sink:
+            sink.write(results[0])
+
+            assert list(read_json_lines(path)) == results[:1]
+
+    def test_stdout(self, capfdbinary, results):
+        with JsonLinesSink() as sink:
+            sink.write(results[0])
+
+        assert json.loads(capfdbinary.readouterr().out) == results[0].to_dict()
+
+
+def test_previous_results_of_every_shard(tmp_path, results):
+    for index, shard in enumerate((results[:2], results[2:] + [results[0]._replace(sha="new-sha")])):
+        with JsonLinesSink(str(tmp_path / f"shard-{index}.jsonl")) as sink:
+            for result in shard:
+                sink.write(result)
+
+    r = previous_results(str(tmp_path / "shard-*.jsonl"))
+
+    assert sorted(r) == sorted(result.repo for result in results)
+    assert r["https://github.com/dummy/code.git"].sha == "new-sha"
+
+
+class TestSinkFactory:
+    def test_dict_output_has_no_sink(self, settings):
+        assert sink_factory(replace(settings, output_format="dict")) is None
+
+    def test_jsonl(self, settings, tmp_path):
+        sink = sink_factory(replace(settings, output_format="jsonl", output_path=str(tmp_path / "results.jsonl")))
+
+        assert isinstance(sink, JsonLinesSink)
+        sink.close()
@@ -0,0 +1,48 @@
+from red_hat.results import ExtractionResult, collect_results
+from red_hat.store import ResultStore, Usage
+
+
+SHA = "30af65af14a2dce962df923446afff24dd8f123e"
+OTHER_SHA = "C260DEAF135FC0EFAAB365EA234A5B86B3EAD404"
+
+
+def results():
+    return [
+        ExtractionResult("https://github.com/org/app", SHA, {
+            "Dockerfile": ["python:3.9-slim", "alpine:latest", "python:3.9-slim"],
+            "empty/Dockerfile": [],
+        }, {"broken/Dockerfile": "404 Client Error: Not Found"}),
+        ExtractionResult("https://github.com/org/other", OTHER_SHA, {"Dockerfile": ["python:3.9-slim"]}, {}),
+        ExtractionResult("https://github.com/org/failed", SHA, None, "404 Client Error: Not Found"),
+    ]
+
+
+class TestResultStore:
+    def test_round_trips_to_the_collected_dict(self):
+        store = ResultStore.from_results(results())
+
+        assert len(store) == 3
+        assert store.to_dict() == collect_results(results())
+
+    def test_finds_the_dockerfiles_using_an_image(self):
+        store = ResultStore.from_results(results())
+
+        assert store.repositories_using("python:3.9-slim") == [
+            Usage("https://github.com/org/app", SHA, "Dockerfile"),
+            Usage("https://github.com/org/other", OTHER_SHA, "Dockerfile"),
+        ]
+        assert store.repositories_using("alpine:latest") == [Usage("https://github.com/org/app", SHA, "Dockerfile")]
+        assert store.repositories_using("scratch") == []
+        assert store.images() == {"python:3.9-slim": 2, "alpine:latest": 1}
+
+    def test_adding_a_commit_again_replaces_its_result(self):
+        store = ResultStore.from_results(results())
+        store.add(ExtractionResult("https://github.com/org/app", "0" * 40, {"Dockerfile": ["scratch"]}, {}))
+        store.add(ExtractionResult("https://github.com/org/app", SHA, {"Dockerfile": ["alpine:latest"]}, {}))
+
+        assert len(store) == 4
+        assert store.repositories_using("python:3.9-slim") == [
+            Usage("https://github.com/org/other", OTHER_SHA, "Dockerfile")
+        ]
+        assert store.repositories_using("alpine:latest") == [Usage("https://github.com/org/app", SHA, "Dockerfile")]
+        assert store.repositories_using("scratch") == [Usage("https://github.com/org/app", "0" * 40, "Dockerfile")]
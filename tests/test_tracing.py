@@ -0,0 +1,105 @@
+import asyncio
+from dataclasses import replace
+import json
+import threading
+import time
+
+from red_hat import services, tracing
+from red_hat.tracing import profiling, span
+from tests.test_services import DummyClient
+
+
+def load_trace(path):
+    with open(path) as f:
+        events = json.load(f)["traceEvents"]
+
+    tracks = {event["tid"]: event["args"]["name"] for event in events if event["ph"] == "M"}
+    spans = [event for event in events if event["ph"] == "X"]
+    return tracks, spans
+
+
+def test_spans_are_not_recorded_without_profiling():
+    with span("request", "http") as args:
+        args["bytes"] = 10
+
+    assert tracing._tracer is None
+
+
+def test_spans_are_written_as_trace_events(tmp_path, settings):
+    path = str(tmp_path / "trace.json")
+
+    def parse():
+        with span("parse", "dockerfile"):
+            pass
+
+    with profiling(replace(settings, profile_path=path)):
+        with span("request", "http", url="https://github.com") as args:
+            args["bytes"] = 10
+
+        thread = threading.Thread(target=parse, name="worker")
+        thread.start()
+        thread.join()
+
+    tracks, spans = load_trace(path)
+
+    assert [(event["name"], event["cat"]) for event in spans] == [("request", "http"), ("parse", "dockerfile")]
+    assert spans[0]["args"] == {"url": "https://github.com", "bytes": 10}
+    assert spans[0]["ts"] + spans[0]["dur"] <= spans[1]["ts"]
+    assert tracks[spans[0]["tid"]] == threading.current_thread().name
+    assert tracks[spans[1]["tid"]] == "worker"
+    assert tracing._tracer is None
+
+
+def test_asyncio_tasks_get_their_own_track(tmp_path, settings):
+    path = str(tmp_path / "trace.json")
+
+    async def task():
+        with span("request", "http"):
+            await asyncio.sleep(0.01)
+
+    async def main():
+        await asyncio.gather(asyncio.create_task(task(), name="first"), asyncio.create_task(task(), name="second"))
+
+    with profiling(replace(settings, profile_path=path)):
+        asyncio.run(main())
+
+    tracks, spans = load_trace(path)
+
+    assert sorted(tracks[event["tid"]] for event in spans) == ["first", "second"]
+
+
+def test_repositories_are_traced(tmp_path, settings):
+    path = str(tmp_path / "trace.json")
+    repos = [("https://github.com/dummy/code.git", "sha")]
+
+    with profiling(replace(settings, profile_path=path)):
+        services.SequentialExtractorService.extract_images_from(repos, settings, DummyClient())
+
+    _, spans = load_trace(path)
+    repository, = [event for event in spans if event["cat"] == "repository"]
+    tree, = [event for event in spans if event["cat"] == "tree"]
+
+    assert repository["args"] == {"repo": "https://github.com/dummy/code.git", "sha": "sha"}
+    assert repository["ts"] <= tree["ts"] and tree["ts"] + tree["dur"] <= repository["ts"] + repository["dur"]
+
+
+def test_sampled_profile(tmp_path, settings):
+    path = str(tmp_path / "trace.json")
+    done = threading.Event()
+
+    def busy_wait():
+        while not done.is_set():
+            time.sleep(0.001)
+
+    worker = threading.Thread(target=busy_wait, name="worker")
+    with profiling(replace(settings, profile_path=path, profile_sampling_interval=0.001)):
+        worker.start()
+        time.sleep(0.05)
+        done.set()
+        worker.join()
+
+    with open(tmp_path / "trace.folded") as f:
+        stacks = [line.rsplit(" ", 1) for line in f]
+
+    assert any(stack.startswith("worker;") and "busy_wait (test_tracing.py:" in stack for stack, _ in stacks)
+    assert all(int(count) > 0 for _, count in stacks)
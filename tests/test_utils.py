@@ -1,6 +1,6 @@
 import pytest
 
-from red_hat.utils import extract_repository_from_url
+from red_hat.utils import extract_repository_from_url, split_image_reference
 
 
 @pytest.fixture
@@ -35,3 +35,17 @@ def test_extract_repository_info_from_correct_urls(url, expected_owner, expected
 def test_extract_repository_info_from_wrong_urls(url, exception):
     with pytest.raises(exception):
         extract_repository_from_url(url)
+
+
+@pytest.mark.parametrize(
+    "reference,expected",
+    [
+        ("python", ("python", None, None)),
+        ("python:3.9-slim", ("python", "3.9-slim", None)),
+        ("quay.io:443/org/image", ("quay.io:443/org/image", None, None)),
+        ("quay.io:443/org/image:v1@sha256:abc", ("quay.io:443/org/image", "v1", "sha256:abc")),
+        ("alpine@sha256:abc", ("alpine", None, "sha256:abc")),
+    ]
+)
+def test_split_image_reference(reference, expected):
+    assert split_image_reference(reference) == expected